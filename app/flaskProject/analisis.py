@@ -0,0 +1,270 @@
+"""
+Análisis de patrones de acceso sobre el histórico de eventos (NumPy).
+
+Carga `eventos` de la ventana de análisis (ANALISIS_VENTANA_DIAS, con el índice
+por canal y fecha) por bloques en arreglos columnares y calcula, sin bucles por fila:
+- perfil horario de cada persona (distribución de sus accesos autorizados por hora)
+- accesos autorizados en horarios inusuales para esa persona
+- ráfagas de lecturas denegadas por canal (rfid / serial / api)
+
+Los resultados reemplazan el contenido de la tabla `anomalias`.
+
+Uso:
+    python analisis.py [--desde 2026-01-01 | --ventana-dias 30]   (--ventana-dias 0: todo)
+"""
+import argparse
+import json
+import threading
+import time
+import logging
+import traceback
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+from database import Database, guardar_anomalias
+from logger_config import setup_logger
+
+logger = setup_logger("analisis", "analisis.log", level=logging.INFO)
+
+CANALES = ("rfid", "serial", "api")
+BLOQUE = 100_000
+
+# Horario inusual: probabilidad de esa hora en el perfil de la persona
+PROBABILIDAD_INUSUAL = 0.02
+MINIMO_EVENTOS_PERFIL = 20
+
+# Ráfaga: al menos RAFAGA_UMBRAL denegados del mismo canal dentro de RAFAGA_VENTANA_S
+RAFAGA_UMBRAL = 5
+RAFAGA_VENTANA_S = 60
+
+MAXIMO_INUSUALES = 500
+
+
+class EventosColumnares:
+    """Eventos como arreglos paralelos: persona (código), tiempo, hora, autorizado, canal."""
+
+    def __init__(self, identificaciones, persona, tiempo, autorizado, canal):
+        self.identificaciones = identificaciones
+        self.persona = persona
+        self.tiempo = tiempo
+        self.hora = ((tiempo // 3600) % 24).astype(np.int8)
+        self.autorizado = autorizado
+        self.canal = canal
+
+    def __len__(self):
+        return len(self.tiempo)
+
+
+def _a_fechas(fecha_hora):
+    """
+    'YYYY-MM-DD HH:MM:SS' → datetime64[s]. Si el bloque tiene alguna fecha
+    ilegible se convierte fila por fila y esas quedan en NaT.
+    """
+    try:
+        return np.array(fecha_hora, dtype="datetime64[s]")
+    except (ValueError, TypeError):
+        fechas = np.empty(len(fecha_hora), dtype="datetime64[s]")
+        for i, fecha in enumerate(fecha_hora):
+            try:
+                fechas[i] = np.datetime64(fecha, "s")
+            except (ValueError, TypeError):
+                fechas[i] = np.datetime64("NaT")
+        return fechas
+
+
+def inicio_ventana(ventana_dias=None):
+    """'YYYY-MM-DD HH:MM:SS' de hace ventana_dias (ANALISIS_VENTANA_DIAS por defecto); None si es 0."""
+    ventana_dias = config.ANALISIS_VENTANA_DIAS if ventana_dias is None else ventana_dias
+    if ventana_dias <= 0:
+        return None
+    return (datetime.now() - timedelta(days=ventana_dias)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def cargar_eventos(desde=None, db_name=None, bloque=BLOQUE):
+    """Lee eventos de los canales de acceso en bloques de `bloque` filas."""
+    db = Database(db_name)
+    conn = db.get_connection_lectura(reporte=True)
+
+    # El canal se codifica en SQL (índice en CANALES) para no recorrer filas en Python
+    sql = f'''
+        SELECT identificacion, fecha_hora,
+               CASE WHEN autorizado IN (1, '1', 'Si') THEN 1 ELSE 0 END,
+               CASE canal {" ".join(f"WHEN '{c}' THEN {i}" for i, c in enumerate(CANALES))} END
+        FROM eventos
+        WHERE canal IN ({", ".join("?" * len(CANALES))})
+    '''
+    params = list(CANALES)
+    if desde:
+        sql += ' AND fecha_hora >= ?'
+        params.append(desde)
+    sql += ' ORDER BY fecha_hora'
+
+    ids, tiempos, autorizados, canales = [], [], [], []
+    descartados = 0
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            filas = cursor.fetchmany(bloque)
+            if not filas:
+                break
+            identificacion, fecha_hora, autorizado, canal = zip(*filas)
+            fechas = _a_fechas(fecha_hora)
+            # Una fila con fecha ilegible se descarta, no el análisis entero
+            validas = ~np.isnat(fechas)
+            descartados += len(validas) - int(validas.sum())
+            ids.append(np.array(identificacion, dtype=np.str_)[validas])
+            tiempos.append(fechas[validas].astype(np.int64))
+            autorizados.append(np.array(autorizado, dtype=np.bool_)[validas])
+            canales.append(np.array(canal, dtype=np.int8)[validas])
+    finally:
+        conn.close()
+
+    if descartados:
+        logger.warning(f"Análisis: {descartados} eventos con fecha_hora ilegible descartados")
+
+    if not ids:
+        vacio = np.array([], dtype=np.int64)
+        return EventosColumnares(np.array([], dtype=np.str_), vacio, vacio, vacio.astype(np.bool_), vacio.astype(np.int8))
+
+    identificaciones, persona = np.unique(np.concatenate(ids), return_inverse=True)
+    return EventosColumnares(
+        identificaciones,
+        persona,
+        np.concatenate(tiempos),
+        np.concatenate(autorizados),
+        np.concatenate(canales),
+    )
+
+
+def perfiles_horarios(eventos):
+    """Matriz personas × 24 con la cantidad de accesos autorizados por hora."""
+    n = len(eventos.identificaciones)
+    ok = eventos.autorizado
+    indices = eventos.persona[ok].astype(np.int64) * 24 + eventos.hora[ok]
+    return np.bincount(indices, minlength=n * 24).reshape(n, 24)
+
+
+def accesos_inusuales(eventos, perfiles):
+    """Accesos autorizados en una hora poco habitual para esa persona."""
+    totales = perfiles.sum(axis=1)
+    probabilidades = perfiles / np.maximum(totales, 1)[:, None]
+
+    ok = np.flatnonzero(eventos.autorizado)
+    persona = eventos.persona[ok]
+    prob = probabilidades[persona, eventos.hora[ok]]
+    marcados = (prob < PROBABILIDAD_INUSUAL) & (totales[persona] >= MINIMO_EVENTOS_PERFIL)
+
+    indices = ok[marcados]
+    prob = prob[marcados]
+    # Los más raros primero
+    orden = np.argsort(prob, kind="stable")[:MAXIMO_INUSUALES]
+    return indices[orden], prob[orden]
+
+
+def rafagas_denegadas(eventos):
+    """Lista de (canal, inicio, fin, cantidad, indice_primero) por cada ráfaga de denegados."""
+    rafagas = []
+    for codigo, canal in enumerate(CANALES):
+        indices = np.flatnonzero(~eventos.autorizado & (eventos.canal == codigo))
+        if len(indices) < RAFAGA_UMBRAL:
+            continue
+        t = eventos.tiempo[indices]
+
+        # Denegados en la ventana que termina en cada evento
+        en_ventana = np.arange(len(t)) - np.searchsorted(t, t - RAFAGA_VENTANA_S, side="left") + 1
+        marcados = np.flatnonzero(en_ventana >= RAFAGA_UMBRAL)
+        if not len(marcados):
+            continue
+
+        # Agrupar marcados contiguos en el tiempo en una sola ráfaga
+        cortes = np.flatnonzero(np.diff(t[marcados]) > RAFAGA_VENTANA_S) + 1
+        for grupo in np.split(marcados, cortes):
+            primero = max(grupo[0] - RAFAGA_UMBRAL + 1, 0)
+            ultimo = grupo[-1]
+            rafagas.append((canal, int(t[primero]), int(t[ultimo]), int(ultimo - primero + 1), int(indices[primero])))
+    return rafagas
+
+
+def _fecha(segundos):
+    return str(np.datetime64(int(segundos), "s")).replace("T", " ")
+
+
+def analizar(desde=None, db_name=None, guardar=True, ventana_dias=None):
+    """desde: fecha mínima explícita; si no se da, la de la ventana de análisis."""
+    inicio = time.perf_counter()
+    if desde is None:
+        desde = inicio_ventana(ventana_dias)
+    eventos = cargar_eventos(desde, db_name)
+    carga = time.perf_counter() - inicio
+
+    perfiles = perfiles_horarios(eventos)
+    inusuales, probabilidades = accesos_inusuales(eventos, perfiles)
+    rafagas = rafagas_denegadas(eventos)
+
+    anomalias = []
+    for indice, prob in zip(inusuales.tolist(), probabilidades.tolist()):
+        persona = eventos.persona[indice]
+        habituales = np.argsort(perfiles[persona])[::-1][:3].tolist()
+        anomalias.append((
+            "horario_inusual",
+            str(eventos.identificaciones[persona]),
+            CANALES[eventos.canal[indice]],
+            _fecha(eventos.tiempo[indice]),
+            round(1.0 - prob, 4),
+            json.dumps({"hora": int(eventos.hora[indice]), "probabilidad": round(prob, 4), "horas_habituales": habituales}),
+        ))
+    for canal, desde_s, hasta_s, cantidad, indice in rafagas:
+        anomalias.append((
+            "rafaga_denegados",
+            str(eventos.identificaciones[eventos.persona[indice]]),
+            canal,
+            _fecha(desde_s),
+            float(cantidad),
+            json.dumps({"hasta": _fecha(hasta_s), "cantidad": cantidad, "ventana_s": RAFAGA_VENTANA_S}),
+        ))
+
+    if guardar:
+        guardar_anomalias(anomalias)
+
+    duracion = time.perf_counter() - inicio
+    logger.info(
+        f"Análisis desde {desde or 'el inicio'}: {len(eventos)} eventos, {len(eventos.identificaciones)} personas, "
+        f"{len(inusuales)} horarios inusuales, {len(rafagas)} ráfagas "
+        f"(carga {carga:.2f}s, total {duracion:.2f}s)"
+    )
+    return {
+        "eventos": len(eventos),
+        "personas": len(eventos.identificaciones),
+        "horarios_inusuales": len(inusuales),
+        "rafagas_denegados": len(rafagas),
+        "segundos_carga": carga,
+        "segundos_total": duracion,
+    }
+
+
+def iniciar_analisis_periodico():
+    if config.ANALISIS_INTERVALO_S <= 0:
+        return None
+
+    def _run():
+        while True:
+            try:
+                analizar()
+            except Exception as e:
+                logger.error(f"Error en análisis periódico: {e}")
+                logger.error(traceback.format_exc())
+            time.sleep(config.ANALISIS_INTERVALO_S)
+
+    thread = threading.Thread(target=_run, daemon=True, name="Analisis")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--desde", help="fecha mínima YYYY-MM-DD")
+    parser.add_argument("--ventana-dias", type=float, help="últimos N días (0: todo el histórico)")
+    args = parser.parse_args()
+    print(analizar(args.desde, ventana_dias=args.ventana_dias))
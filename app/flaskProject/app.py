@@ -1,20 +1,45 @@
+import base64
+import json
+import logging
 import traceback
+from datetime import datetime
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from database import *
+from database import (
+    agregar_evento,
+    agregar_eventos_lote,
+    obtener_funcionarios,
+    buscar_funcionarios,
+    contar_funcionarios,
+    obtener_funcionario_por_id,
+    modificar_funcionario,
+    obtener_eventos,
+    consultar_eventos_por_fecha,
+    obtener_estadisticas,
+    obtener_alarmas,
+    obtener_anomalias,
+    iniciar_snapshots_reportes,
+    obtener_serie,
+    obtener_heatmap,
+)
 from pic_communicator import (
-    iniciar_lector_pic,
     agregar_funcionario_con_sinc,
     eliminar_funcionario_con_sinc,
     dar_de_alta_funcionario_en_pic,
 )
 from time import sleep
-from rfid_reader import iniciar_lector_rfid
+from dispositivos import iniciar_dispositivos, estado_dispositivos
+from replicacion import iniciar_replicacion
+from ocupacion import obtener_ocupacion, registrar_acceso
+from reglas_alarma import evaluar_evento, obtener_motor_alarmas
+import config
 from logger_config import setup_logger
+from perfilado import instalar_perfilado
 
 logger = setup_logger("app", "app.log", level=logging.INFO)
 
 app = Flask(__name__)
 app.secret_key = "clave_secreta_para_mensajes_flash"
+instalar_perfilado(app)
 
 sistema_activo = True
 @app.route("/")
@@ -22,8 +47,9 @@ def index():
     try:
         logger.info("Acceso a / desde UI")
         estadisticas = obtener_estadisticas()
+        anomalias = obtener_anomalias(limite=10)
         return render_template(
-            "index.html", estadisticas=estadisticas, sistema_activo=sistema_activo
+            "index.html", estadisticas=estadisticas, anomalias=anomalias, sistema_activo=sistema_activo
         )
     except Exception as e:
         logger.error(f"Error en ruta / : {e}")
@@ -57,18 +83,59 @@ def control_sistema():
         raise
 
 
+FUNCIONARIOS_POR_PAGINA = 50
+
+
+def codificar_cursor(siguiente):
+    if siguiente is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(siguiente).encode("utf-8")).decode("ascii")
+
+
+def decodificar_cursor(token):
+    if not token:
+        return None
+    return tuple(json.loads(base64.urlsafe_b64decode(token.encode("ascii"))))
+
+
 @app.route("/funcionarios")
 def gestion_funcionarios():
     try:
         logger.info("Acceso a /funcionarios")
-        funcionarios = obtener_funcionarios()
-        return render_template("funcionarios.html", funcionarios=funcionarios)
+        funcionarios, siguiente = buscar_funcionarios(limite=FUNCIONARIOS_POR_PAGINA)
+        return render_template(
+            "funcionarios.html",
+            funcionarios=funcionarios,
+            total_funcionarios=contar_funcionarios(),
+            siguiente=codificar_cursor(siguiente),
+        )
     except Exception as e:
         logger.error(f"Error en /funcionarios: {e}")
         logger.error(traceback.format_exc())
         raise
 
 
+@app.route("/api/funcionarios")
+def api_funcionarios():
+    try:
+        texto = request.args.get("q", "").strip()
+        limite = min(max(int(request.args.get("limite", FUNCIONARIOS_POR_PAGINA)), 1), 500)
+        despues = decodificar_cursor(request.args.get("cursor"))
+
+        funcionarios, siguiente = buscar_funcionarios(texto, despues, limite)
+        return jsonify({
+            "funcionarios": [
+                {"identificacion": identificacion, "nombre": nombre}
+                for identificacion, nombre in funcionarios
+            ],
+            "siguiente": codificar_cursor(siguiente),
+        })
+
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Parámetros inválidos en /api/funcionarios: {e}")
+        return jsonify({"status": "error", "message": "Parámetros inválidos"}), 400
+
+
 def verificar_si_es_cedula(identificacion):
     if len(identificacion) == 8 and identificacion.isdigit():
         return True, "serial"
@@ -261,9 +328,12 @@ def api_evento():
         funcionario = obtener_funcionario_por_id(identificacion)
         autorizado = 1 if funcionario else 0
 
-        success, mensaje = agregar_evento(identificacion, autorizado, "api", canal)
+        success, mensaje = agregar_evento(identificacion, autorizado, "api", canal, data.get("puerta"))
 
         if success:
+            evaluar_evento(identificacion, autorizado, canal, "api", data.get("puerta"))
+            if autorizado:
+                registrar_acceso(identificacion, data.get("puerta"))
             logger.info(f"Evento API OK: {identificacion}, autorizado={autorizado}")
             return jsonify({
                 "status": "success",
@@ -282,14 +352,140 @@ def api_evento():
         return jsonify({"status": "error", "message": str(e)}), 400
 
 
+@app.route("/api/evento/lote", methods=["POST"])
+def api_evento_lote():
+    """
+    Lote de eventos: {"eventos": [{"identificacion", "canal", "puerta",
+    "fecha_hora" (opcional), "clave" (opcional, idempotencia)}, ...]}.
+    Todo el lote se registra en una sola transacción; la respuesta trae un
+    resultado por evento en el mismo orden.
+    """
+    try:
+        data = request.get_json()
+        eventos = data.get("eventos") if isinstance(data, dict) else data
+
+        if not isinstance(eventos, list) or not all(isinstance(e, dict) for e in eventos):
+            return jsonify({"status": "error", "message": "Se espera una lista de eventos"}), 400
+        if len(eventos) > config.EVENTOS_LOTE_MAX:
+            return jsonify({
+                "status": "error",
+                "message": f"Lote demasiado grande ({len(eventos)} > {config.EVENTOS_LOTE_MAX})",
+            }), 413
+
+        success, resultados = agregar_eventos_lote(eventos)
+        if not success:
+            logger.error(f"Error registrando lote API: {resultados}")
+            return jsonify({"status": "error", "message": resultados}), 400
+
+        # Alarmas y ocupación se actualizan en memoria solo con los eventos nuevos
+        # y recientes: un backfill de hace horas no dispara alarmas ni mueve la ocupación
+        for evento, resultado in zip(eventos, resultados):
+            if resultado["status"] != "success" or resultado["historico"]:
+                continue
+            canal = evento.get("canal") or "rfid"
+            evaluar_evento(evento["identificacion"], resultado["autorizado"], canal, "api", evento.get("puerta"))
+            if resultado["autorizado"]:
+                registrar_acceso(evento["identificacion"], evento.get("puerta"), resultado["fecha_hora"])
+
+        registrados = sum(1 for r in resultados if r["status"] == "success")
+        duplicados = sum(1 for r in resultados if r["status"] == "duplicado")
+        logger.info(f"Lote API: {len(eventos)} eventos, {registrados} registrados, {duplicados} duplicados")
+        return jsonify({
+            "status": "success",
+            "registrados": registrados,
+            "duplicados": duplicados,
+            "errores": len(resultados) - registrados - duplicados,
+            "resultados": resultados,
+        })
+
+    except Exception as e:
+        logger.error(f"Excepción en /api/evento/lote: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
 @app.route("/api/estadisticas")
 def api_estadisticas():
     return jsonify(obtener_estadisticas())
 
 
+@app.route("/api/series")
+def api_series():
+    try:
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        desde = request.args.get("desde", hoy)
+        hasta = request.args.get("hasta", hoy)
+        granularidad = request.args.get("granularidad", "hora")
+        canal = request.args.get("canal")
+        autorizado = request.args.get("autorizado", type=int)
+
+        if granularidad not in ("hora", "dia"):
+            return jsonify({"status": "error", "message": "granularidad debe ser 'hora' o 'dia'"}), 400
+
+        if request.args.get("tipo") == "heatmap":
+            return jsonify({
+                "desde": desde,
+                "hasta": hasta,
+                "heatmap": obtener_heatmap(desde, hasta, canal, autorizado),
+            })
+
+        serie = obtener_serie(granularidad, desde, hasta, canal, autorizado, request.args.get("operacion"))
+        return jsonify({
+            "granularidad": granularidad,
+            "desde": desde,
+            "hasta": hasta,
+            "serie": [{"periodo": periodo, "cantidad": cantidad} for periodo, cantidad in serie],
+        })
+
+    except Exception as e:
+        logger.error(f"Excepción en /api/series: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/api/ocupacion")
+def api_ocupacion():
+    motor = obtener_ocupacion()
+    resumen = motor.resumen()
+    if request.args.get("detalle"):
+        resumen["presentes"] = motor.presentes()
+    return jsonify(resumen)
+
+
+@app.route("/api/ocupacion/<identificacion>")
+def api_ocupacion_persona(identificacion):
+    return jsonify(obtener_ocupacion().consultar(identificacion))
+
+
+@app.route("/api/alarmas/estado")
+def api_alarmas_estado():
+    return jsonify(obtener_motor_alarmas().estado())
+
+
+@app.route("/api/anomalias")
+def api_anomalias():
+    anomalias = obtener_anomalias(limite=request.args.get("limite", 50, type=int))
+    return jsonify([
+        {
+            "tipo": tipo,
+            "identificacion": identificacion,
+            "canal": canal,
+            "fecha_hora": fecha_hora,
+            "puntaje": puntaje,
+            "detalle": json.loads(detalle),
+            "generado": generado,
+        }
+        for tipo, identificacion, canal, fecha_hora, puntaje, detalle, generado in anomalias
+    ])
+
+
 @app.route("/api/rfid_status")
 def rfid_status():
-    return jsonify({"sistema_activo": sistema_activo, "rfid_activo": True})
+    estado = estado_dispositivos()
+    rfid_activo = estado["bucle"]["vivo"] and any(
+        d["activo"] for d in estado["dispositivos"] if d["tipo"] == "rfid"
+    )
+    return jsonify({"sistema_activo": sistema_activo, "rfid_activo": rfid_activo, **estado})
 
 
 if __name__ == "__main__":
@@ -298,15 +494,24 @@ if __name__ == "__main__":
     logger.info("=" * 60)
 
     try:
-        logger.info("Iniciando lector PIC…")
-        iniciar_lector_pic()
+        iniciar_snapshots_reportes()
+
+        logger.info("Reconstruyendo estado de ocupación…")
+        obtener_ocupacion()
+
+        logger.info("Iniciando lectores RFID y PIC de todas las puertas…")
+        iniciar_dispositivos()
 
+        logger.info("Iniciando agente de replicación…")
+        iniciar_replicacion()
 
-        logger.info("Iniciando lector RFID…")
-        iniciar_lector_rfid()
+        if config.ANALISIS_INTERVALO_S > 0:
+            # NumPy solo se importa si el análisis periódico está activo
+            from analisis import iniciar_analisis_periodico
+            iniciar_analisis_periodico()
 
     except Exception as e:
-        logger.error(f"Error iniciando lector PIC: {e}")
+        logger.error(f"Error iniciando dispositivos: {e}")
         logger.error(traceback.format_exc())
 
     logger.info("Servicios inicializados.")
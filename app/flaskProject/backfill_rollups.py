@@ -0,0 +1,16 @@
+"""
+Reconstruye los rollups por hora/día (eventos_rollup) a partir de todos los
+eventos existentes. Los eventos nuevos los mantienen los triggers de la base.
+
+Uso:
+    python backfill_rollups.py
+"""
+import time
+
+from database import backfill_rollups
+
+
+if __name__ == "__main__":
+    inicio = time.perf_counter()
+    filas = backfill_rollups()
+    print(f"Rollups reconstruidos: {filas} filas en {time.perf_counter() - inicio:.2f} s")
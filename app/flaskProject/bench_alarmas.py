@@ -0,0 +1,66 @@
+"""
+Benchmark del motor de reglas de alarma: eventos/s evaluados en memoria.
+
+Uso:
+    python bench_alarmas.py [--eventos 500000] [--tarjetas 2000] [--denegados 0.3]
+"""
+import argparse
+import random
+import time
+
+import config
+from reglas_alarma import MotorAlarmas, ReglaAlarma
+
+
+def generar_eventos(cantidad, tarjetas, proporcion_denegados, semilla=42):
+    rnd = random.Random(semilla)
+    canales = ("rfid", "serial", "api")
+    for i in range(cantidad):
+        yield {
+            "identificacion": f"{rnd.randrange(tarjetas):08d}",
+            "autorizado": rnd.random() >= proporcion_denegados,
+            "canal": canales[i % 3],
+            "operacion": "Acceso",
+            "puerta": "principal",
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eventos", type=int, default=500_000)
+    parser.add_argument("--tarjetas", type=int, default=2000)
+    parser.add_argument("--denegados", type=float, default=0.3)
+    parser.add_argument("--tasa", type=float, default=200.0, help="eventos por segundo simulados")
+    args = parser.parse_args()
+
+    reglas = [
+        ReglaAlarma("intentos_fallidos", 3, 60, "identificacion", 300, {"autorizado": False}),
+        ReglaAlarma("rafaga_global", 50, 10, "global", 60, {"autorizado": False}),
+        ReglaAlarma("rfid_denegado", 5, 120, "identificacion", 600, {"autorizado": False, "canal": "rfid"}),
+    ]
+    transiciones = []
+    motor = MotorAlarmas(reglas, persistir=lambda *t: transiciones.append(t))
+
+    eventos = list(generar_eventos(args.eventos, args.tarjetas, args.denegados))
+    paso = 1.0 / args.tasa
+
+    inicio = time.perf_counter()
+    ahora = 0.0
+    proximo_barrido = config.ALARMAS_BARRIDO_S
+    for evento in eventos:
+        ahora += paso
+        motor.evaluar(evento, ahora)
+        # El barrido periódico, en el tiempo simulado
+        if ahora >= proximo_barrido:
+            motor.barrer(ahora)
+            proximo_barrido += config.ALARMAS_BARRIDO_S
+    duracion = time.perf_counter() - inicio
+
+    activaciones = sum(1 for t in transiciones if t[2])
+    print(f"{args.eventos} eventos, {len(reglas)} reglas: {duracion:.2f} s → {args.eventos / duracion:,.0f} eventos/s")
+    print(f"Transiciones persistidas: {len(transiciones)} ({activaciones} activaciones)")
+    print(f"Claves en memoria al final: {[len(e) for e in motor.estados]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark del análisis de patrones: genera un año sintético de eventos en una
+base temporal y mide cuánto tarda el análisis completo.
+
+Uso:
+    python bench_analisis.py [--personas 400] [--por-dia 4] [--denegados 0.05]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import config
+
+
+def generar_anio(personas, por_dia, proporcion_denegados, semilla=42):
+    rng = np.random.default_rng(semilla)
+    dias = 365
+    cantidad = personas * dias * por_dia
+
+    # Cada persona tiene un horario habitual de entrada (6 a 10 h) y sale 8-9 h después
+    entrada = rng.integers(6, 11, personas)
+    persona = rng.integers(0, personas, cantidad)
+    dia = rng.integers(0, dias, cantidad)
+    hora = entrada[persona] + np.where(rng.random(cantidad) < 0.5, 0, rng.integers(8, 10, cantidad))
+    # Un pequeño porcentaje de accesos a horas arbitrarias
+    raros = rng.random(cantidad) < 0.003
+    hora[raros] = rng.integers(0, 24, raros.sum())
+    segundos = (dia * 86400 + (hora % 24) * 3600 + rng.integers(0, 3600, cantidad)).astype("timedelta64[s]")
+    autorizado = (rng.random(cantidad) >= proporcion_denegados).astype(int)
+    canal = np.array(["rfid", "serial", "api"])[rng.integers(0, 3, cantidad)]
+
+    # Algunas ráfagas de lecturas denegadas (8 en ~30 s) para ejercitar esa detección
+    for inicio in rng.integers(0, cantidad - 8, 20):
+        base = segundos[inicio]
+        segundos[inicio:inicio + 8] = base + np.arange(8).astype("timedelta64[s]") * 4
+        autorizado[inicio:inicio + 8] = 0
+        canal[inicio:inicio + 8] = "rfid"
+    fechas = (np.datetime64("2025-01-01T00:00:00") + segundos).astype(str)
+
+    identificaciones = np.char.zfill(persona.astype(str), 8)
+    return zip(
+        identificaciones.tolist(),
+        np.char.replace(fechas, "T", " ").tolist(),
+        autorizado.tolist(),
+        canal.tolist(),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--personas", type=int, default=400)
+    parser.add_argument("--por-dia", type=int, default=4)
+    parser.add_argument("--denegados", type=float, default=0.05)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench_analisis_")
+    config.DB_PATH = os.path.join(directorio, "Database")
+
+    from database import Database
+    from analisis import analizar
+
+    db = Database()
+    conn = db.get_connection()
+    inicio = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO eventos (identificacion, fecha_hora, autorizado, canal, operacion, puerta) "
+        "VALUES (?, ?, ?, ?, 'Acceso', 'principal')",
+        generar_anio(args.personas, args.por_dia, args.denegados),
+    )
+    conn.commit()
+    total = conn.execute("SELECT COUNT(*) FROM eventos").fetchone()[0]
+    conn.close()
+    print(f"Año sintético: {total} eventos de {args.personas} personas ({time.perf_counter() - inicio:.1f} s de carga)")
+
+    # El año sintético es 2025: se analiza completo, sin la ventana de ANALISIS_VENTANA_DIAS
+    resultado = analizar(ventana_dias=0)
+    print(
+        f"Análisis: {resultado['segundos_total']:.2f} s "
+        f"(lectura {resultado['segundos_carga']:.2f} s) → "
+        f"{resultado['horarios_inusuales']} horarios inusuales, {resultado['rafagas_denegados']} ráfagas"
+    )
+    print(f"Base temporal: {directorio}")
+
+
+if __name__ == "__main__":
+    main()
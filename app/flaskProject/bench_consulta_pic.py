@@ -0,0 +1,127 @@
+"""
+Benchmark de la autorización asistida: un PIC emulado sobre un pty consulta
+"Q<cedula>" por cédulas que no tiene en EEPROM y mide el ida y vuelta hasta
+recibir "S/N<cedula>" del gestor de dispositivos real (base temporal).
+
+El emulador escribe la consulta a ritmo de 9600 baudios (~1,04 ms por
+carácter) y suma el tiempo de cable de la respuesta, que el pty entrega al
+instante. El objetivo es < 50 ms: el PIC espera hasta CONSULTA_TIMEOUT_MS (50)
+desde que terminó de enviar la consulta y después deniega.
+
+Uso:
+    python bench_consulta_pic.py [--consultas 200] [--funcionarios 1000] [--pausa 0.2]
+"""
+import argparse
+import os
+import pty
+import random
+import select
+import tempfile
+import time
+import tty
+
+os.environ.setdefault("RFID_BACKEND", "deshabilitado")
+
+import config
+
+SEGUNDOS_POR_CARACTER = 10 / 9600   # 8N1: 10 bits por carácter
+
+
+def escribir_a_9600(fd, datos):
+    for byte in datos:
+        os.write(fd, bytes([byte]))
+        time.sleep(SEGUNDOS_POR_CARACTER)
+
+
+def leer_respuesta(fd, cedula, timeout):
+    """Lee líneas hasta "S/N<cedula>"; ignora el resto (p. ej. el 'T' de sincronización)."""
+    limite = time.perf_counter() + timeout
+    pendiente = b""
+    while True:
+        restante = limite - time.perf_counter()
+        if restante <= 0:
+            return None, None
+        listos, _, _ = select.select([fd], [], [], restante)
+        if not listos:
+            continue
+        pendiente += os.read(fd, 256)
+        while b"\n" in pendiente:
+            linea, pendiente = pendiente.split(b"\n", 1)
+            linea = linea.strip().decode("utf-8", errors="ignore")
+            if linea[:1] in ("S", "N") and linea[1:] == cedula:
+                return linea[0], time.perf_counter()
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--funcionarios", type=int, default=1000)
+    parser.add_argument("--pausa", type=float, default=0.2, help="segundos entre consultas")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench_consulta_")
+    config.DB_PATH = os.path.join(directorio, "Database")
+
+    maestro, esclavo = pty.openpty()
+    tty.setraw(esclavo)
+    config.PIC_BACKEND = "real"
+    config.PUERTAS = f"{config.PUERTA_DEFECTO}:serial={os.ttyname(esclavo)}"
+
+    from database import Database
+    from dispositivos import GestorDispositivos
+
+    conn = Database().get_connection()
+    conn.executemany(
+        "INSERT INTO funcionarios (identificacion, nombre) VALUES (?, ?)",
+        [(f"{i:08d}", f"Funcionario {i}") for i in range(args.funcionarios)],
+    )
+    conn.commit()
+    conn.close()
+
+    gestor = GestorDispositivos()
+    gestor.iniciar()
+    time.sleep(0.5)
+
+    rnd = random.Random(42)
+    tiempos, errores, sin_respuesta = [], 0, 0
+    for _ in range(args.consultas):
+        # ~25% de cédulas desconocidas
+        numero = rnd.randrange(int(args.funcionarios * 1.33))
+        cedula = f"{numero:08d}"
+        mensaje = f"Q{cedula}\r\n".encode("utf-8")
+
+        inicio = time.perf_counter()
+        escribir_a_9600(maestro, mensaje)
+        respuesta, llegada = leer_respuesta(maestro, cedula, timeout=1.0)
+        if respuesta is None:
+            sin_respuesta += 1
+            continue
+        # Cable de vuelta: el PIC recibe el último carácter len(respuesta) caracteres después
+        llegada += (len(cedula) + 2) * SEGUNDOS_POR_CARACTER
+        tiempos.append(llegada - inicio)
+        if (respuesta == "S") != (numero < args.funcionarios):
+            errores += 1
+        time.sleep(args.pausa)
+
+    gestor.detener()
+    pic = gestor.pics[0] if gestor.pics else None
+
+    print(f"{args.consultas} consultas, {len(tiempos)} respondidas, {sin_respuesta} sin respuesta, "
+          f"{errores} respuestas incorrectas")
+    if tiempos:
+        cable = 2 * len(mensaje) * SEGUNDOS_POR_CARACTER
+        print(f"Ida y vuelta (incluye {cable * 1000:.1f} ms de cable a 9600 baudios): "
+              f"p50 {percentil(tiempos, 0.5) * 1000:.1f} ms, p95 {percentil(tiempos, 0.95) * 1000:.1f} ms, "
+              f"máx {max(tiempos) * 1000:.1f} ms")
+    if pic is not None:
+        print(f"Consultas respondidas por el gestor: {pic.consultas_respondidas}")
+    print(f"Base temporal: {directorio}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark de ingesta por API: N eventos enviados uno por uno a /api/evento
+contra los mismos N en lotes a /api/evento/lote (cliente de pruebas de Flask,
+base temporal, sin hardware).
+
+Uso:
+    python bench_ingesta_lote.py [--eventos 2000] [--lote 100] [--funcionarios 200]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("RFID_BACKEND", "deshabilitado")
+os.environ.setdefault("PIC_BACKEND", "deshabilitado")
+
+import config
+
+
+def generar_eventos(cantidad, funcionarios, semilla=42):
+    rnd = random.Random(semilla)
+    return [
+        {
+            # ~20% de tarjetas desconocidas
+            "identificacion": f"{rnd.randrange(int(funcionarios * 1.25)):08d}",
+            "canal": rnd.choice(("rfid", "serial", "api")),
+            "puerta": "principal",
+            "clave": f"bench-{i}",
+        }
+        for i in range(cantidad)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eventos", type=int, default=2000)
+    parser.add_argument("--lote", type=int, default=100)
+    parser.add_argument("--funcionarios", type=int, default=200)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench_ingesta_")
+    config.DB_PATH = os.path.join(directorio, "Database")
+
+    from database import Database
+    import app as aplicacion
+
+    conn = Database().get_connection()
+    conn.executemany(
+        "INSERT INTO funcionarios (identificacion, nombre) VALUES (?, ?)",
+        [(f"{i:08d}", f"Funcionario {i}") for i in range(args.funcionarios)],
+    )
+    conn.commit()
+    conn.close()
+
+    cliente = aplicacion.app.test_client()
+    eventos = generar_eventos(args.eventos, args.funcionarios)
+
+    inicio = time.perf_counter()
+    for evento in eventos:
+        respuesta = cliente.post("/api/evento", json=evento)
+        assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    individual = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for i in range(0, len(eventos), args.lote):
+        respuesta = cliente.post("/api/evento/lote", json={"eventos": eventos[i:i + args.lote]})
+        assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    lote = time.perf_counter() - inicio
+
+    # Reenvío completo: todo debe salir como duplicado sin insertar nada
+    inicio = time.perf_counter()
+    duplicados = 0
+    for i in range(0, len(eventos), args.lote):
+        duplicados += cliente.post("/api/evento/lote", json={"eventos": eventos[i:i + args.lote]}).get_json()["duplicados"]
+    reenvio = time.perf_counter() - inicio
+
+    print(f"Individual: {args.eventos} eventos en {individual:.2f} s → {args.eventos / individual:,.0f} eventos/s")
+    print(f"Lote de {args.lote}: {args.eventos} eventos en {lote:.2f} s → {args.eventos / lote:,.0f} eventos/s "
+          f"(x{individual / lote:.1f})")
+    print(f"Reenvío idempotente: {duplicados}/{args.eventos} duplicados en {reenvio:.2f} s")
+    print(f"Base temporal: {directorio}")
+
+
+if __name__ == "__main__":
+    main()
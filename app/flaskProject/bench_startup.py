@@ -0,0 +1,76 @@
+"""
+Benchmark de arranque: mide cuánto tarda `import app` en un proceso limpio,
+sin hardware (backends deshabilitados), y falla si supera el presupuesto.
+
+Uso:
+    python bench_startup.py [--repeticiones 5] [--presupuesto-ms 600] [--top 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+CODIGO = "import time; t = time.perf_counter(); import app; print((time.perf_counter() - t) * 1000)"
+
+
+def _entorno():
+    env = dict(os.environ)
+    env.setdefault("RFID_BACKEND", "deshabilitado")
+    env.setdefault("PIC_BACKEND", "deshabilitado")
+    return env
+
+
+def medir_import(repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, "-c", CODIGO],
+            cwd=DIRECTORIO, env=_entorno(), capture_output=True, text=True, check=True,
+        )
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]))
+    return tiempos
+
+
+def modulos_mas_lentos(top):
+    """Top de módulos por tiempo acumulado según `python -X importtime`."""
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=DIRECTORIO, env=_entorno(), capture_output=True, text=True, check=True,
+    )
+    filas = []
+    for linea in salida.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, acumulado, nombre = [p.strip() for p in linea.split(":", 1)[1].split("|")]
+        filas.append((int(acumulado), nombre))
+    filas.sort(reverse=True)
+    return filas[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--presupuesto-ms", type=float, default=600.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    tiempos = medir_import(args.repeticiones)
+    mediana = statistics.median(tiempos)
+
+    print(f"import app: mediana={mediana:.1f} ms, min={min(tiempos):.1f} ms, max={max(tiempos):.1f} ms")
+    print("Módulos más lentos (acumulado):")
+    for acumulado, nombre in modulos_mas_lentos(args.top):
+        print(f"  {acumulado / 1000:8.1f} ms  {nombre}")
+
+    if mediana > args.presupuesto_ms:
+        print(f"FALLO: {mediana:.1f} ms supera el presupuesto de {args.presupuesto_ms:.0f} ms")
+        return 1
+    print(f"OK: dentro del presupuesto de {args.presupuesto_ms:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Colector central: recibe lotes de eventos de cada sitio y los consolida en
+una sola base (Central.db) con las mismas consultas que la base local.
+
+Uso:
+    python colector.py [--puerto 5001]
+"""
+import argparse
+import gzip
+import json
+import sqlite3
+import threading
+import logging
+import traceback
+
+from flask import Flask, request, jsonify
+
+import config
+from logger_config import setup_logger
+
+logger = setup_logger("colector", "colector.log", level=logging.INFO)
+
+
+# Bases ya inicializadas en este proceso (una por ruta)
+_inicializadas = set()
+_inicializadas_lock = threading.Lock()
+
+
+class BaseCentral:
+    def __init__(self, db_name=None):
+        db_name = db_name or config.COLECTOR_DB_PATH
+        self.db_name = db_name if db_name.endswith('.db') else db_name + '.db'
+        # Cada request crea una BaseCentral: el esquema se verifica una sola vez
+        if self.db_name not in _inicializadas:
+            with _inicializadas_lock:
+                if self.db_name not in _inicializadas:
+                    self.init_db()
+                    _inicializadas.add(self.db_name)
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            # Clave con fecha_hora: un sitio que restaura una base vieja reusa
+            # ids, y sus eventos nuevos no son duplicados de los de antes
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS eventos (
+                    sitio TEXT NOT NULL,
+                    id_origen INTEGER NOT NULL,
+                    identificacion TEXT NOT NULL,
+                    fecha_hora TEXT NOT NULL,
+                    autorizado INTEGER NOT NULL,
+                    canal TEXT NOT NULL,
+                    operacion TEXT NOT NULL,
+                    puerta TEXT NOT NULL,
+                    PRIMARY KEY (sitio, id_origen, fecha_hora)
+                )
+            ''')
+            self.migrar_clave_eventos(conn)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_central_fecha ON eventos (fecha_hora)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def migrar_clave_eventos(self, conn):
+        """Bases creadas con PRIMARY KEY (sitio, id_origen): se rehace la tabla."""
+        clave = [fila[1] for fila in conn.execute('PRAGMA table_info(eventos)') if fila[5]]
+        if 'fecha_hora' in clave:
+            return
+        conn.executescript('''
+            BEGIN;
+            CREATE TABLE eventos_nueva (
+                sitio TEXT NOT NULL,
+                id_origen INTEGER NOT NULL,
+                identificacion TEXT NOT NULL,
+                fecha_hora TEXT NOT NULL,
+                autorizado INTEGER NOT NULL,
+                canal TEXT NOT NULL,
+                operacion TEXT NOT NULL,
+                puerta TEXT NOT NULL,
+                PRIMARY KEY (sitio, id_origen, fecha_hora)
+            );
+            INSERT INTO eventos_nueva SELECT sitio, id_origen, identificacion, fecha_hora,
+                autorizado, canal, operacion, puerta FROM eventos;
+            DROP TABLE eventos;
+            ALTER TABLE eventos_nueva RENAME TO eventos;
+            COMMIT;
+        ''')
+        logger.info("Tabla central de eventos migrada a la clave (sitio, id_origen, fecha_hora)")
+
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_name)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+
+def insertar_lote(sitio, eventos, db=None):
+    """Inserta idempotentemente: (sitio, id_origen, fecha_hora) repetidos se ignoran."""
+    db = db or BaseCentral()
+    conn = db.get_connection()
+
+    try:
+        antes = conn.total_changes
+        conn.executemany(
+            'INSERT OR IGNORE INTO eventos (sitio, id_origen, identificacion, fecha_hora, autorizado, canal, operacion, puerta) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (sitio, e['id'], e['identificacion'], e['fecha_hora'], e['autorizado'],
+                 e['canal'], e['operacion'], e.get('puerta') or config.PUERTA_DEFECTO)
+                for e in eventos
+            ]
+        )
+        conn.commit()
+        aceptados = conn.total_changes - antes
+        return aceptados, len(eventos) - aceptados
+
+    finally:
+        conn.close()
+
+
+def consultar_eventos_por_fecha(fecha_inicio, fecha_fin, sitio=None, db=None):
+    db = db or BaseCentral()
+    conn = db.get_connection()
+
+    try:
+        sql = '''
+            SELECT sitio, id_origen, identificacion, fecha_hora, autorizado, canal, operacion, puerta
+            FROM eventos
+            WHERE fecha_hora BETWEEN ? AND ?
+        '''
+        params = [f"{fecha_inicio} 00:00:00", f"{fecha_fin} 23:59:59"]
+        if sitio:
+            sql += ' AND sitio = ?'
+            params.append(sitio)
+        sql += ' ORDER BY fecha_hora DESC'
+        return conn.execute(sql, params).fetchall()
+
+    except Exception as e:
+        logger.error(f"Error consultando eventos centrales por fecha: {e}")
+        logger.error(traceback.format_exc())
+        return []
+
+    finally:
+        conn.close()
+
+
+def obtener_estadisticas(sitio=None, db=None):
+    db = db or BaseCentral()
+    conn = db.get_connection()
+    filtro, params = ('WHERE sitio = ?', (sitio,)) if sitio else ('', ())
+
+    try:
+        total_eventos = conn.execute(f'SELECT COUNT(*) FROM eventos {filtro}', params).fetchone()[0]
+        auth_stats = conn.execute(f'SELECT autorizado, COUNT(*) FROM eventos {filtro} GROUP BY autorizado', params).fetchall()
+        canal_stats = conn.execute(f'SELECT canal, COUNT(*) FROM eventos {filtro} GROUP BY canal', params).fetchall()
+        sitio_stats = conn.execute(f'SELECT sitio, COUNT(*) FROM eventos {filtro} GROUP BY sitio', params).fetchall()
+
+        return {
+            'total_eventos': total_eventos,
+            # Claves como texto: autorizado mezcla 0/1 con 'No' y jsonify las ordena
+            'auth_stats': {str(autorizado): cantidad for autorizado, cantidad in auth_stats},
+            'canal_stats': dict(canal_stats),
+            'sitio_stats': dict(sitio_stats),
+        }
+
+    except Exception as e:
+        logger.error(f"Error obteniendo estadísticas centrales: {e}")
+        logger.error(traceback.format_exc())
+        return {}
+
+    finally:
+        conn.close()
+
+
+app = Flask(__name__)
+
+
+@app.route("/api/replicacion/lote", methods=["POST"])
+def recibir_lote():
+    try:
+        datos = request.get_data()
+        if request.headers.get("Content-Encoding") == "gzip":
+            datos = gzip.decompress(datos)
+        lote = json.loads(datos)
+
+        sitio = lote["sitio"]
+        eventos = lote["eventos"]
+        aceptados, duplicados = insertar_lote(sitio, eventos)
+        logger.info(f"Lote de {sitio}: {aceptados} aceptados, {duplicados} duplicados")
+
+        return jsonify({
+            "status": "success",
+            "aceptados": aceptados,
+            "duplicados": duplicados,
+            "ultimo_id": max((e["id"] for e in eventos), default=None),
+        })
+
+    except Exception as e:
+        logger.error(f"Error recibiendo lote: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/api/eventos")
+def api_eventos():
+    eventos = consultar_eventos_por_fecha(
+        request.args["fecha_inicio"], request.args["fecha_fin"], request.args.get("sitio")
+    )
+    return jsonify(eventos)
+
+
+@app.route("/api/estadisticas")
+def api_estadisticas():
+    return jsonify(obtener_estadisticas(request.args.get("sitio")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, default=5001)
+    args = parser.parse_args()
+
+    BaseCentral()
+    logger.info(f"Colector central en http://0.0.0.0:{args.puerto} (base: {config.COLECTOR_DB_PATH})")
+    app.run(debug=False, host="0.0.0.0", port=args.puerto, threaded=True)
@@ -0,0 +1,103 @@
+import os
+
+# ===============================
+# ⚙️ CONFIGURACIÓN POR VARIABLES DE ENTORNO
+# ===============================
+
+
+def _env_bool(nombre, defecto=False):
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return defecto
+    return valor.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+
+
+def _env_float(nombre, defecto):
+    try:
+        return float(os.environ.get(nombre, defecto))
+    except ValueError:
+        return defecto
+
+
+# Perfilado (opt-in)
+PERFILADO_ACTIVO = _env_bool("PERFILADO_ACTIVO")
+PERFILADO_UMBRAL_MS = _env_float("PERFILADO_UMBRAL_MS", 50.0)
+PERFILADO_EXPLAIN = _env_bool("PERFILADO_EXPLAIN")
+
+# Base de datos
+DB_PATH = os.environ.get("DB_PATH", "Database")
+
+# Hardware: "real", "simulado" o "deshabilitado" (el PIC además "firmware")
+RFID_BACKEND = os.environ.get("RFID_BACKEND", "real")
+PIC_BACKEND = os.environ.get("PIC_BACKEND", "real")
+# PIC_BACKEND=firmware: main.c compilado para Linux ("make -C simulador") detrás de un pty
+FIRMWARE_SIMULADOR = os.environ.get(
+    "FIRMWARE_SIMULADOR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "simulador", "simulador"),
+)
+# Directorio con la EEPROM simulada de cada puerta ("" = EEPROM virgen en cada arranque)
+FIRMWARE_EEPROM_DIR = os.environ.get("FIRMWARE_EEPROM_DIR", "")
+SERIAL_PORT = os.environ.get("SERIAL_PORT", "/dev/ttyAMA0")
+BAUD_RATE = int(os.environ.get("BAUD_RATE", 9600))
+# Cada cuánto se pide el reloj al PIC ('T') para fechar sus eventos. 0 = nunca
+PIC_SYNC_INTERVALO_S = _env_float("PIC_SYNC_INTERVALO_S", 60.0)
+
+# Multi-puerta
+# Formato: "principal:rfid=0.0,serial=/dev/ttyAMA0;deposito:rfid=0.1,serial=/dev/ttyUSB0"
+# rfid = bus.device SPI del MFRC522, serial = puerto del PIC (cualquiera puede omitirse)
+PUERTA_DEFECTO = os.environ.get("PUERTA_DEFECTO", "principal")
+PUERTAS = os.environ.get("PUERTAS", f"{PUERTA_DEFECTO}:rfid=0.0,serial={SERIAL_PORT}")
+INGESTA_HILOS = int(os.environ.get("INGESTA_HILOS", 2))
+DISPOSITIVOS_INTERVALO = _env_float("DISPOSITIVOS_INTERVALO", 0.05)
+# Supervisor: bucle de sondeo sin latido por más de STALL_S → se reinicia;
+# dispositivo con ERRORES_MAX errores seguidos → se reabre con backoff
+DISPOSITIVOS_STALL_S = _env_float("DISPOSITIVOS_STALL_S", 5.0)
+DISPOSITIVOS_SUPERVISION_S = _env_float("DISPOSITIVOS_SUPERVISION_S", 1.0)
+DISPOSITIVOS_ERRORES_MAX = int(os.environ.get("DISPOSITIVOS_ERRORES_MAX", 3))
+DISPOSITIVOS_BACKOFF_MAX = _env_float("DISPOSITIVOS_BACKOFF_MAX", 60.0)
+
+# Journal append-only de eventos (opt-in)
+JOURNAL_ACTIVO = _env_bool("JOURNAL_ACTIVO")
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", "journal")
+JOURNAL_SEGMENTO_BYTES = int(os.environ.get("JOURNAL_SEGMENTO_BYTES", 4 * 1024 * 1024))
+JOURNAL_GRUPO_MS = _env_float("JOURNAL_GRUPO_MS", 5.0)
+JOURNAL_TIMEOUT = _env_float("JOURNAL_TIMEOUT", 5.0)
+# Intentos por lote antes de aplicar evento por evento; los que igual fallan
+# van a JOURNAL_DIR/rechazados.jsonl
+JOURNAL_REINTENTOS = int(os.environ.get("JOURNAL_REINTENTOS", 5))
+
+# Replicación hacia el colector central
+SITIO_ID = os.environ.get("SITIO_ID", "sitio-1")
+REPLICACION_URL = os.environ.get("REPLICACION_URL", "")
+REPLICACION_LOTE = int(os.environ.get("REPLICACION_LOTE", 500))
+REPLICACION_INTERVALO = _env_float("REPLICACION_INTERVALO", 30.0)
+REPLICACION_BACKOFF_MAX = _env_float("REPLICACION_BACKOFF_MAX", 300.0)
+COLECTOR_DB_PATH = os.environ.get("COLECTOR_DB_PATH", "Central")
+
+# Ocupación (quién está dentro)
+OCUPACION_CHECKPOINT_S = _env_float("OCUPACION_CHECKPOINT_S", 60.0)
+
+# Reglas de alarma (JSON). Ver reglas_alarma.py para el formato.
+REGLAS_ALARMA = os.environ.get("REGLAS_ALARMA", "")
+# Cada cuánto se buscan alarmas que ya se normalizaron sin eventos nuevos
+ALARMAS_BARRIDO_S = _env_float("ALARMAS_BARRIDO_S", 5.0)
+
+# Conexiones SQLite: escritura (ingesta) y lectura (reportes)
+DB_CACHE_KB = int(os.environ.get("DB_CACHE_KB", 2000))
+DB_CACHE_LECTURA_KB = int(os.environ.get("DB_CACHE_LECTURA_KB", 8000))
+DB_MMAP_BYTES = int(os.environ.get("DB_MMAP_BYTES", 64 * 1024 * 1024))
+# Si es > 0, los reportes leen de una copia refrescada cada N segundos
+REPORTES_SNAPSHOT_S = _env_float("REPORTES_SNAPSHOT_S", 0.0)
+REPORTES_SNAPSHOT_PATH = os.environ.get("REPORTES_SNAPSHOT_PATH", "Database-snapshot")
+
+# Análisis de patrones de acceso (requiere numpy). 0 = solo manual
+ANALISIS_INTERVALO_S = _env_float("ANALISIS_INTERVALO_S", 0.0)
+# Solo los últimos N días (la memoria depende de los eventos en la ventana). 0 = todo el histórico
+ANALISIS_VENTANA_DIAS = _env_float("ANALISIS_VENTANA_DIAS", 90.0)
+
+# Ingesta en lote (/api/evento/lote)
+EVENTOS_LOTE_MAX = int(os.environ.get("EVENTOS_LOTE_MAX", 1000))
+IDEMPOTENCIA_DIAS = _env_float("IDEMPOTENCIA_DIAS", 7.0)
+# Eventos del lote con fecha_hora más vieja que esto son históricos: se
+# guardan pero no disparan alarmas ni alternan la ocupación
+EVENTOS_LOTE_VENTANA_S = _env_float("EVENTOS_LOTE_VENTANA_S", 60.0)
@@ -1,28 +1,78 @@
+import os
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 import logging
 from logger_config import setup_logger
 import traceback
+from collections import Counter
+import config
+
+if config.PERFILADO_ACTIVO:
+    from perfilado import ConexionPerfilada as Conexion
+else:
+    Conexion = sqlite3.Connection
 
 logger = setup_logger("database", "db.log", level=logging.INFO)
 
 
+FTS_DISPONIBLE = True
+
+# Expresiones SQL de los rollups (fecha_hora = 'YYYY-MM-DD HH:MM:SS')
+ROLLUP_PERIODOS = {
+    'hora': "substr({f}, 1, 13) || ':00'",
+    'dia': "substr({f}, 1, 10)",
+}
+ROLLUP_AUTORIZADO = "CASE WHEN {a} IN (1, '1', 'Si') THEN 1 ELSE 0 END"
+
+
+def reconstruir_rollups(cursor):
+    """Backfill: recalcula los rollups completos a partir de eventos."""
+    cursor.execute('DELETE FROM eventos_rollup')
+    for granularidad, periodo in ROLLUP_PERIODOS.items():
+        cursor.execute(f'''
+            INSERT INTO eventos_rollup (granularidad, periodo, canal, autorizado, operacion, cantidad)
+            SELECT '{granularidad}', {periodo.format(f='fecha_hora')}, canal,
+                   {ROLLUP_AUTORIZADO.format(a='autorizado')} AS aut, operacion, COUNT(*)
+            FROM eventos
+            GROUP BY 2, canal, aut, operacion
+        ''')
+    logger.info("Rollups de eventos reconstruidos")
+
+
+def _nombre_db(db_name):
+    return db_name if db_name.endswith('.db') else db_name + '.db'
+
+
 class Database:
-    def __init__(self, db_name='Database'):
-        self.db_name = db_name if db_name.endswith('.db') else db_name + '.db'
-        self.init_db()
+    # Bases ya inicializadas en este proceso (el DDL se corre una sola vez)
+    _inicializadas = set()
+    _init_lock = threading.Lock()
+
+    def __init__(self, db_name=None):
+        self.db_name = _nombre_db(db_name or config.DB_PATH)
+        if self.db_name not in Database._inicializadas:
+            with Database._init_lock:
+                if self.db_name not in Database._inicializadas:
+                    self.init_db()
+                    Database._inicializadas.add(self.db_name)
 
     def init_db(self):
         try:
             conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
 
+            # id: rowid explícito y estable para el índice FTS (VACUUM puede
+            # renumerar el rowid implícito de una tabla con clave TEXT)
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS funcionarios (
-                    identificacion TEXT PRIMARY KEY,
+                    id INTEGER PRIMARY KEY,
+                    identificacion TEXT NOT NULL UNIQUE,
                     nombre TEXT NOT NULL
                 )
             ''')
+            self.migrar_funcionarios(cursor)
 
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS eventos (
@@ -32,10 +82,99 @@ class Database:
                     autorizado INTEGER NOT NULL,
                     canal TEXT NOT NULL,
                     operacion TEXT NOT NULL,
+                    puerta TEXT NOT NULL DEFAULT 'principal',
+                    historico INTEGER NOT NULL DEFAULT 0,
                     FOREIGN KEY (identificacion) REFERENCES funcionarios (identificacion)
                 )
             ''')
 
+            # Migración: bases creadas antes del soporte multi-puerta
+            columnas = [fila[1] for fila in cursor.execute('PRAGMA table_info(eventos)')]
+            if 'puerta' not in columnas:
+                cursor.execute("ALTER TABLE eventos ADD COLUMN puerta TEXT NOT NULL DEFAULT 'principal'")
+                logger.info("Columna 'puerta' agregada a eventos")
+            # historico = 1: cargado a posteriori (replay de logs, lotes con fecha vieja); no alterna la ocupación
+            if 'historico' not in columnas:
+                cursor.execute("ALTER TABLE eventos ADD COLUMN historico INTEGER NOT NULL DEFAULT 0")
+                logger.info("Columna 'historico' agregada a eventos")
+
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_eventos_puerta_fecha ON eventos (puerta, fecha_hora)')
+            # Deduplicación de la importación de logs (rango de fechas por canal)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_eventos_canal_fecha ON eventos (canal, fecha_hora)')
+
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_funcionarios_nombre ON funcionarios (nombre, identificacion)')
+            self.init_busqueda(cursor)
+
+            self.init_rollups(cursor)
+
+            # Transiciones del motor de reglas (activación y normalización, clave '*'
+            # en reglas globales). En eventos solo queda la activación, como alarma.
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS alarmas_transiciones (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    regla TEXT NOT NULL,
+                    clave TEXT NOT NULL,
+                    activa INTEGER NOT NULL,
+                    cantidad INTEGER NOT NULL,
+                    puerta TEXT NOT NULL,
+                    fecha_hora TEXT NOT NULL
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS anomalias (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tipo TEXT NOT NULL,
+                    identificacion TEXT,
+                    canal TEXT,
+                    fecha_hora TEXT NOT NULL,
+                    puntaje REAL NOT NULL,
+                    detalle TEXT NOT NULL,
+                    generado TEXT NOT NULL
+                )
+            ''')
+
+            # Claves de idempotencia de /api/evento/lote → evento ya registrado
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS eventos_idempotencia (
+                    clave TEXT PRIMARY KEY,
+                    evento_id INTEGER NOT NULL,
+                    autorizado INTEGER NOT NULL,
+                    creado TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotencia_creado ON eventos_idempotencia (creado)')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ocupacion_checkpoint (
+                    identificacion TEXT PRIMARY KEY,
+                    dentro INTEGER NOT NULL,
+                    fecha_hora TEXT NOT NULL,
+                    puerta TEXT NOT NULL
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ocupacion_estado (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    ultimo_id INTEGER NOT NULL
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS replicacion_estado (
+                    destino TEXT PRIMARY KEY,
+                    ultimo_id INTEGER NOT NULL
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS journal_estado (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    ultimo_seq INTEGER NOT NULL
+                )
+            ''')
+
             conn.commit()
             logger.info("Inicialización de base de datos completada")
 
@@ -46,12 +185,117 @@ class Database:
         finally:
             conn.close()
 
+    def init_rollups(self, cursor):
+        """Rollups por hora/día × canal × autorizado × operación, mantenidos por triggers."""
+        existe = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'eventos_rollup'"
+        ).fetchone()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS eventos_rollup (
+                granularidad TEXT NOT NULL,
+                periodo TEXT NOT NULL,
+                canal TEXT NOT NULL,
+                autorizado INTEGER NOT NULL,
+                operacion TEXT NOT NULL,
+                cantidad INTEGER NOT NULL,
+                PRIMARY KEY (granularidad, periodo, canal, autorizado, operacion)
+            ) WITHOUT ROWID
+        ''')
+
+        for momento, fila, delta in (('INSERT', 'new', '1'), ('DELETE', 'old', '-1')):
+            sentencias = []
+            for granularidad, periodo in ROLLUP_PERIODOS.items():
+                sentencias.append(f'''
+                    INSERT INTO eventos_rollup (granularidad, periodo, canal, autorizado, operacion, cantidad)
+                    VALUES ('{granularidad}', {periodo.format(f=fila + '.fecha_hora')}, {fila}.canal,
+                            {ROLLUP_AUTORIZADO.format(a=fila + '.autorizado')}, {fila}.operacion, {delta})
+                    ON CONFLICT (granularidad, periodo, canal, autorizado, operacion)
+                    DO UPDATE SET cantidad = cantidad + ({delta});
+                ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS eventos_rollup_{momento.lower()} AFTER {momento} ON eventos BEGIN
+                    {''.join(sentencias)}
+                END
+            ''')
+
+        if not existe:
+            reconstruir_rollups(cursor)
+
+    def migrar_funcionarios(self, cursor):
+        """Bases con funcionarios(identificacion TEXT PRIMARY KEY): se copia a la tabla con id."""
+        columnas = [fila[1] for fila in cursor.execute('PRAGMA table_info(funcionarios)')]
+        if 'id' in columnas:
+            return
+
+        # Tabla nueva + copia + rename (no se renombra la vieja: eso reescribiría
+        # la FOREIGN KEY de eventos hacia el nombre viejo). El índice FTS se
+        # recrea sobre la tabla nueva en init_busqueda.
+        cursor.execute('DROP TABLE IF EXISTS funcionarios_fts')
+        cursor.execute('''
+            CREATE TABLE funcionarios_nueva (
+                id INTEGER PRIMARY KEY,
+                identificacion TEXT NOT NULL UNIQUE,
+                nombre TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO funcionarios_nueva (identificacion, nombre)
+            SELECT identificacion, nombre FROM funcionarios ORDER BY rowid
+        ''')
+        cursor.execute('DROP TABLE funcionarios')
+        cursor.execute('ALTER TABLE funcionarios_nueva RENAME TO funcionarios')
+        logger.info("Tabla funcionarios migrada a rowid explícito (id)")
+
+    def init_busqueda(self, cursor):
+        """Índice FTS5 (con prefijos) sobre nombre/identificación, sincronizado por triggers."""
+        global FTS_DISPONIBLE
+        existe = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'funcionarios_fts'"
+        ).fetchone()
+        if existe:
+            return
+
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE funcionarios_fts USING fts5(
+                    identificacion, nombre,
+                    content = 'funcionarios',
+                    content_rowid = 'id',
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            FTS_DISPONIBLE = False
+            logger.warning(f"FTS5 no disponible, la búsqueda usa el índice por nombre: {e}")
+            return
+
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS funcionarios_fts_ai AFTER INSERT ON funcionarios BEGIN
+                INSERT INTO funcionarios_fts (rowid, identificacion, nombre)
+                VALUES (new.id, new.identificacion, new.nombre);
+            END;
+            CREATE TRIGGER IF NOT EXISTS funcionarios_fts_ad AFTER DELETE ON funcionarios BEGIN
+                INSERT INTO funcionarios_fts (funcionarios_fts, rowid, identificacion, nombre)
+                VALUES ('delete', old.id, old.identificacion, old.nombre);
+            END;
+            CREATE TRIGGER IF NOT EXISTS funcionarios_fts_au AFTER UPDATE ON funcionarios BEGIN
+                INSERT INTO funcionarios_fts (funcionarios_fts, rowid, identificacion, nombre)
+                VALUES ('delete', old.id, old.identificacion, old.nombre);
+                INSERT INTO funcionarios_fts (rowid, identificacion, nombre)
+                VALUES (new.id, new.identificacion, new.nombre);
+            END;
+        ''')
+        cursor.execute("INSERT INTO funcionarios_fts (funcionarios_fts) VALUES ('rebuild')")
+        logger.info("Índice de búsqueda de funcionarios creado")
+
     def get_connection(self):
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = sqlite3.connect(self.db_name, factory=Conexion)
             conn.execute("PRAGMA journal_mode = WAL")
             conn.execute("PRAGMA synchronous = NORMAL")
-            conn.execute("PRAGMA cache_size = -2000")
+            conn.execute(f"PRAGMA cache_size = -{config.DB_CACHE_KB}")
             return conn
 
         except Exception as e:
@@ -59,6 +303,69 @@ class Database:
             logger.error(traceback.format_exc())
             raise
 
+    def get_connection_lectura(self, reporte=False):
+        """
+        Conexión de solo lectura para consultas y reportes: no compite con la
+        ingesta por la caché de escritura y no puede tomar el lock de escritura.
+        Con reporte=True y REPORTES_SNAPSHOT_S > 0 lee de la última snapshot.
+        """
+        ruta = self.db_name
+        if reporte and config.REPORTES_SNAPSHOT_S > 0:
+            snapshot = _nombre_db(config.REPORTES_SNAPSHOT_PATH)
+            if os.path.exists(snapshot):
+                ruta = snapshot
+
+        try:
+            conn = sqlite3.connect(f"file:{os.path.abspath(ruta)}?mode=ro", uri=True, factory=Conexion)
+            conn.execute("PRAGMA query_only = 1")
+            conn.execute(f"PRAGMA mmap_size = {config.DB_MMAP_BYTES}")
+            conn.execute(f"PRAGMA cache_size = -{config.DB_CACHE_LECTURA_KB}")
+            return conn
+
+        except Exception as e:
+            logger.error(f"Error obteniendo conexión de lectura ({ruta}): {e}")
+            logger.error(traceback.format_exc())
+            raise
+
+
+def refrescar_snapshot_reportes(db_name=None):
+    """Copia consistente de la base para reportes (backup online + rename atómico)."""
+    db = Database(db_name)
+    destino = _nombre_db(config.REPORTES_SNAPSHOT_PATH)
+    temporal = destino + ".tmp"
+    origen = db.get_connection_lectura()
+
+    try:
+        copia = sqlite3.connect(temporal)
+        try:
+            # De a 256 páginas, cediendo el lock entre pasos para no frenar la ingesta
+            origen.backup(copia, pages=256, sleep=0.005)
+        finally:
+            copia.close()
+        os.replace(temporal, destino)
+        logger.info(f"Snapshot de reportes actualizada: {destino}")
+
+    finally:
+        origen.close()
+
+
+def iniciar_snapshots_reportes():
+    if config.REPORTES_SNAPSHOT_S <= 0:
+        return None
+
+    def _run():
+        while True:
+            try:
+                refrescar_snapshot_reportes()
+            except Exception as e:
+                logger.error(f"Error refrescando snapshot de reportes: {e}")
+                logger.error(traceback.format_exc())
+            time.sleep(config.REPORTES_SNAPSHOT_S)
+
+    thread = threading.Thread(target=_run, daemon=True, name="Snapshot-Reportes")
+    thread.start()
+    return thread
+
 
 def agregar_funcionario(identificacion, nombre):
     db = Database()
@@ -89,11 +396,11 @@ def agregar_funcionario(identificacion, nombre):
 
 def obtener_funcionarios():
     db = Database()
-    conn = db.get_connection()
+    conn = db.get_connection_lectura()
     cursor = conn.cursor()
 
     try:
-        cursor.execute('SELECT * FROM funcionarios ORDER BY nombre')
+        cursor.execute('SELECT identificacion, nombre FROM funcionarios ORDER BY nombre')
         funcionarios = cursor.fetchall()
         logger.info(f"Consulta funcionarios: {len(funcionarios)} encontrados")
         return funcionarios
@@ -107,13 +414,94 @@ def obtener_funcionarios():
         conn.close()
 
 
+def _consulta_fts(texto):
+    """'ana ro' → '"ana"* AND "ro"*' (cada término como prefijo)."""
+    terminos = [t.replace('"', '') for t in texto.split()]
+    return " AND ".join(f'"{t}"*' for t in terminos if t)
+
+
+def buscar_funcionarios(texto="", despues=None, limite=50):
+    """
+    Búsqueda por prefijo en nombre/identificación con paginado keyset.
+    despues = (nombre, identificacion) de la última fila de la página anterior.
+    Devuelve (funcionarios, siguiente) donde siguiente es el cursor o None.
+    """
+    limite = max(int(limite), 1)
+    db = Database()
+    conn = db.get_connection_lectura()
+    cursor = conn.cursor()
+
+    condiciones = []
+    params = []
+    consulta = _consulta_fts(texto or "")
+
+    if consulta and FTS_DISPONIBLE:
+        sql = '''
+            SELECT f.identificacion, f.nombre
+            FROM funcionarios_fts
+            JOIN funcionarios f ON f.id = funcionarios_fts.rowid
+        '''
+        condiciones.append('funcionarios_fts MATCH ?')
+        params.append(consulta)
+    else:
+        sql = 'SELECT f.identificacion, f.nombre FROM funcionarios f'
+        if consulta:
+            condiciones.append('(f.nombre LIKE ? OR f.identificacion LIKE ?)')
+            params.extend([f"{texto.strip()}%"] * 2)
+
+    if despues:
+        condiciones.append('(f.nombre, f.identificacion) > (?, ?)')
+        params.extend(despues)
+
+    if condiciones:
+        sql += ' WHERE ' + ' AND '.join(condiciones)
+    sql += ' ORDER BY f.nombre, f.identificacion LIMIT ?'
+    params.append(limite + 1)
+
+    try:
+        cursor.execute(sql, params)
+        filas = cursor.fetchall()
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = (filas[-1][1], filas[-1][0])
+        logger.info(f"Búsqueda funcionarios '{texto}': {len(filas)} resultados")
+        return filas, siguiente
+
+    except Exception as e:
+        logger.error(f"Error buscando funcionarios '{texto}': {e}")
+        logger.error(traceback.format_exc())
+        return [], None
+
+    finally:
+        conn.close()
+
+
+def contar_funcionarios():
+    db = Database()
+    conn = db.get_connection_lectura()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('SELECT COUNT(*) FROM funcionarios')
+        return cursor.fetchone()[0]
+
+    except Exception as e:
+        logger.error(f"Error contando funcionarios: {e}")
+        logger.error(traceback.format_exc())
+        return 0
+
+    finally:
+        conn.close()
+
+
 def obtener_funcionario_por_id(identificacion):
     db = Database()
-    conn = db.get_connection()
+    conn = db.get_connection_lectura()
     cursor = conn.cursor()
 
     try:
-        cursor.execute('SELECT * FROM funcionarios WHERE identificacion = ?', (identificacion,))
+        cursor.execute('SELECT identificacion, nombre FROM funcionarios WHERE identificacion = ?', (identificacion,))
         funcionario = cursor.fetchone()
         logger.info(f"Consulta funcionario {identificacion}: {'ENCONTRADO' if funcionario else 'NO ENCONTRADO'}")
         return funcionario
@@ -183,19 +571,31 @@ def eliminar_funcionario(identificacion):
         conn.close()
 
 
-def agregar_evento(identificacion, autorizado, operacion, canal):
+def agregar_evento(identificacion, autorizado, operacion, canal, puerta=None, fecha_hora=None):
+    fecha_hora = fecha_hora or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    puerta = puerta or config.PUERTA_DEFECTO
+
+    if config.JOURNAL_ACTIVO:
+        # Se confirma al quedar durable en el journal; SQLite se actualiza en segundo plano
+        import journal
+        success, mensaje = journal.registrar_evento(identificacion, fecha_hora, autorizado, operacion, canal, puerta)
+        if success:
+            logger.info(f"Evento en journal: ID={identificacion}, op={operacion}, canal={canal}, puerta={puerta}, autorizado={autorizado}")
+        else:
+            logger.error(f"Error registrando evento en journal para {identificacion}: {mensaje}")
+        return success, mensaje
+
     db = Database()
     conn = db.get_connection()
     cursor = conn.cursor()
-    fecha_hora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     try:
         cursor.execute(
-            'INSERT INTO eventos (identificacion, fecha_hora, autorizado, operacion, canal) VALUES (?, ?, ?, ?, ?)',
-            (identificacion, fecha_hora, autorizado, operacion, canal)
+            'INSERT INTO eventos (identificacion, fecha_hora, autorizado, operacion, canal, puerta) VALUES (?, ?, ?, ?, ?, ?)',
+            (identificacion, fecha_hora, autorizado, operacion, canal, puerta)
         )
         conn.commit()
-        logger.info(f"Evento agregado: ID={identificacion}, op={operacion}, canal={canal}, autorizado={autorizado}")
+        logger.info(f"Evento agregado: ID={identificacion}, op={operacion}, canal={canal}, puerta={puerta}, autorizado={autorizado}")
         return True, "Evento registrado correctamente"
 
     except Exception as e:
@@ -207,14 +607,375 @@ def agregar_evento(identificacion, autorizado, operacion, canal):
         conn.close()
 
 
-def obtener_eventos(limite=50):
+def _en_bloques(valores, tamano=500):
+    valores = list(valores)
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def agregar_eventos_lote(eventos, operacion="api"):
+    """
+    Registra un lote de eventos en una sola transacción.
+
+    eventos: lista de dicts con identificacion, canal, puerta y opcionalmente
+    fecha_hora ('YYYY-MM-DD HH:MM:SS', del cliente) y clave (idempotencia).
+    La autorización se resuelve para todo el lote con una consulta por bloque.
+    Un evento con fecha_hora anterior a EVENTOS_LOTE_VENTANA_S se guarda como
+    histórico (historico=1 en el resultado y en eventos).
+    Devuelve (success, resultados) con un dict por evento, en el mismo orden.
+    No pasa por el journal (ver journal.py); con JOURNAL_ACTIVO el commit es
+    durable antes de responder.
+    """
+    momento = datetime.now()
+    ahora = momento.strftime('%Y-%m-%d %H:%M:%S')
+    desde_tiempo_real = (momento - timedelta(seconds=config.EVENTOS_LOTE_VENTANA_S)).strftime('%Y-%m-%d %H:%M:%S')
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        if config.JOURNAL_ACTIVO:
+            # La conexión es de esta llamada: el fsync del WAL en el commit no afecta a otras
+            cursor.execute('PRAGMA synchronous = FULL')
+        # IMMEDIATE: dos lotes con la misma clave no pueden pasar los dos la verificación
+        cursor.execute('BEGIN IMMEDIATE')
+
+        identificaciones = {e["identificacion"] for e in eventos if e.get("identificacion")}
+        nombres = {}
+        for bloque in _en_bloques(identificaciones):
+            cursor.execute(
+                f'SELECT identificacion, nombre FROM funcionarios WHERE identificacion IN ({", ".join("?" * len(bloque))})',
+                bloque
+            )
+            nombres.update(cursor.fetchall())
+
+        claves = {e["clave"] for e in eventos if e.get("clave")}
+        previos = {}
+        for bloque in _en_bloques(claves):
+            cursor.execute(
+                f'SELECT clave, evento_id, autorizado FROM eventos_idempotencia WHERE clave IN ({", ".join("?" * len(bloque))})',
+                bloque
+            )
+            previos.update((clave, (evento_id, autorizado)) for clave, evento_id, autorizado in cursor.fetchall())
+
+        resultados = []
+        for evento in eventos:
+            identificacion = evento.get("identificacion")
+            clave = evento.get("clave")
+            if not identificacion:
+                resultados.append({"status": "error", "message": "Identificación requerida"})
+                continue
+
+            if clave in previos:
+                evento_id, autorizado = previos[clave]
+                resultados.append({
+                    "status": "duplicado", "id": evento_id, "autorizado": bool(autorizado),
+                    "nombre_funcionario": nombres.get(identificacion),
+                })
+                continue
+
+            fecha_hora = evento.get("fecha_hora") or ahora
+            try:
+                datetime.strptime(fecha_hora, '%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                resultados.append({"status": "error", "message": f"fecha_hora inválida: {fecha_hora}"})
+                continue
+
+            autorizado = 1 if identificacion in nombres else 0
+            puerta = evento.get("puerta") or config.PUERTA_DEFECTO
+            historico = 1 if fecha_hora < desde_tiempo_real else 0
+            cursor.execute(
+                'INSERT INTO eventos (identificacion, fecha_hora, autorizado, operacion, canal, puerta, historico) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (identificacion, fecha_hora, autorizado, operacion, evento.get("canal") or "rfid", puerta, historico)
+            )
+            evento_id = cursor.lastrowid
+            if clave:
+                cursor.execute(
+                    'INSERT INTO eventos_idempotencia (clave, evento_id, autorizado, creado) VALUES (?, ?, ?, ?)',
+                    (clave, evento_id, autorizado, ahora)
+                )
+                previos[clave] = (evento_id, autorizado)
+
+            resultados.append({
+                "status": "success", "id": evento_id, "autorizado": bool(autorizado),
+                "nombre_funcionario": nombres.get(identificacion), "fecha_hora": fecha_hora,
+                "historico": bool(historico),
+            })
+
+        # Las claves solo se recuerdan IDEMPOTENCIA_DIAS
+        limite = (datetime.now() - timedelta(days=config.IDEMPOTENCIA_DIAS)).strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('DELETE FROM eventos_idempotencia WHERE creado < ?', (limite,))
+
+        conn.commit()
+        nuevos = sum(1 for r in resultados if r["status"] == "success")
+        logger.info(f"Lote de eventos: {len(eventos)} recibidos, {nuevos} registrados")
+        return True, resultados
+
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error agregando lote de {len(eventos)} eventos: {e}")
+        logger.error(traceback.format_exc())
+        return False, f"Error: {str(e)}"
+
+    finally:
+        conn.close()
+
+
+def importar_eventos_historicos(filas, tolerancia_s=1):
+    """
+    Importa eventos recuperados de logs: filas (identificacion, fecha_hora,
+    autorizado, operacion, canal, puerta). Se descartan los que ya existen con la
+    misma identificación, operación y canal a ±tolerancia_s (la hora del log y
+    la del INSERT original pueden diferir en un segundo). Cada evento guardado
+    cubre una sola línea del log: dos líneas iguales con un solo evento en la
+    base son un duplicado y un acceso nuevo.
+    Todo el lote en una transacción. Devuelve (insertados, duplicados).
+    No pasa por el journal (ver journal.py): los logs siguen siendo la fuente.
+    """
+    formato = '%Y-%m-%d %H:%M:%S'
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        # IMMEDIATE: nadie inserta entre la verificación y la carga
+        cursor.execute('BEGIN IMMEDIATE')
+
+        # Cuántos eventos hay por clave y segundo: cada fila del log consume uno
+        # solo, así dos accesos reales en el mismo segundo no se funden en uno
+        existentes = Counter()
+        for canal in {fila[4] for fila in filas}:
+            fechas = [fila[1] for fila in filas if fila[4] == canal]
+            desde = (datetime.strptime(min(fechas), formato) - timedelta(seconds=tolerancia_s)).strftime(formato)
+            hasta = (datetime.strptime(max(fechas), formato) + timedelta(seconds=tolerancia_s)).strftime(formato)
+            cursor.execute(
+                'SELECT identificacion, operacion, fecha_hora FROM eventos '
+                'WHERE canal = ? AND fecha_hora BETWEEN ? AND ?',
+                (canal, desde, hasta)
+            )
+            existentes.update((canal, *fila) for fila in cursor.fetchall())
+
+        # Primero el mismo segundo y después los más cercanos
+        deltas = sorted(range(-tolerancia_s, tolerancia_s + 1), key=abs)
+        nuevas = []
+        for fila in filas:
+            identificacion, fecha_hora, _, operacion, canal, _ = fila
+            clave = (canal, identificacion, operacion)
+            momento = datetime.strptime(fecha_hora, formato)
+            for delta in deltas:
+                vecina = (*clave, (momento + timedelta(seconds=delta)).strftime(formato))
+                if existentes[vecina] > 0:
+                    existentes[vecina] -= 1
+                    break
+            else:
+                nuevas.append(fila)
+
+        # historico: la ocupación en memoria nunca vio estos accesos
+        cursor.executemany(
+            'INSERT INTO eventos (identificacion, fecha_hora, autorizado, operacion, canal, puerta, historico) '
+            'VALUES (?, ?, ?, ?, ?, ?, 1)',
+            nuevas
+        )
+        conn.commit()
+        return len(nuevas), len(filas) - len(nuevas)
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        conn.close()
+
+
+def aplicar_eventos_journal(lote, ultimo_seq=None):
+    """
+    Inserta un lote [(seq, evento)] del journal y guarda el último seq en la
+    misma transacción. Con lote vacío solo avanza ultimo_seq (registros rechazados).
+    """
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany(
+            'INSERT INTO eventos (identificacion, fecha_hora, autorizado, operacion, canal, puerta) VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (e['identificacion'], e['fecha_hora'], e['autorizado'], e['operacion'], e['canal'], e['puerta'])
+                for _, e in lote
+            ]
+        )
+        cursor.execute(
+            'INSERT INTO journal_estado (id, ultimo_seq) VALUES (1, ?) '
+            'ON CONFLICT(id) DO UPDATE SET ultimo_seq = excluded.ultimo_seq',
+            (ultimo_seq if ultimo_seq is not None else lote[-1][0],)
+        )
+        conn.commit()
+        if lote:
+            logger.info(f"Journal aplicado: {len(lote)} eventos (hasta seq={lote[-1][0]})")
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        conn.close()
+
+
+def obtener_ultimo_seq_journal():
     db = Database()
     conn = db.get_connection()
     cursor = conn.cursor()
 
+    try:
+        cursor.execute('SELECT ultimo_seq FROM journal_estado WHERE id = 1')
+        fila = cursor.fetchone()
+        return fila[0] if fila else 0
+
+    finally:
+        conn.close()
+
+
+def obtener_eventos_desde_id(ultimo_id, limite=500):
+    """Eventos con id > ultimo_id en orden de id (para replicación)."""
+    db = Database()
+    conn = db.get_connection_lectura()
+    cursor = conn.cursor()
+
     try:
         cursor.execute('''
-            SELECT e.*, f.nombre 
+            SELECT id, identificacion, fecha_hora, autorizado, canal, operacion, puerta
+            FROM eventos
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (ultimo_id, limite))
+        return cursor.fetchall()
+
+    except Exception as e:
+        logger.error(f"Error obteniendo eventos desde id {ultimo_id}: {e}")
+        logger.error(traceback.format_exc())
+        return []
+
+    finally:
+        conn.close()
+
+
+def obtener_watermark_replicacion(destino):
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('SELECT ultimo_id FROM replicacion_estado WHERE destino = ?', (destino,))
+        fila = cursor.fetchone()
+        return fila[0] if fila else 0
+
+    finally:
+        conn.close()
+
+
+def guardar_watermark_replicacion(destino, ultimo_id):
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            'INSERT INTO replicacion_estado (destino, ultimo_id) VALUES (?, ?) '
+            'ON CONFLICT(destino) DO UPDATE SET ultimo_id = excluded.ultimo_id',
+            (destino, ultimo_id)
+        )
+        conn.commit()
+
+    finally:
+        conn.close()
+
+
+# Operaciones que representan un paso por la puerta (rfid, /api/evento, PIC)
+OPERACIONES_ACCESO = ('rfid', 'api', 'Acceso')
+
+
+def obtener_accesos_desde_id(ultimo_id, limite=5000):
+    """
+    Accesos autorizados con id > ultimo_id, en orden: (id, identificacion,
+    fecha_hora, puerta). Sin los históricos: son los mismos que alternaron la
+    ocupación en memoria.
+    """
+    db = Database()
+    conn = db.get_connection_lectura()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('''
+            SELECT id, identificacion, fecha_hora, puerta
+            FROM eventos
+            WHERE id > ?
+              AND autorizado IN (1, '1', 'Si')
+              AND operacion IN (?, ?, ?)
+              AND canal != 'Alarma'
+              AND historico = 0
+            ORDER BY id
+            LIMIT ?
+        ''', (ultimo_id, *OPERACIONES_ACCESO, limite))
+        return cursor.fetchall()
+
+    finally:
+        conn.close()
+
+
+def cargar_checkpoint_ocupacion():
+    """Devuelve (filas, ultimo_id) del último checkpoint de ocupación."""
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('SELECT identificacion, dentro, fecha_hora, puerta FROM ocupacion_checkpoint')
+        filas = cursor.fetchall()
+        cursor.execute('SELECT ultimo_id FROM ocupacion_estado WHERE id = 1')
+        fila = cursor.fetchone()
+        return filas, (fila[0] if fila else 0)
+
+    finally:
+        conn.close()
+
+
+def guardar_checkpoint_ocupacion(filas, ultimo_id):
+    """Guarda las filas modificadas y el último id procesado en una transacción."""
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany(
+            'INSERT OR REPLACE INTO ocupacion_checkpoint (identificacion, dentro, fecha_hora, puerta) VALUES (?, ?, ?, ?)',
+            filas
+        )
+        cursor.execute(
+            'INSERT INTO ocupacion_estado (id, ultimo_id) VALUES (1, ?) '
+            'ON CONFLICT(id) DO UPDATE SET ultimo_id = excluded.ultimo_id',
+            (ultimo_id,)
+        )
+        conn.commit()
+        logger.info(f"Checkpoint de ocupación: {len(filas)} filas, hasta id={ultimo_id}")
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        conn.close()
+
+
+def obtener_eventos(limite=50):
+    db = Database()
+    conn = db.get_connection_lectura(reporte=True)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('''
+            SELECT e.id, e.identificacion, e.fecha_hora, e.autorizado, e.canal, e.operacion, f.nombre, e.puerta
             FROM eventos e 
             LEFT JOIN funcionarios f ON e.identificacion = f.identificacion
             ORDER BY e.fecha_hora DESC
@@ -235,7 +996,7 @@ def obtener_eventos(limite=50):
 
 def consultar_eventos_por_fecha(fecha_inicio, fecha_fin):
     db = Database()
-    conn = db.get_connection()
+    conn = db.get_connection_lectura(reporte=True)
     cursor = conn.cursor()
 
     fecha_inicio_completa = f"{fecha_inicio} 00:00:00"
@@ -243,7 +1004,7 @@ def consultar_eventos_por_fecha(fecha_inicio, fecha_fin):
 
     try:
         cursor.execute('''
-            SELECT e.*, f.nombre 
+            SELECT e.id, e.identificacion, e.fecha_hora, e.autorizado, e.canal, e.operacion, f.nombre, e.puerta
             FROM eventos e 
             LEFT JOIN funcionarios f ON e.identificacion = f.identificacion
             WHERE e.fecha_hora BETWEEN ? AND ?
@@ -265,19 +1026,28 @@ def consultar_eventos_por_fecha(fecha_inicio, fecha_fin):
 
 def obtener_estadisticas():
     db = Database()
-    conn = db.get_connection()
+    conn = db.get_connection_lectura(reporte=True)
     cursor = conn.cursor()
 
     try:
         cursor.execute('SELECT COUNT(*) FROM eventos')
         total_eventos = cursor.fetchone()[0]
 
-        cursor.execute('SELECT autorizado, COUNT(*) FROM eventos GROUP BY autorizado')
+        # autorizado mezcla 0/1 con 'No' (altas, bajas, alarmas): las claves van
+        # como texto, si no jsonify no puede ordenarlas
+        cursor.execute('SELECT CAST(autorizado AS TEXT), COUNT(*) FROM eventos GROUP BY 1')
         auth_stats = cursor.fetchall()
 
         cursor.execute('SELECT canal, COUNT(*) FROM eventos GROUP BY canal')
         canal_stats = cursor.fetchall()
 
+        cursor.execute('SELECT puerta, CAST(autorizado AS TEXT), COUNT(*) FROM eventos GROUP BY 1, 2')
+        puerta_stats = {}
+        for puerta, autorizado, cantidad in cursor.fetchall():
+            stats = puerta_stats.setdefault(puerta, {'total': 0, 'auth_stats': {}})
+            stats['total'] += cantidad
+            stats['auth_stats'][autorizado] = cantidad
+
         cursor.execute('SELECT COUNT(*) FROM funcionarios')
         total_funcionarios = cursor.fetchone()[0]
 
@@ -287,6 +1057,7 @@ def obtener_estadisticas():
             'total_eventos': total_eventos,
             'auth_stats': dict(auth_stats),
             'canal_stats': dict(canal_stats),
+            'puerta_stats': puerta_stats,
             'total_funcionarios': total_funcionarios
         }
 
@@ -299,43 +1070,169 @@ def obtener_estadisticas():
         conn.close()
 
 
-def obtener_intentos_fallidos_recientes(identificacion, fecha):
+def backfill_rollups():
     db = Database()
     conn = db.get_connection()
+
+    try:
+        reconstruir_rollups(conn.cursor())
+        conn.commit()
+        return conn.execute('SELECT COUNT(*) FROM eventos_rollup').fetchone()[0]
+
+    finally:
+        conn.close()
+
+
+def obtener_serie(granularidad, desde, hasta, canal=None, autorizado=None, operacion=None):
+    """Serie [(periodo, cantidad)] desde los rollups; desde/hasta = 'YYYY-MM-DD'."""
+    db = Database()
+    conn = db.get_connection_lectura(reporte=True)
     cursor = conn.cursor()
 
+    sql = '''
+        SELECT periodo, SUM(cantidad)
+        FROM eventos_rollup
+        WHERE granularidad = ? AND periodo >= ? AND periodo <= ?
+    '''
+    params = [granularidad, desde, f"{hasta} 23:59"]
+    for columna, valor in (('canal', canal), ('autorizado', autorizado), ('operacion', operacion)):
+        if valor is not None:
+            sql += f' AND {columna} = ?'
+            params.append(valor)
+    sql += ' GROUP BY periodo ORDER BY periodo'
+
     try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
 
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM eventos
-            WHERE (autorizado = 0 OR autorizado = '0')
-              AND fecha_hora >= ?
-        """, (fecha,))
+    except Exception as e:
+        logger.error(f"Error obteniendo serie {granularidad} {desde} → {hasta}: {e}")
+        logger.error(traceback.format_exc())
+        return []
+
+    finally:
+        conn.close()
+
+
+def obtener_heatmap(desde, hasta, canal=None, autorizado=None):
+    """Matriz 7×24 (día de semana 0=domingo × hora) desde los rollups por hora."""
+    db = Database()
+    conn = db.get_connection_lectura(reporte=True)
+    cursor = conn.cursor()
 
-        cantidad = cursor.fetchone()[0]
-        logger.info(f"Intentos fallidos recientes para {identificacion}: {cantidad}")
-        return cantidad
+    sql = '''
+        SELECT CAST(strftime('%w', substr(periodo, 1, 10)) AS INTEGER) AS dia_semana,
+               CAST(substr(periodo, 12, 2) AS INTEGER) AS hora,
+               SUM(cantidad)
+        FROM eventos_rollup
+        WHERE granularidad = 'hora' AND periodo >= ? AND periodo <= ?
+    '''
+    params = [desde, f"{hasta} 23:59"]
+    for columna, valor in (('canal', canal), ('autorizado', autorizado)):
+        if valor is not None:
+            sql += f' AND {columna} = ?'
+            params.append(valor)
+    sql += ' GROUP BY dia_semana, hora'
+
+    matriz = [[0] * 24 for _ in range(7)]
+    try:
+        cursor.execute(sql, params)
+        for dia_semana, hora, cantidad in cursor.fetchall():
+            matriz[dia_semana][hora] = cantidad
+        return matriz
 
     except Exception as e:
-        logger.error(f"Error al obtener intentos fallidos para {identificacion}: {e}")
+        logger.error(f"Error obteniendo heatmap {desde} → {hasta}: {e}")
         logger.error(traceback.format_exc())
-        return 0
+        return matriz
 
     finally:
         conn.close()
 
-def obtener_alarmas(limite=200):
+
+def registrar_transicion_alarma(regla, clave, activa, cantidad, puerta):
+    fecha_hora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    db = Database()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            'INSERT INTO alarmas_transiciones (regla, clave, activa, cantidad, puerta, fecha_hora) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (regla, clave, int(activa), cantidad, puerta or config.PUERTA_DEFECTO, fecha_hora)
+        )
+        conn.commit()
+        return True, "Transición registrada correctamente"
+
+    except Exception as e:
+        logger.error(f"Error registrando transición de alarma {regla}/{clave}: {e}")
+        logger.error(traceback.format_exc())
+        return False, f"Error: {str(e)}"
+
+    finally:
+        conn.close()
+
+
+def guardar_anomalias(anomalias):
+    """Reemplaza los resultados del análisis anterior por los nuevos en una transacción."""
     db = Database()
     conn = db.get_connection()
     cursor = conn.cursor()
+    generado = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    try:
+        cursor.execute('DELETE FROM anomalias')
+        cursor.executemany(
+            'INSERT INTO anomalias (tipo, identificacion, canal, fecha_hora, puntaje, detalle, generado) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(*anomalia, generado) for anomalia in anomalias]
+        )
+        conn.commit()
+        logger.info(f"Anomalías guardadas: {len(anomalias)}")
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        conn.close()
+
+
+def obtener_anomalias(limite=50):
+    db = Database()
+    conn = db.get_connection_lectura(reporte=True)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('''
+            SELECT tipo, identificacion, canal, fecha_hora, puntaje, detalle, generado
+            FROM anomalias
+            ORDER BY fecha_hora DESC
+            LIMIT ?
+        ''', (limite,))
+        return cursor.fetchall()
+
+    except Exception as e:
+        logger.error(f"Error obteniendo anomalías: {e}")
+        logger.error(traceback.format_exc())
+        return []
+
+    finally:
+        conn.close()
+
+
+def obtener_alarmas(limite=200):
+    db = Database()
+    conn = db.get_connection_lectura(reporte=True)
+    cursor = conn.cursor()
 
     try:
         cursor.execute('''
-            SELECT e.*, f.nombre
+            SELECT e.id, e.identificacion, e.fecha_hora, e.autorizado, e.canal, e.operacion, f.nombre, e.puerta
             FROM eventos e
             LEFT JOIN funcionarios f ON e.identificacion = f.identificacion
-            WHERE e.canal = 'Alarma'
+            WHERE e.canal = 'Alarma' AND e.autorizado = 'No'
             ORDER BY e.fecha_hora DESC
             LIMIT ?
         ''', (limite,))
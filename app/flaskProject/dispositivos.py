@@ -0,0 +1,431 @@
+import random
+import threading
+import time
+import logging
+import traceback
+from collections import deque
+
+import config
+import ingesta
+from hardware import BACKEND_DESHABILITADO, crear_lector_rfid
+from logger_config import setup_logger
+from pic_communicator import PICCommunicator, registrar_pic_comm
+from rfid_reader import RFIDReader
+
+logger = setup_logger("dispositivos", "dispositivos.log", level=logging.INFO)
+
+
+def parsear_puertas(spec):
+    """
+    "principal:rfid=0.0,serial=/dev/ttyAMA0;deposito:serial=/dev/ttyUSB0"
+    → [("principal", {"rfid": "0.0", "serial": "/dev/ttyAMA0"}), ("deposito", {...})]
+    """
+    puertas = []
+    for bloque in spec.split(";"):
+        bloque = bloque.strip()
+        if not bloque:
+            continue
+        puerta, _, opciones = bloque.partition(":")
+        dispositivos = {}
+        for opcion in opciones.split(","):
+            if "=" in opcion:
+                clave, valor = opcion.split("=", 1)
+                dispositivos[clave.strip()] = valor.strip()
+        puertas.append((puerta.strip(), dispositivos))
+    return puertas
+
+
+def _percentiles_ms(latencias):
+    if not latencias:
+        return {"p50_ms": None, "p95_ms": None, "max_ms": None}
+    ordenadas = sorted(latencias)
+    return {
+        "p50_ms": round(ordenadas[len(ordenadas) // 2] * 1000, 2),
+        "p95_ms": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))] * 1000, 2),
+        "max_ms": round(ordenadas[-1] * 1000, 2),
+    }
+
+
+def _hace(momento, ahora):
+    return None if momento is None else round(ahora - momento, 2)
+
+
+class DispositivoSupervisado:
+    """Un lector RFID o enlace PIC con su latido, último evento y estado de reinicio."""
+
+    def __init__(self, tipo, puerta, opcion, objeto=None):
+        self.tipo = tipo
+        self.puerta = puerta
+        self.opcion = opcion
+        self.objeto = objeto
+        self.nombre = f"{tipo}:{puerta}"
+        self.activo = objeto is not None
+        self.ultimo_latido = None
+        self.ultimo_evento = None
+        self.latencias = deque(maxlen=256)
+        self.errores_seguidos = 0
+        self.ultimo_error = None
+        self.reinicios = 0
+        self.intentos = 0
+        self.proximo_intento = 0.0
+
+    def registrar_sondeo(self, inicio, eventos):
+        ahora = time.monotonic()
+        self.ultimo_latido = ahora
+        self.latencias.append(ahora - inicio)
+        self.errores_seguidos = 0
+        if eventos:
+            self.ultimo_evento = ahora
+
+    def registrar_fallo(self, error):
+        self.errores_seguidos += 1
+        self.ultimo_error = str(error)
+        if self.errores_seguidos >= config.DISPOSITIVOS_ERRORES_MAX:
+            self.activo = False
+
+    def abrir(self):
+        """(Re)crea el backend. True si quedó operativo."""
+        if self.tipo == "rfid":
+            backend = crear_lector_rfid(spi=self.opcion)
+            if backend is None:
+                return False
+            self.objeto = RFIDReader(backend, self.puerta)
+            return True
+
+        if self.objeto is None:
+            self.objeto = PICCommunicator(puerta=self.puerta, puerto=self.opcion)
+            registrar_pic_comm(self.objeto)
+        else:
+            if self.objeto.ser is not None:
+                try:
+                    # Cerrarlo también termina su hilo lector; sondear() lanza el del puerto nuevo
+                    self.objeto.cerrar()
+                except Exception:
+                    pass
+            self.objeto.init_serial()
+        return self.objeto.ser is not None and self.objeto.ser.is_open
+
+    def resumen(self, ahora):
+        return {
+            "nombre": self.nombre,
+            "tipo": self.tipo,
+            "puerta": self.puerta,
+            "activo": self.activo,
+            "ultimo_latido_hace_s": _hace(self.ultimo_latido, ahora),
+            "ultimo_evento_hace_s": _hace(self.ultimo_evento, ahora),
+            "sondeo": _percentiles_ms(self.latencias),
+            "errores_seguidos": self.errores_seguidos,
+            "ultimo_error": self.ultimo_error,
+            "reinicios": self.reinicios,
+            "lector_latido_hace_s": (
+                _hace(self.objeto.latido_lector, ahora) if self.tipo == "pic" and self.objeto is not None else None
+            ),
+        }
+
+
+class GestorDispositivos:
+    """
+    Corre N lectores RFID y N enlaces serie con un único hilo de sondeo.
+    Cada enlace serie además tiene su hilo lector (ver PICCommunicator): solo
+    lee el puerto y contesta las consultas "Q", que no pueden esperar a un
+    sondeo frenado en otra puerta; las demás líneas las sigue entregando el
+    sondeo. El supervisor vigila su latido como el del bucle.
+    Las lecturas se entregan al pipeline de ingesta compartido (ingesta.py),
+    con la puerta como clave para mantener el orden por puerta.
+    """
+
+    def __init__(self, puertas=None):
+        self.puertas = puertas if puertas is not None else parsear_puertas(config.PUERTAS)
+        self.dispositivos = []
+        self.running = False
+        self.thread = None
+        # Cada reinicio del bucle crea un hilo nuevo; uno colgado que vuelva
+        # con una generación vieja termina sin tocar nada. El lock hace que
+        # generacion y sondeando cambien juntos.
+        self.lock = threading.Lock()
+        self.generacion = 0
+        self.sondeando = None
+        self.ultimo_latido = None
+        self.latencias = deque(maxlen=256)
+        self.reinicios_bucle = 0
+
+    @property
+    def lectores(self):
+        return [d.objeto for d in self.dispositivos if d.tipo == "rfid" and d.objeto is not None]
+
+    @property
+    def pics(self):
+        return [d.objeto for d in self.dispositivos if d.tipo == "pic" and d.objeto is not None]
+
+    def _crear_dispositivos(self):
+        for puerta, dispositivos in self.puertas:
+            if "rfid" in dispositivos:
+                dispositivo = DispositivoSupervisado("rfid", puerta, dispositivos["rfid"])
+                try:
+                    if dispositivo.abrir():
+                        dispositivo.activo = True
+                        logger.info(f"Lector RFID de puerta '{puerta}' listo (spi={dispositivos['rfid']})")
+                    else:
+                        # Backend deshabilitado: no hay nada que supervisar
+                        continue
+                except Exception as e:
+                    dispositivo.ultimo_error = str(e)
+                    logger.error(f"Error creando lector RFID de puerta '{puerta}': {e}")
+                    logger.error(traceback.format_exc())
+                self.dispositivos.append(dispositivo)
+
+            if "serial" in dispositivos and config.PIC_BACKEND != BACKEND_DESHABILITADO:
+                dispositivo = DispositivoSupervisado("pic", puerta, dispositivos["serial"])
+                try:
+                    dispositivo.activo = dispositivo.abrir()
+                except Exception as e:
+                    dispositivo.ultimo_error = str(e)
+                    logger.error(f"Error abriendo enlace PIC de puerta '{puerta}': {e}")
+                    logger.error(traceback.format_exc())
+                if dispositivo.activo:
+                    logger.info(f"Enlace PIC de puerta '{puerta}' listo ({dispositivos['serial']})")
+                else:
+                    logger.warning(f"Enlace PIC de puerta '{puerta}' no disponible; el supervisor reintentará")
+                self.dispositivos.append(dispositivo)
+
+    def iniciar(self):
+        if self.running:
+            logger.warning("Gestor de dispositivos ya está en ejecución")
+            return self.thread
+
+        self._crear_dispositivos()
+        self.running = True
+        with self.lock:
+            self._lanzar_bucle()
+        logger.info(
+            f"Gestor de dispositivos iniciado: {len(self.lectores)} lectores RFID, {len(self.pics)} enlaces PIC"
+        )
+        return self.thread
+
+    def _lanzar_bucle(self):
+        """Con self.lock tomado."""
+        self.generacion += 1
+        self.ultimo_latido = time.monotonic()
+        self.thread = threading.Thread(
+            target=self.run, args=(self.generacion,), daemon=True, name=f"Dispositivos-{self.generacion}"
+        )
+        self.thread.start()
+
+    def reiniciar_bucle(self):
+        """Abandona el hilo de sondeo actual (colgado) y lanza uno nuevo."""
+        with self.lock:
+            colgado = self.sondeando
+            self.sondeando = None
+            self.reinicios_bucle += 1
+            self._lanzar_bucle()
+        if colgado is not None:
+            colgado.activo = False
+            colgado.registrar_fallo("sondeo colgado")
+            if colgado.tipo == "rfid":
+                # El backend colgado no se vuelve a usar; abrir() crea otro
+                colgado.objeto = None
+        return colgado
+
+    def detener(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def sondear_una_vez(self, generacion=None):
+        """
+        Un ciclo de sondeo sobre todos los dispositivos; devuelve cuántas
+        lecturas encoló. Si mientras tanto el supervisor abandonó esta
+        generación, no sigue con el resto (ya los sondea el hilo nuevo).
+        """
+        generacion = self.generacion if generacion is None else generacion
+        encolados = 0
+
+        for dispositivo in self.dispositivos:
+            if not dispositivo.activo:
+                continue
+            with self.lock:
+                if generacion != self.generacion:
+                    break
+                self.sondeando = dispositivo
+            objeto = dispositivo.objeto
+            inicio = time.monotonic()
+            try:
+                if dispositivo.tipo == "rfid":
+                    identificacion = objeto.sondear()
+                    lecturas = [identificacion] if identificacion else []
+                    funcion = objeto.procesar_rfid
+                else:
+                    if not (objeto.ser and objeto.ser.is_open):
+                        raise IOError("puerto serie cerrado")
+                    lecturas = objeto.sondear()
+                    funcion = objeto.procesar_evento_pic
+
+                if generacion == self.generacion:
+                    dispositivo.registrar_sondeo(inicio, len(lecturas))
+                # Lo leído es real aunque este hilo haya quedado abandonado
+                for lectura in lecturas:
+                    ingesta.encolar(dispositivo.puerta, funcion, lectura)
+                    encolados += 1
+
+            except Exception as e:
+                dispositivo.registrar_fallo(e)
+                logger.error(f"Error sondeando {dispositivo.nombre}: {e}")
+                logger.error(traceback.format_exc())
+            finally:
+                with self.lock:
+                    # El marcador puede ser ya del hilo nuevo
+                    if generacion == self.generacion:
+                        self.sondeando = None
+
+        return encolados
+
+    def run(self, generacion=None):
+        generacion = self.generacion if generacion is None else generacion
+        while self.running and generacion == self.generacion:
+            inicio = time.monotonic()
+            encolados = self.sondear_una_vez(generacion)
+            if generacion != self.generacion:
+                break
+            self.ultimo_latido = time.monotonic()
+            self.latencias.append(self.ultimo_latido - inicio)
+            if not encolados:
+                # Las consultas del PIC no esperan este ciclo: las contesta su hilo lector
+                time.sleep(config.DISPOSITIVOS_INTERVALO)
+
+        if generacion != self.generacion:
+            logger.warning(f"Hilo de sondeo generación {generacion} abandonado")
+            return
+
+        for lector in self.lectores:
+            lector.cleanup()
+        logger.info("Gestor de dispositivos detenido")
+
+    def estado(self):
+        ahora = time.monotonic()
+        vivo = (
+            self.running
+            and self.thread is not None
+            and self.thread.is_alive()
+            and self.ultimo_latido is not None
+            and ahora - self.ultimo_latido <= config.DISPOSITIVOS_STALL_S
+        )
+        return {
+            "bucle": {
+                "vivo": vivo,
+                "ultimo_latido_hace_s": _hace(self.ultimo_latido, ahora),
+                "ciclo": _percentiles_ms(self.latencias),
+                "reinicios": self.reinicios_bucle,
+            },
+            "dispositivos": [d.resumen(ahora) for d in self.dispositivos],
+        }
+
+
+# ===============================
+# 🩺 SUPERVISOR DE LECTORES
+# ===============================
+# Vigila el latido del bucle de sondeo y de cada dispositivo:
+# - bucle sin latido por más de DISPOSITIVOS_STALL_S (p. ej. un read del
+#   MFRC522 que no vuelve): se abandona ese hilo y se lanza otro; el
+#   dispositivo que se estaba sondeando queda inactivo hasta reabrirse
+# - hilo lector de un enlace PIC sin latido por más de DISPOSITIVOS_STALL_S,
+#   o terminado con el puerto abierto: el enlace queda inactivo y se reabre
+# - dispositivo inactivo (puerto cerrado, errores seguidos, colgado): se
+#   reabre con backoff exponencial y jitter
+
+class SupervisorDispositivos:
+    def __init__(self, gestor):
+        self.gestor = gestor
+        self.running = False
+        self.thread = None
+
+    def _backoff(self, intentos):
+        espera = min(2 ** intentos, config.DISPOSITIVOS_BACKOFF_MAX)
+        return espera * random.uniform(0.5, 1.0)
+
+    def revisar(self):
+        gestor = self.gestor
+        ahora = time.monotonic()
+
+        if gestor.running and gestor.ultimo_latido is not None:
+            sin_latido = ahora - gestor.ultimo_latido
+            if sin_latido > config.DISPOSITIVOS_STALL_S or not gestor.thread.is_alive():
+                colgado = gestor.reiniciar_bucle()
+                logger.error(
+                    f"Bucle de sondeo sin latido hace {sin_latido:.1f}s "
+                    f"(colgado en {colgado.nombre if colgado else 'ninguno'}); reiniciado"
+                )
+
+        for dispositivo in gestor.dispositivos:
+            if dispositivo.tipo != "pic" or not dispositivo.activo or dispositivo.objeto is None:
+                continue
+            sin_latido = dispositivo.objeto.lector_sin_latido(ahora)
+            if sin_latido is not None and sin_latido > config.DISPOSITIVOS_STALL_S:
+                # Se reabre abajo: cerrar el puerto suelta al hilo viejo y
+                # el sondeo lanza el lector del puerto nuevo
+                dispositivo.activo = False
+                dispositivo.registrar_fallo("hilo lector caído" if sin_latido == float("inf") else "hilo lector colgado")
+                logger.error(f"Hilo lector de {dispositivo.nombre} sin latido hace {sin_latido:.1f}s; se reabre el puerto")
+
+        for dispositivo in gestor.dispositivos:
+            if dispositivo.activo:
+                dispositivo.intentos = 0
+                continue
+            if ahora < dispositivo.proximo_intento:
+                continue
+
+            dispositivo.reinicios += 1
+            try:
+                if dispositivo.abrir():
+                    dispositivo.errores_seguidos = 0
+                    dispositivo.activo = True
+                    logger.info(f"{dispositivo.nombre} reabierto (reinicio #{dispositivo.reinicios})")
+                    continue
+                dispositivo.ultimo_error = "no se pudo abrir"
+            except Exception as e:
+                dispositivo.ultimo_error = str(e)
+                logger.error(f"Error reabriendo {dispositivo.nombre}: {e}")
+                logger.error(traceback.format_exc())
+
+            espera = self._backoff(dispositivo.intentos)
+            dispositivo.intentos += 1
+            dispositivo.proximo_intento = ahora + espera
+            logger.warning(f"{dispositivo.nombre} sigue caído; próximo intento en {espera:.1f}s")
+
+    def run(self):
+        while self.running:
+            time.sleep(config.DISPOSITIVOS_SUPERVISION_S)
+            try:
+                self.revisar()
+            except Exception as e:
+                logger.error(f"Error en supervisor de dispositivos: {e}")
+                logger.error(traceback.format_exc())
+
+    def iniciar(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="Supervisor")
+        self.thread.start()
+        return self.thread
+
+    def detener(self):
+        self.running = False
+
+
+gestor = None
+supervisor = None
+
+
+def iniciar_dispositivos():
+    global gestor, supervisor
+    if gestor is None:
+        gestor = GestorDispositivos()
+    gestor.iniciar()
+    if supervisor is None:
+        supervisor = SupervisorDispositivos(gestor)
+        supervisor.iniciar()
+    return gestor
+
+
+def estado_dispositivos():
+    if gestor is None:
+        return {"bucle": {"vivo": False}, "dispositivos": []}
+    return gestor.estado()
@@ -0,0 +1,211 @@
+import atexit
+import os
+import queue
+import re
+import subprocess
+import threading
+import logging
+import traceback
+
+import config
+from logger_config import setup_logger
+
+logger = setup_logger("hardware", "hardware.log", level=logging.INFO)
+
+# ===============================
+# 🔌 BACKENDS DE HARDWARE (CARGA PEREZOSA)
+# ===============================
+# Los drivers (RPi.GPIO, mfrc522, pyserial) se importan recién al crear el
+# backend real, así la app arranca rápido y funciona fuera de la Raspberry Pi.
+
+BACKEND_REAL = "real"
+BACKEND_SIMULADO = "simulado"
+BACKEND_FIRMWARE = "firmware"
+BACKEND_DESHABILITADO = "deshabilitado"
+
+
+class LectorRFIDReal:
+    """MFRC522 conectado por SPI (spi = "bus.device")."""
+
+    def __init__(self, spi="0.0"):
+        import RPi.GPIO as GPIO
+        from mfrc522 import SimpleMFRC522, MFRC522
+
+        bus, device = (int(x) for x in spi.split("."))
+
+        GPIO.setwarnings(False)
+        self.gpio = GPIO
+        # SimpleMFRC522() abre e inicializa siempre el SPI 0.0: se arma sin su
+        # __init__ y con el MFRC522 de la dirección configurada
+        self.reader = SimpleMFRC522.__new__(SimpleMFRC522)
+        self.reader.READER = MFRC522(bus=bus, device=device)
+
+    def leer(self):
+        id, _ = self.reader.read()
+        return id
+
+    def leer_no_bloqueante(self):
+        return self.reader.read_id_no_block()
+
+    def cerrar(self):
+        self.gpio.cleanup()
+
+
+class LectorRFIDSimulado:
+    """Lector sin hardware: las tarjetas se inyectan con inyectar()."""
+
+    def __init__(self, spi=None, timeout=1.0):
+        self.tarjetas = queue.Queue()
+        self.timeout = timeout
+
+    def inyectar(self, id):
+        self.tarjetas.put(id)
+
+    def leer(self):
+        try:
+            return self.tarjetas.get(timeout=self.timeout)
+        except queue.Empty:
+            return None
+
+    def leer_no_bloqueante(self):
+        try:
+            return self.tarjetas.get_nowait()
+        except queue.Empty:
+            return None
+
+    def cerrar(self):
+        pass
+
+
+BACKENDS_RFID = {
+    BACKEND_REAL: LectorRFIDReal,
+    BACKEND_SIMULADO: LectorRFIDSimulado,
+}
+
+
+def crear_lector_rfid(backend=None, **opciones):
+    """Devuelve el backend RFID configurado, o None si está deshabilitado."""
+    backend = backend or config.RFID_BACKEND
+    if backend == BACKEND_DESHABILITADO:
+        logger.info("Backend RFID deshabilitado por configuración")
+        return None
+
+    try:
+        clase = BACKENDS_RFID[backend]
+    except KeyError:
+        raise ValueError(f"Backend RFID desconocido: {backend}")
+
+    lector = clase(**opciones)
+    logger.info(f"Backend RFID creado: {backend} {opciones}")
+    return lector
+
+
+def abrir_puerto_serial(backend=None, puerto=None, baudrate=None):
+    """Abre el enlace serial con el PIC según el backend, o None si está deshabilitado."""
+    backend = backend or config.PIC_BACKEND
+    if backend == BACKEND_DESHABILITADO:
+        logger.info("Backend serial deshabilitado por configuración")
+        return None
+
+    import serial
+
+    try:
+        if backend == BACKEND_SIMULADO:
+            # Loopback de pyserial: lo que se escribe se vuelve a leer
+            ser = serial.serial_for_url("loop://", timeout=1)
+        elif backend == BACKEND_FIRMWARE:
+            ser = serial.serial_for_url(
+                _lanzar_simulador_firmware(puerto or config.SERIAL_PORT),
+                baudrate=baudrate or config.BAUD_RATE,
+                timeout=1,
+            )
+        elif backend == BACKEND_REAL:
+            ser = serial.serial_for_url(
+                puerto or config.SERIAL_PORT,
+                baudrate=baudrate or config.BAUD_RATE,
+                parity=serial.PARITY_NONE,
+                stopbits=serial.STOPBITS_ONE,
+                bytesize=serial.EIGHTBITS,
+                timeout=1,
+            )
+        else:
+            raise ValueError(f"Backend serial desconocido: {backend}")
+
+        logger.info(f"Puerto serial abierto ({backend}): {ser.port}")
+        return ser
+
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Error abriendo puerto serial ({backend}): {e}")
+        logger.error(traceback.format_exc())
+        return None
+
+
+# ===============================
+# 🧪 FIRMWARE SIMULADO
+# ===============================
+# PIC_BACKEND=firmware corre main.c compilado para Linux (simulador/) y abre
+# su pty como si fuera el puerto del PIC: mismo protocolo, EEPROM, reloj y
+# tiempos de la UART a 9600 baudios. Un proceso por puerto; reabrir el puerto
+# reinicia el PIC (la EEPROM se conserva si hay FIRMWARE_EEPROM_DIR).
+
+_simuladores = {}
+_simuladores_lock = threading.Lock()
+
+
+def _lanzar_simulador_firmware(puerto):
+    """Arranca el simulador para ese puerto y devuelve la ruta de su pty."""
+    if not os.path.exists(config.FIRMWARE_SIMULADOR):
+        raise IOError(f"No existe {config.FIRMWARE_SIMULADOR}: compilarlo con 'make -C simulador'")
+
+    comando = [config.FIRMWARE_SIMULADOR, "--pty"]
+    if config.FIRMWARE_EEPROM_DIR:
+        os.makedirs(config.FIRMWARE_EEPROM_DIR, exist_ok=True)
+        nombre = re.sub(r"[^\w.-]", "_", puerto).strip("_") or "pic"
+        comando += ["--eeprom", os.path.join(config.FIRMWARE_EEPROM_DIR, f"{nombre}.eeprom")]
+
+    with _simuladores_lock:
+        anterior = _simuladores.pop(puerto, None)
+        if anterior is not None:
+            _terminar(anterior)
+
+        proceso = subprocess.Popen(comando, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        linea = proceso.stdout.readline().strip()
+        if not linea.startswith("pty="):
+            _terminar(proceso)
+            raise IOError(f"El simulador de firmware no arrancó (salida: {linea!r})")
+        _simuladores[puerto] = proceso
+
+    logger.info(f"Simulador de firmware para {puerto}: pid {proceso.pid}, {linea[4:]}")
+    return linea[4:]
+
+
+def _terminar(proceso):
+    if proceso.poll() is None:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def inyectar_lectura_firmware(codigo, puerto=None):
+    """Simula una lectura del código de barras en el PIC simulado. False si no corre."""
+    proceso = _simuladores.get(puerto or config.SERIAL_PORT)
+    if proceso is None or proceso.poll() is not None:
+        return False
+    try:
+        proceso.stdin.write(f"{codigo}\r\n")
+        proceso.stdin.flush()
+        return True
+    except (BrokenPipeError, ValueError):
+        return False
+
+
+@atexit.register
+def detener_simuladores():
+    with _simuladores_lock:
+        for proceso in _simuladores.values():
+            _terminar(proceso)
+        _simuladores.clear()
@@ -0,0 +1,58 @@
+import logging
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import config
+from logger_config import setup_logger
+
+logger = setup_logger("ingesta", "ingesta.log", level=logging.INFO)
+
+# ===============================
+# 📥 PIPELINE DE INGESTA COMPARTIDO
+# ===============================
+# Todos los dispositivos (lectores RFID y enlaces serie de cada puerta) entregan
+# sus eventos acá. Un pool chico de hilos procesa la cola; cada clave (la puerta)
+# se asigna siempre al mismo hilo, así los eventos de una puerta se procesan en
+# orden (p. ej. Alta antes que Baja) sin crear un hilo por lectura.
+
+_workers = None
+_workers_lock = threading.Lock()
+
+
+def _obtener_workers():
+    global _workers
+    if _workers is None:
+        with _workers_lock:
+            if _workers is None:
+                _workers = [
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"Ingesta-{i}")
+                    for i in range(max(config.INGESTA_HILOS, 1))
+                ]
+                logger.info(f"Pipeline de ingesta iniciado con {len(_workers)} hilos")
+    return _workers
+
+
+def _ejecutar(funcion, args):
+    try:
+        return funcion(*args)
+    except Exception as e:
+        logger.error(f"Error en ingesta ({getattr(funcion, '__name__', funcion)}): {e}")
+        logger.error(traceback.format_exc())
+        return None
+
+
+def encolar(clave, funcion, *args):
+    """Encola funcion(*args); las tareas con la misma clave se ejecutan en orden."""
+    workers = _obtener_workers()
+    worker = workers[zlib.crc32(str(clave).encode("utf-8")) % len(workers)]
+    return worker.submit(_ejecutar, funcion, args)
+
+
+def detener(esperar=True):
+    global _workers
+    with _workers_lock:
+        workers, _workers = _workers, None
+    for worker in workers or []:
+        worker.shutdown(wait=esperar)
@@ -0,0 +1,381 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import logging
+import traceback
+
+import config
+from logger_config import setup_logger
+
+logger = setup_logger("journal", "journal.log", level=logging.INFO)
+
+# ===============================
+# 📒 JOURNAL APPEND-ONLY DE EVENTOS
+# ===============================
+# Cada evento se escribe primero en un segmento append-only con checksum.
+# Un hilo escritor agrupa los eventos pendientes y hace un solo fsync por grupo
+# (group commit); recién ahí se confirma el evento al llamador. Otro hilo aplica
+# los eventos a SQLite en lotes y guarda el último seq aplicado en la misma
+# transacción, así el replay al reiniciar es idempotente.
+#
+# Un lote que sigue fallando después de JOURNAL_REINTENTOS se aplica evento
+# por evento; el que igual falla (registro inválido, esquema distinto) se
+# aparta en rechazados.jsonl para no trabar a los siguientes.
+#
+# Solo pasa por acá el evento individual (database.agregar_evento). Quedan
+# afuera, a propósito:
+# - agregar_eventos_lote: tiene que devolver el id y la respuesta de
+#   idempotencia de la misma transacción, así que escribe directo a SQLite;
+#   con el journal activo esa transacción se confirma con synchronous=FULL
+#   (un fsync por lote) y sigue sin responder antes de ser durable.
+# - importar_eventos_historicos: la fuente son los logs, que siguen en disco;
+#   si se pierde la carga se vuelve a correr y deduplica.
+#
+# Registro: [largo u32][crc32 u32][seq u64][payload JSON]
+
+CABECERA = struct.Struct("<IIQ")
+PREFIJO_SEGMENTO = "segmento-"
+SUFIJO_SEGMENTO = ".log"
+ARCHIVO_RECHAZADOS = "rechazados.jsonl"
+
+
+def _nombre_segmento(numero):
+    return f"{PREFIJO_SEGMENTO}{numero:08d}{SUFIJO_SEGMENTO}"
+
+
+def _numero_segmento(nombre):
+    return int(nombre[len(PREFIJO_SEGMENTO):-len(SUFIJO_SEGMENTO)])
+
+
+def codificar_registro(seq, evento):
+    payload = json.dumps(evento, separators=(",", ":")).encode("utf-8")
+    return CABECERA.pack(len(payload), zlib.crc32(payload), seq) + payload
+
+
+def leer_segmento(ruta):
+    """
+    Itera (seq, evento, offset_fin) de un segmento. Se detiene en el primer
+    registro incompleto o con checksum inválido (escritura cortada).
+    """
+    with open(ruta, "rb") as f:
+        offset = 0
+        while True:
+            cabecera = f.read(CABECERA.size)
+            if len(cabecera) < CABECERA.size:
+                return
+            largo, crc, seq = CABECERA.unpack(cabecera)
+            payload = f.read(largo)
+            if len(payload) < largo or zlib.crc32(payload) != crc:
+                logger.warning(f"Registro inválido en {ruta} offset={offset}; se descarta la cola")
+                return
+            offset += CABECERA.size + largo
+            yield seq, json.loads(payload), offset
+
+
+class _Pendiente:
+    __slots__ = ("datos", "seq", "evento", "listo", "ok")
+
+    def __init__(self, datos, seq, evento):
+        self.datos = datos
+        self.seq = seq
+        self.evento = evento
+        self.listo = threading.Event()
+        self.ok = False
+
+
+class Journal:
+    def __init__(self, directorio=None, aplicar=None):
+        """
+        aplicar(lote) recibe una lista de (seq, evento) y debe insertarlos en
+        SQLite junto con el último seq en una sola transacción.
+        """
+        self.directorio = directorio or config.JOURNAL_DIR
+        self.aplicar = aplicar
+        self.lock = threading.Condition()
+        self.pendientes = []
+        self.para_aplicar = queue.Queue()
+        self.seq = 0
+        self.segmento = None
+        self.numero_segmento = 0
+        self.cerrados = []
+        self.running = False
+        self.escritos = 0
+        self.fsyncs = 0
+        self.rechazados = 0
+        # Último seq durable y último aplicado a SQLite (para esperar_aplicado)
+        self.confirmado = 0
+        self.aplicado = 0
+        self.cond_aplicado = threading.Condition()
+
+    # ---------- arranque y replay ----------
+
+    def _segmentos(self):
+        nombres = [
+            n for n in os.listdir(self.directorio)
+            if n.startswith(PREFIJO_SEGMENTO) and n.endswith(SUFIJO_SEGMENTO)
+        ]
+        return sorted(nombres, key=_numero_segmento)
+
+    def abrir(self, ultimo_aplicado):
+        """
+        Lee lo que quedó en el journal y deja listo un segmento para escribir.
+        Lo no aplicado queda primero en la cola del aplicador: el replay corre
+        en su hilo, no en el de quien abre el journal.
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        self.seq = ultimo_aplicado
+        self.aplicado = ultimo_aplicado
+        pendientes = []
+
+        for nombre in self._segmentos():
+            ruta = os.path.join(self.directorio, nombre)
+            fin_valido = 0
+            ultimo_del_segmento = 0
+            for seq, evento, offset in leer_segmento(ruta):
+                fin_valido = offset
+                ultimo_del_segmento = seq
+                self.seq = max(self.seq, seq)
+                if seq > ultimo_aplicado:
+                    pendientes.append((seq, evento))
+                    self.confirmado = seq
+            if fin_valido < os.path.getsize(ruta):
+                with open(ruta, "r+b") as f:
+                    f.truncate(fin_valido)
+            self.numero_segmento = _numero_segmento(nombre)
+            # Se borra cuando el aplicador pase su último seq
+            self.cerrados.append((nombre, ultimo_del_segmento))
+
+        if pendientes:
+            logger.info(f"Replay del journal: {len(pendientes)} eventos sin aplicar")
+            self.para_aplicar.put(pendientes)
+
+        self._rotar()
+        self._borrar_cerrados(ultimo_aplicado)
+
+    def _rotar(self):
+        if self.segmento is not None:
+            self.segmento.close()
+        self.numero_segmento += 1
+        ruta = os.path.join(self.directorio, _nombre_segmento(self.numero_segmento))
+        self.segmento = open(ruta, "ab")
+        self._fsync_directorio()
+
+    def _fsync_directorio(self):
+        try:
+            fd = os.open(self.directorio, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    # ---------- escritura (group commit) ----------
+
+    def registrar(self, evento, timeout=None):
+        """
+        Agrega el evento y espera a que sea durable. Devuelve (success, mensaje).
+        Con timeout: si el escritor todavía no lo tomó se retira y es un error
+        (el llamador reintenta); si ya se está escribiendo se espera el
+        resultado del fsync. Nunca se confirma antes de que sea durable.
+        """
+        with self.lock:
+            if not self.running:
+                return False, "Error: journal no iniciado"
+            self.seq += 1
+            pendiente = _Pendiente(codificar_registro(self.seq, evento), self.seq, evento)
+            self.pendientes.append(pendiente)
+            self.lock.notify()
+
+        if not pendiente.listo.wait(timeout or config.JOURNAL_TIMEOUT):
+            with self.lock:
+                if pendiente in self.pendientes:
+                    self.pendientes.remove(pendiente)
+                    return False, "Error: timeout esperando el journal"
+            if not pendiente.listo.is_set():
+                logger.warning(f"Journal lento: evento seq={pendiente.seq} esperando el fsync en curso")
+                pendiente.listo.wait()
+        if not pendiente.ok:
+            return False, "Error: no se pudo escribir el journal"
+        return True, "Evento registrado correctamente"
+
+    def _escritor(self):
+        ventana = config.JOURNAL_GRUPO_MS / 1000
+        while True:
+            with self.lock:
+                while self.running and not self.pendientes:
+                    self.lock.wait()
+                if not self.running and not self.pendientes:
+                    return
+            # Ventana corta para juntar más eventos en el mismo fsync
+            if ventana > 0:
+                time.sleep(ventana)
+            with self.lock:
+                grupo, self.pendientes = self.pendientes, []
+            if not grupo:
+                continue
+
+            ok = False
+            inicio = self.segmento.tell()
+            try:
+                self.segmento.write(b"".join(p.datos for p in grupo))
+                self.segmento.flush()
+                os.fsync(self.segmento.fileno())
+                self.fsyncs += 1
+                self.escritos += len(grupo)
+                ok = True
+            except Exception as e:
+                logger.error(f"Error escribiendo el journal: {e}")
+                logger.error(traceback.format_exc())
+                # No dejar un registro a medias delante de los siguientes
+                try:
+                    self.segmento.seek(inicio)
+                    self.segmento.truncate(inicio)
+                except Exception:
+                    pass
+
+            if ok:
+                self.confirmado = grupo[-1].seq
+            for p in grupo:
+                p.ok = ok
+                p.listo.set()
+            if ok:
+                self.para_aplicar.put([(p.seq, p.evento) for p in grupo])
+                if self.segmento.tell() >= config.JOURNAL_SEGMENTO_BYTES:
+                    with self.lock:
+                        self.cerrados.append((_nombre_segmento(self.numero_segmento), grupo[-1].seq))
+                    self._rotar()
+
+    # ---------- aplicación a SQLite ----------
+
+    def _aplicar_lote(self, lote):
+        for intento in range(config.JOURNAL_REINTENTOS):
+            try:
+                self.aplicar(lote)
+                return
+            except Exception as e:
+                # La base puede estar bloqueada; el evento ya es durable, se reintenta
+                logger.error(
+                    f"Error aplicando lote del journal ({len(lote)} eventos, intento {intento + 1}): {e}"
+                )
+                time.sleep(min(2 ** intento, 30))
+
+        # Sigue fallando: uno por uno, para aislar el registro que no entra
+        fallido = None
+        for seq, evento in lote:
+            try:
+                self.aplicar([(seq, evento)])
+                fallido = None
+            except Exception as e:
+                self._rechazar(seq, evento, e)
+                fallido = seq
+        if fallido is not None:
+            # El último del lote fue rechazado: avanzar el seq para que el replay no lo repita
+            try:
+                self.aplicar([], fallido)
+            except Exception as e:
+                logger.error(f"No se pudo avanzar el seq aplicado a {fallido}: {e}")
+
+    def _rechazar(self, seq, evento, error):
+        self.rechazados += 1
+        logger.error(f"Evento seq={seq} rechazado al aplicar ({error}); se aparta en {ARCHIVO_RECHAZADOS}")
+        try:
+            with open(os.path.join(self.directorio, ARCHIVO_RECHAZADOS), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"seq": seq, "evento": evento, "error": str(error)}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.error(f"Error escribiendo {ARCHIVO_RECHAZADOS}: {e}")
+            logger.error(traceback.format_exc())
+
+    def _aplicador(self):
+        fin = False
+        while not fin:
+            lote = self.para_aplicar.get()
+            if lote is None:
+                return
+
+            # Juntar lo que haya en cola en una sola transacción
+            while True:
+                try:
+                    siguiente = self.para_aplicar.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    fin = True
+                    break
+                lote.extend(siguiente)
+
+            self._aplicar_lote(lote)
+            with self.cond_aplicado:
+                self.aplicado = lote[-1][0]
+                self.cond_aplicado.notify_all()
+            self._borrar_cerrados(lote[-1][0])
+
+    def esperar_aplicado(self, timeout=None):
+        """Espera a que SQLite tenga todo lo confirmado hasta ahora. True si llegó a tiempo."""
+        objetivo = self.confirmado
+        with self.cond_aplicado:
+            return self.cond_aplicado.wait_for(lambda: self.aplicado >= objetivo, timeout)
+
+    def _borrar_cerrados(self, aplicado):
+        with self.lock:
+            borrar = [nombre for nombre, ultimo in self.cerrados if ultimo <= aplicado]
+            self.cerrados = [(n, u) for n, u in self.cerrados if u > aplicado]
+        for nombre in borrar:
+            os.remove(os.path.join(self.directorio, nombre))
+            logger.info(f"Segmento aplicado y eliminado: {nombre}")
+
+    def iniciar(self):
+        self.running = True
+        self.hilo_escritor = threading.Thread(target=self._escritor, daemon=True, name="Journal-Escritor")
+        self.hilo_escritor.start()
+        self.hilo_aplicador = threading.Thread(target=self._aplicador, daemon=True, name="Journal-Aplicador")
+        self.hilo_aplicador.start()
+        logger.info(f"Journal iniciado en {self.directorio} (seq={self.seq})")
+
+    def detener(self, timeout=5):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        self.hilo_escritor.join(timeout)
+        self.para_aplicar.put(None)
+        self.hilo_aplicador.join(timeout)
+        if self.segmento is not None:
+            self.segmento.close()
+        logger.info(
+            f"Journal detenido (escritos={self.escritos}, fsyncs={self.fsyncs}, rechazados={self.rechazados})"
+        )
+
+
+journal = None
+_journal_lock = threading.Lock()
+
+
+def obtener_journal():
+    """Crea, hace replay e inicia el journal la primera vez que se usa."""
+    global journal
+    if journal is None:
+        with _journal_lock:
+            if journal is None:
+                import database
+                j = Journal(aplicar=database.aplicar_eventos_journal)
+                j.abrir(database.obtener_ultimo_seq_journal())
+                j.iniciar()
+                journal = j
+    return journal
+
+
+def registrar_evento(identificacion, fecha_hora, autorizado, operacion, canal, puerta):
+    return obtener_journal().registrar({
+        "identificacion": identificacion,
+        "fecha_hora": fecha_hora,
+        "autorizado": autorizado,
+        "operacion": operacion,
+        "canal": canal,
+        "puerta": puerta,
+    })
@@ -2,9 +2,10 @@ import logging
 from logging.handlers import RotatingFileHandler
 import os
 
-# Carpeta logs
-LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+# Carpeta logs (LOG_DIR permite mandarlos a otro lado, p. ej. en soak.py)
+LOG_DIR = os.environ.get("LOG_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10_000_000))
 
 def setup_logger(name: str, filename: str, level=logging.INFO) -> logging.Logger:
     """
@@ -25,7 +26,7 @@ def setup_logger(name: str, filename: str, level=logging.INFO) -> logging.Logger
 
     handler = RotatingFileHandler(
         log_path,
-        maxBytes=10_000_000,   # 10 MB
+        maxBytes=LOG_MAX_BYTES,   # 10 MB por defecto
         backupCount=1,         # 1 archivos de backup
         encoding="utf-8"
     )
@@ -0,0 +1,193 @@
+import threading
+import time
+import logging
+import traceback
+from collections import Counter
+from datetime import datetime
+
+import config
+from database import (
+    obtener_accesos_desde_id,
+    cargar_checkpoint_ocupacion,
+    guardar_checkpoint_ocupacion,
+)
+from logger_config import setup_logger
+
+logger = setup_logger("ocupacion", "ocupacion.log", level=logging.INFO)
+
+# ===============================
+# 🏢 OCUPACIÓN: QUIÉN ESTÁ DENTRO
+# ===============================
+# Cada acceso autorizado alterna el estado de la persona (entra / sale).
+# El estado vive en memoria con contadores, así "¿está dentro?" y "¿cuántos
+# hay?" son O(1). Periódicamente se hace un checkpoint en SQLite derivado de
+# los eventos (hasta un id dado), y al arrancar se reconstruye desde el último
+# checkpoint más los eventos posteriores. Los eventos históricos (replay de
+# logs) entran con id nuevo pero no alternan el estado en memoria, así que el
+# checkpoint tampoco los cuenta.
+
+
+class EstadoOcupacion:
+    def __init__(self):
+        # identificacion → (dentro, fecha_hora, puerta)
+        self.personas = {}
+        self.total = 0
+        self.por_puerta = Counter()
+        self.modificados = set()
+
+    def cargar(self, filas):
+        for identificacion, dentro, fecha_hora, puerta in filas:
+            self.personas[identificacion] = (bool(dentro), fecha_hora, puerta)
+            if dentro:
+                self.total += 1
+                self.por_puerta[puerta] += 1
+
+    def aplicar(self, identificacion, fecha_hora, puerta):
+        anterior = self.personas.get(identificacion)
+        if anterior and anterior[0]:
+            # Estaba dentro: sale (se descuenta de la puerta por la que entró)
+            self.total -= 1
+            self.por_puerta[anterior[2]] -= 1
+            if self.por_puerta[anterior[2]] <= 0:
+                del self.por_puerta[anterior[2]]
+            self.personas[identificacion] = (False, fecha_hora, puerta)
+        else:
+            self.total += 1
+            self.por_puerta[puerta] += 1
+            self.personas[identificacion] = (True, fecha_hora, puerta)
+        self.modificados.add(identificacion)
+        return self.personas[identificacion][0]
+
+    def filas_modificadas(self):
+        filas = [
+            (identificacion, int(self.personas[identificacion][0]), *self.personas[identificacion][1:])
+            for identificacion in self.modificados
+        ]
+        self.modificados = set()
+        return filas
+
+
+class MotorOcupacion:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.estado = EstadoOcupacion()
+        # Copia derivada de la base, usada solo para los checkpoints
+        self.checkpoint = EstadoOcupacion()
+        self.checkpoint_id = 0
+        self.running = False
+        self.thread = None
+
+    # ---------- checkpoint / reconstrucción ----------
+
+    def _avanzar_checkpoint(self):
+        """Aplica a la copia de checkpoint los eventos nuevos de la base y la persiste."""
+        while True:
+            accesos = obtener_accesos_desde_id(self.checkpoint_id)
+            for id, identificacion, fecha_hora, puerta in accesos:
+                self.checkpoint.aplicar(identificacion, fecha_hora, puerta)
+                self.checkpoint_id = id
+            if len(accesos) < 5000:
+                break
+
+        filas = self.checkpoint.filas_modificadas()
+        if filas:
+            guardar_checkpoint_ocupacion(filas, self.checkpoint_id)
+
+    def reconstruir(self):
+        inicio = time.perf_counter()
+        if config.JOURNAL_ACTIVO:
+            # Con journal, lo confirmado puede no estar todavía en eventos
+            import journal
+            if journal.journal is not None and not journal.journal.esperar_aplicado(config.JOURNAL_TIMEOUT):
+                logger.warning("El journal no terminó de aplicarse: la ocupación puede omitir accesos recientes")
+        filas, self.checkpoint_id = cargar_checkpoint_ocupacion()
+        self.checkpoint = EstadoOcupacion()
+        self.checkpoint.cargar(filas)
+        self._avanzar_checkpoint()
+
+        estado = EstadoOcupacion()
+        estado.personas = dict(self.checkpoint.personas)
+        estado.total = self.checkpoint.total
+        estado.por_puerta = Counter(self.checkpoint.por_puerta)
+        with self.lock:
+            self.estado = estado
+
+        logger.info(
+            f"Ocupación reconstruida hasta id={self.checkpoint_id}: {estado.total} personas dentro "
+            f"({(time.perf_counter() - inicio) * 1000:.1f} ms)"
+        )
+
+    def run(self):
+        while self.running:
+            time.sleep(config.OCUPACION_CHECKPOINT_S)
+            try:
+                self._avanzar_checkpoint()
+            except Exception as e:
+                logger.error(f"Error en checkpoint de ocupación: {e}")
+                logger.error(traceback.format_exc())
+
+    def iniciar(self):
+        self.reconstruir()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="Ocupacion")
+        self.thread.start()
+
+    # ---------- stream de accesos y consultas O(1) ----------
+
+    def registrar_acceso(self, identificacion, puerta=None, fecha_hora=None):
+        fecha_hora = fecha_hora or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        puerta = puerta or config.PUERTA_DEFECTO
+        with self.lock:
+            dentro = self.estado.aplicar(identificacion, fecha_hora, puerta)
+            self.estado.modificados.clear()
+        logger.info(f"{identificacion} {'ENTRA' if dentro else 'SALE'} por '{puerta}'")
+        return dentro
+
+    def consultar(self, identificacion):
+        with self.lock:
+            estado = self.estado.personas.get(identificacion)
+        if estado is None:
+            return {"identificacion": identificacion, "dentro": False, "desde": None, "puerta": None}
+        dentro, fecha_hora, puerta = estado
+        return {"identificacion": identificacion, "dentro": dentro, "desde": fecha_hora, "puerta": puerta}
+
+    def resumen(self):
+        with self.lock:
+            return {"total": self.estado.total, "por_puerta": dict(self.estado.por_puerta)}
+
+    def presentes(self):
+        with self.lock:
+            return [
+                {"identificacion": identificacion, "desde": fecha_hora, "puerta": puerta}
+                for identificacion, (dentro, fecha_hora, puerta) in self.estado.personas.items()
+                if dentro
+            ]
+
+
+motor = None
+_motor_lock = threading.Lock()
+
+
+def obtener_ocupacion():
+    """Crea y reconstruye el motor la primera vez que se usa."""
+    global motor
+    if motor is None:
+        with _motor_lock:
+            if motor is None:
+                m = MotorOcupacion()
+                m.iniciar()
+                motor = m
+    return motor
+
+
+def registrar_acceso(identificacion, puerta=None, fecha_hora=None):
+    try:
+        if motor is None:
+            # La reconstrucción inicial ya incluye este acceso: se guardó antes en
+            # eventos (con journal, reconstruir() espera a que se aplique)
+            return obtener_ocupacion().consultar(identificacion)["dentro"]
+        return motor.registrar_acceso(identificacion, puerta, fecha_hora)
+    except Exception as e:
+        logger.error(f"Error registrando acceso de {identificacion} en ocupación: {e}")
+        logger.error(traceback.format_exc())
+        return None
@@ -0,0 +1,305 @@
+import math
+import sqlite3
+import sys
+import threading
+import time
+import logging
+import traceback
+from collections import Counter
+
+from flask import g, request, jsonify, before_render_template, template_rendered
+from flask.json.provider import DefaultJSONProvider
+
+import config
+from logger_config import setup_logger
+
+logger = setup_logger("perfilado", "perfilado.log", level=logging.INFO)
+slow_logger = setup_logger("slow_query", "slow_query.log", level=logging.INFO)
+
+# Acumuladores por hilo: cada request de Flask corre en su propio hilo
+_local = threading.local()
+
+
+def _acumular(campo, segundos):
+    if getattr(_local, "activo", False):
+        setattr(_local, campo, getattr(_local, campo, 0.0) + segundos)
+
+
+# ===============================
+# 🐢 SLOW-QUERY LOG (SQLite)
+# ===============================
+
+def _registrar_consulta(cursor, sql, params, duracion, filas):
+    _acumular("db", duracion)
+
+    if duracion * 1000 < config.PERFILADO_UMBRAL_MS:
+        return
+
+    texto = " ".join(sql.split())
+    slow_logger.warning(f"{duracion * 1000:.1f} ms, filas={filas}: {texto} params={params!r}")
+
+    if config.PERFILADO_EXPLAIN and texto.upper().startswith("SELECT"):
+        try:
+            plan = sqlite3.Cursor(cursor.connection).execute(
+                "EXPLAIN QUERY PLAN " + sql, params
+            ).fetchall()
+            for fila in plan:
+                slow_logger.warning(f"    plan: {fila[-1]}")
+        except Exception as e:
+            slow_logger.error(f"No se pudo obtener EXPLAIN QUERY PLAN: {e}")
+
+
+class CursorPerfilado(sqlite3.Cursor):
+    """Cursor que mide execute + fetch y reporta las consultas lentas."""
+
+    _pendiente = None
+
+    def _cerrar_pendiente(self, filas):
+        if self._pendiente is not None:
+            sql, params, duracion = self._pendiente
+            self._pendiente = None
+            _registrar_consulta(self, sql, params, duracion, filas)
+
+    def execute(self, sql, params=()):
+        self._cerrar_pendiente(-1)
+        inicio = time.perf_counter()
+        resultado = super().execute(sql, params)
+        duracion = time.perf_counter() - inicio
+
+        if self.description is None:
+            # DML / DDL: no hay filas que leer, rowcount ya es definitivo
+            _registrar_consulta(self, sql, params, duracion, self.rowcount)
+        else:
+            self._pendiente = (sql, params, duracion)
+        return resultado
+
+    def executemany(self, sql, seq_params):
+        self._cerrar_pendiente(-1)
+        inicio = time.perf_counter()
+        resultado = super().executemany(sql, seq_params)
+        _registrar_consulta(self, sql, "<executemany>", time.perf_counter() - inicio, self.rowcount)
+        return resultado
+
+    def _fetch(self, metodo, *args):
+        inicio = time.perf_counter()
+        filas = metodo(*args)
+        if self._pendiente is not None:
+            sql, params, duracion = self._pendiente
+            self._pendiente = (sql, params, duracion + time.perf_counter() - inicio)
+        return filas
+
+    def fetchone(self):
+        fila = self._fetch(super().fetchone)
+        self._cerrar_pendiente(0 if fila is None else 1)
+        return fila
+
+    def fetchmany(self, size=None):
+        filas = self._fetch(super().fetchmany, size if size is not None else self.arraysize)
+        self._cerrar_pendiente(len(filas))
+        return filas
+
+    def fetchall(self):
+        filas = self._fetch(super().fetchall)
+        self._cerrar_pendiente(len(filas))
+        return filas
+
+
+class ConexionPerfilada(sqlite3.Connection):
+    def cursor(self, factory=CursorPerfilado):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self.cursor().executemany(sql, seq_params)
+
+
+# ===============================
+# ⏱️ MIDDLEWARE POR REQUEST
+# ===============================
+
+class JSONProviderPerfilado(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            _acumular("serializacion", time.perf_counter() - inicio)
+
+
+def _antes_de_render(sender, template, context, **extra):
+    _local.render_inicio = time.perf_counter()
+
+
+def _despues_de_render(sender, template, context, **extra):
+    inicio = getattr(_local, "render_inicio", None)
+    if inicio is not None:
+        _acumular("plantillas", time.perf_counter() - inicio)
+        _local.render_inicio = None
+
+
+def _iniciar_request():
+    _local.activo = True
+    _local.db = 0.0
+    _local.plantillas = 0.0
+    _local.serializacion = 0.0
+    g.perfilado_inicio = time.perf_counter()
+
+
+def _finalizar_request(response):
+    inicio = g.pop("perfilado_inicio", None)
+    if inicio is None:
+        return response
+
+    total = time.perf_counter() - inicio
+    db = _local.db
+    plantillas = _local.plantillas
+    serializacion = _local.serializacion
+    _local.activo = False
+
+    otros = max(total - db - plantillas - serializacion, 0.0)
+    response.headers["Server-Timing"] = (
+        f"db;dur={db * 1000:.1f}, tpl;dur={plantillas * 1000:.1f}, "
+        f"json;dur={serializacion * 1000:.1f}, app;dur={otros * 1000:.1f}"
+    )
+
+    logger.info(
+        f"{request.method} {request.path} {response.status_code} total={total * 1000:.1f}ms "
+        f"db={db * 1000:.1f}ms plantillas={plantillas * 1000:.1f}ms "
+        f"json={serializacion * 1000:.1f}ms resto={otros * 1000:.1f}ms"
+    )
+    return response
+
+
+# ===============================
+# 📈 PERFILADOR POR MUESTREO (ON-DEMAND)
+# ===============================
+
+class PerfiladorMuestreo:
+    """Toma muestras periódicas de las pilas de todos los hilos."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.parar = threading.Event()
+        self.activo = False
+        self.intervalo = 0.01
+        self.muestras = 0
+        self.pilas = Counter()
+        self.inicio = None
+
+    def iniciar(self, intervalo=0.01):
+        # Se valida antes de tocar el estado: un intervalo inválido no deja
+        # activo=True sin hilo
+        intervalo = float(intervalo)
+        if not math.isfinite(intervalo):
+            raise ValueError(f"intervalo inválido: {intervalo}")
+        intervalo = max(intervalo, 0.001)
+        with self.lock:
+            if self.activo or (self.thread is not None and self.thread.is_alive()):
+                return False
+            self.intervalo = intervalo
+            self.muestras = 0
+            self.pilas = Counter()
+            self.inicio = time.time()
+            # Un Event por hilo: detener() lo despierta aunque esté en medio del intervalo
+            self.parar = threading.Event()
+            self.thread = threading.Thread(target=self._run, args=(self.parar,), daemon=True, name="Perfilador")
+            self.activo = True
+            self.thread.start()
+        logger.info(f"Perfilador por muestreo iniciado (intervalo={self.intervalo}s)")
+        return True
+
+    def detener(self):
+        with self.lock:
+            if not self.activo:
+                return False
+            self.activo = False
+            self.parar.set()
+            thread = self.thread
+        if thread is not None:
+            # Sin timeout: si no, un iniciar() inmediato correría con el hilo viejo vivo
+            thread.join()
+        logger.info(f"Perfilador por muestreo detenido ({self.muestras} muestras)")
+        return True
+
+    def _run(self, parar):
+        propio = threading.get_ident()
+        nombres = {}
+        try:
+            while not parar.is_set():
+                try:
+                    nombres = {t.ident: t.name for t in threading.enumerate()}
+                    for ident, frame in sys._current_frames().items():
+                        if ident == propio:
+                            continue
+                        pila = []
+                        while frame is not None:
+                            codigo = frame.f_code
+                            pila.append(f"{codigo.co_filename.rsplit('/', 1)[-1]}:{codigo.co_name}:{frame.f_lineno}")
+                            frame = frame.f_back
+                        pila.append(nombres.get(ident, str(ident)))
+                        with self.lock:
+                            self.pilas[";".join(reversed(pila))] += 1
+                    self.muestras += 1
+                except Exception as e:
+                    logger.error(f"Error tomando muestra: {e}")
+                    logger.error(traceback.format_exc())
+                parar.wait(self.intervalo)
+        finally:
+            # Si el hilo muere, el endpoint no informa un perfilador que no corre
+            with self.lock:
+                if self.parar is parar:
+                    self.activo = False
+
+    def resultado(self, top=30):
+        with self.lock:
+            pilas = self.pilas.most_common(top)
+        return {
+            "activo": self.activo,
+            "intervalo": self.intervalo,
+            "muestras": self.muestras,
+            "desde": self.inicio,
+            "pilas": [{"pila": pila, "muestras": n} for pila, n in pilas],
+        }
+
+
+perfilador = PerfiladorMuestreo()
+
+
+def instalar_perfilado(app):
+    """
+    Con PERFILADO_ACTIVO registra el middleware y el endpoint del perfilador.
+    Apagado no hay endpoint: cualquiera en la red podría lanzar el muestreo.
+    """
+    if not config.PERFILADO_ACTIVO:
+        return
+
+    app.json_provider_class = JSONProviderPerfilado
+    app.json = JSONProviderPerfilado(app)
+    app.before_request(_iniciar_request)
+    app.after_request(_finalizar_request)
+    before_render_template.connect(_antes_de_render, app)
+    template_rendered.connect(_despues_de_render, app)
+    logger.info(f"Perfilado activo (umbral slow-query={config.PERFILADO_UMBRAL_MS} ms)")
+
+    @app.route("/api/perfilador", methods=["GET", "POST"])
+    def api_perfilador():
+        try:
+            if request.method == "POST":
+                data = request.get_json(silent=True) or request.form
+                accion = data.get("accion")
+                if accion == "iniciar":
+                    cambiado = perfilador.iniciar(data.get("intervalo", 0.01))
+                elif accion == "detener":
+                    cambiado = perfilador.detener()
+                else:
+                    return jsonify({"status": "error", "message": "Acción inválida"}), 400
+                return jsonify({"status": "success", "cambiado": cambiado, "activo": perfilador.activo})
+
+            return jsonify(perfilador.resultado(int(request.args.get("top", 30))))
+
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Parámetros inválidos en /api/perfilador: {e}")
+            return jsonify({"status": "error", "message": "Parámetros inválidos"}), 400
@@ -1,8 +1,10 @@
-import serial
+import re
 import threading
 import time
 import logging
 import traceback
+from collections import deque
+from datetime import datetime
 
 from database import (
     agregar_evento,
@@ -12,39 +14,73 @@ from database import (
 )
 
 from logger_config import setup_logger
+from hardware import abrir_puerto_serial
+from ocupacion import registrar_acceso
+from reglas_alarma import evaluar_evento
+import config
 
 # Logger específico para este módulo
 logger = setup_logger("pic", "pic.log", level=logging.INFO)
 
-SERIAL_PORT = "/dev/ttyAMA0"
-BAUD_RATE = 9600
+# Consulta del PIC por una cédula que no tiene en su EEPROM: "Q<8 dígitos>"
+CONSULTA_PIC = re.compile(r"^Q(\d{8})$")
+# Una línea del PIC no pasa de ~60 bytes: más sin '\n' es basura en la línea
+LINEA_PIC_MAX = 256
 
 
 class PICCommunicator:
-    def __init__(self):
-        self.ser = None
-        self.init_serial()
+    def __init__(self, ser=None, puerta=None, puerto=None):
+        self.ser = ser
+        self.puerta = puerta or config.PUERTA_DEFECTO
+        self.puerto = puerto
+        # Sincronización de reloj: epoch = offset_reloj + tiempo del PIC
+        self.offset_reloj = None
+        self.reloj_pic_sync = None
+        self.sync_enviado = None
+        self.ultimo_sync = 0.0
+        self.consultas_respondidas = 0
+        # Hilo lector del puerto (ver iniciar_lector): deja en `recibidas` las
+        # líneas que no se contestan en el acto
+        self.recibidas = deque()
+        self.ser_lector = None
+        self.error_lector = None
+        # Latido del hilo lector (cada línea o cada timeout del read): lo
+        # vigila el SupervisorDispositivos igual que al bucle de sondeo
+        self.hilo_lector = None
+        self.latido_lector = None
+        # El lector contesta consultas mientras otros hilos mandan comandos
+        self.lock_tx = threading.Lock()
+        if self.ser is None:
+            self.init_serial()
 
     def init_serial(self):
         try:
-            self.ser = serial.Serial(
-                port=SERIAL_PORT,
-                baudrate=BAUD_RATE,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=1,
-            )
-            logger.info("Conexión serial establecida con PIC")
+            self.ser = abrir_puerto_serial(puerto=self.puerto)
+            if self.ser is not None:
+                logger.info("Conexión serial establecida con PIC")
         except Exception as e:
             logger.error(f"Error al conectar con PIC: {e}")
             logger.error(traceback.format_exc())
 
+    def cerrar(self):
+        """Cierra el puerto; su hilo lector termina sin reportarlo como error."""
+        ser, self.ser_lector = self.ser, None
+        if ser is not None:
+            # Un lector colgado a mitad de una respuesta puede tener el lock:
+            # el puerto se cierra igual (su write falla y el hilo termina)
+            tomado = self.lock_tx.acquire(timeout=1)
+            try:
+                ser.close()
+            finally:
+                if tomado:
+                    self.lock_tx.release()
+
     def enviar_comando_pic(self, comando, cedula):
         try:
             if self.ser and self.ser.is_open:
                 mensaje = f"{comando}{cedula}\n"
-                self.ser.write(mensaje.encode("utf-8"))
+                with self.lock_tx:
+                    self.ser.write(mensaje.encode("utf-8"))
                 logger.info(f"Comando enviado al PIC: {mensaje}")
                 return True
             else:
@@ -63,53 +99,283 @@ class PICCommunicator:
                     try:
                         if self.ser.in_waiting > 0:
                             linea = self.ser.readline().decode("utf-8", errors="ignore").strip()
-                            if linea:
+                            if linea.startswith("reloj="):
+                                self.procesar_reloj(linea, time.time())
+                            elif CONSULTA_PIC.match(linea):
+                                self.responder_consulta(linea[1:])
+                            elif linea:
                                 self.procesar_evento_pic(linea)
                     except Exception as inner:
                         logger.error(f"Error en lectura individual del PIC: {inner}")
                         logger.error(traceback.format_exc())
                     time.sleep(0.1)
+            else:
+                # Sin supervisor este hilo termina acá: usar dispositivos.iniciar_dispositivos()
+                logger.warning("Puerto serial no disponible: lector de eventos PIC no iniciado")
         except Exception as e:
             logger.error(f"Error leyendo del PIC: {e}")
             logger.error(traceback.format_exc())
 
+    def sondear(self):
+        """
+        No bloquea: pide el reloj si toca y devuelve las líneas de eventos que
+        dejó el hilo lector. Si el lector se cayó, lo informa como error.
+        """
+        if self.ser is not self.ser_lector:
+            # Primera vez o puerto reabierto (init_serial)
+            self.iniciar_lector()
+        if self.error_lector is not None:
+            raise IOError(f"lector del PIC detenido: {self.error_lector}")
+
+        if self.ser and self.ser.is_open:
+            if config.PIC_SYNC_INTERVALO_S > 0 and time.time() - self.ultimo_sync >= config.PIC_SYNC_INTERVALO_S:
+                self.sincronizar_reloj()
+        lineas = []
+        while self.recibidas:
+            lineas.append(self.recibidas.popleft())
+        return lineas
+
+    def iniciar_lector(self):
+        """
+        Un hilo por puerto abierto que espera en read() y atiende cada línea
+        apenas llega: las consultas "Q" no dependen del bucle de sondeo, que
+        puede estar frenado en el MFRC522 de otra puerta.
+        """
+        ser = self.ser_lector = self.ser
+        self.error_lector = None
+        if ser is None or not ser.is_open:
+            return None
+        self.latido_lector = time.monotonic()
+        hilo = self.hilo_lector = threading.Thread(
+            target=self._leer_puerto, args=(ser,), daemon=True, name=f"PIC-{self.puerta}"
+        )
+        hilo.start()
+        return hilo
+
+    def lector_sin_latido(self, ahora):
+        """
+        Segundos sin latido del hilo lector del puerto actual; infinito si
+        terminó sin que se cerrara el puerto. None si no hay lector que vigilar.
+        """
+        hilo = self.hilo_lector
+        if hilo is None or self.ser_lector is None or self.ser_lector is not self.ser:
+            return None
+        if not hilo.is_alive():
+            return float("inf")
+        return ahora - self.latido_lector
+
+    def _leer_puerto(self, ser):
+        pendiente = b""
+        while self.ser_lector is ser and ser.is_open:
+            self.latido_lector = time.monotonic()
+            try:
+                # Espera el primer byte hasta el timeout del puerto; el resto ya está en el buffer
+                primero = ser.read(1)
+                if not primero:
+                    continue
+                lineas, pendiente = self._leer_lineas(ser, pendiente + primero)
+                for linea in lineas:
+                    self._procesar_linea(linea)
+            except Exception as e:
+                if self.ser_lector is not ser or not ser.is_open:
+                    # Puerto cerrado para reabrirlo: el lector del puerto nuevo sigue
+                    break
+                self.error_lector = e
+                logger.error(f"Error en el lector del PIC de '{self.puerta}': {e}")
+                logger.error(traceback.format_exc())
+                break
+
+    def _leer_lineas(self, ser, pendiente):
+        """
+        Suma a `pendiente` lo que ya está en el buffer del puerto, sin esperar.
+        Devuelve (líneas completas, bytes de la línea que sigue llegando).
+        """
+        disponibles = ser.in_waiting
+        if disponibles > 0:
+            pendiente += ser.read(disponibles)
+        *completas, pendiente = pendiente.split(b"\n")
+        if len(pendiente) > LINEA_PIC_MAX:
+            logger.warning(f"PIC de '{self.puerta}': {len(pendiente)} bytes sin fin de línea descartados")
+            pendiente = b""
+        return [linea.decode("utf-8", errors="ignore").strip() for linea in completas], pendiente
+
+    def _procesar_linea(self, linea):
+        if linea.startswith("reloj="):
+            # Importa el instante de llegada: no espera al bucle de sondeo
+            self.procesar_reloj(linea, time.time())
+        elif CONSULTA_PIC.match(linea):
+            # El PIC espera la respuesta con la puerta en suspenso
+            self.responder_consulta(linea[1:])
+        elif linea:
+            self.recibidas.append(linea)
+
+    # ---------- autorización asistida ----------
+    # El PIC solo guarda unas pocas cédulas en EEPROM; para el resto pregunta
+    # "Q<cedula>" y espera "S<cedula>" o "N<cedula>" (ver consultar_pi en
+    # main.c). Sin respuesta a tiempo el PIC deniega, así que la contesta el
+    # hilo lector del puerto, sin pasar por el sondeo ni la cola de ingesta.
+
+    def responder_consulta(self, cedula):
+        inicio = time.perf_counter()
+        try:
+            autorizado = obtener_funcionario_por_id(cedula) is not None
+            with self.lock_tx:
+                self.ser.write(f"{'S' if autorizado else 'N'}{cedula}\n".encode("utf-8"))
+            self.consultas_respondidas += 1
+            logger.info(
+                f"Consulta del PIC '{self.puerta}' por {cedula}: "
+                f"{'AUTORIZADO' if autorizado else 'DENEGADO'} ({(time.perf_counter() - inicio) * 1000:.1f} ms)"
+            )
+            return autorizado
+        except Exception as e:
+            logger.error(f"Error respondiendo consulta del PIC por {cedula}: {e}")
+            logger.error(traceback.format_exc())
+            return False
+
+    # ---------- sincronización de reloj ----------
+    # El PIC cuenta segundos desde su arranque y los eventos traen ese tiempo
+    # ("tiempo=12345.75"). La Pi envía 'T', el PIC responde "reloj=<tiempo>" y
+    # el offset se estima con el punto medio del ida y vuelta.
+
+    def sincronizar_reloj(self):
+        self.ultimo_sync = time.time()
+        # Antes de enviar: la respuesta la procesa el hilo lector y puede llegar primero
+        self.sync_enviado = time.time()
+        if not self.enviar_comando_pic("T", ""):
+            self.sync_enviado = None
+
+    def procesar_reloj(self, linea, recibido):
+        try:
+            reloj = float(linea.split("=", 1)[1])
+        except ValueError:
+            logger.warning(f"Respuesta de reloj inválida del PIC: {linea}")
+            return
+        if self.sync_enviado is None:
+            return
+
+        ida_y_vuelta = recibido - self.sync_enviado
+        self.sync_enviado = None
+        if ida_y_vuelta > 1.0:
+            logger.warning(f"Respuesta de reloj descartada (ida y vuelta {ida_y_vuelta * 1000:.0f} ms)")
+            return
+
+        if self.reloj_pic_sync is not None and reloj < self.reloj_pic_sync:
+            logger.warning(f"Reloj del PIC de '{self.puerta}' volvió a {reloj:.2f}s: el PIC se reinició")
+        # El PIC leyó su reloj, en promedio, a mitad del ida y vuelta
+        self.offset_reloj = recibido - ida_y_vuelta / 2 - reloj
+        self.reloj_pic_sync = reloj
+        logger.info(
+            f"Reloj del PIC '{self.puerta}' sincronizado: {reloj:.2f}s, "
+            f"ida y vuelta {ida_y_vuelta * 1000:.1f} ms"
+        )
+
+    def fecha_de_evento(self, tiempo):
+        """Tiempo del PIC → 'YYYY-MM-DD HH:MM:SS', o None si no hay un offset confiable."""
+        if tiempo is None or self.offset_reloj is None:
+            return None
+        if tiempo < self.reloj_pic_sync - 600:
+            # Más viejo que cualquier lote pendiente: el PIC se reinició después del sync
+            self.offset_reloj = None
+            self.ultimo_sync = 0.0
+            return None
+
+        epoch = self.offset_reloj + tiempo
+        ahora = time.time()
+        if epoch > ahora + 5 or epoch < ahora - 3600:
+            logger.warning(f"Tiempo del PIC fuera de rango ({tiempo:.2f}s); se usa la hora de recepción")
+            return None
+        return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+
     def procesar_evento_pic(self, linea):
         try:
-            logger.info(f"Evento recibido del PIC: {linea}")
+            evento = parsear_evento_pic(linea)
+            fecha_hora = self.fecha_de_evento(evento[3]) if evento is not None else None
+
+            # reproducir_logs.py lee esta línea: la puerta y, si salió del reloj
+            # del PIC, la fecha_hora guardada (puede ser minutos antes del log)
+            if fecha_hora is not None:
+                logger.info(f"Evento recibido del PIC '{self.puerta}' (fecha_hora={fecha_hora}): {linea}")
+            else:
+                logger.info(f"Evento recibido del PIC '{self.puerta}': {linea}")
+
+            if evento is not None:
+                cedula, autorizado, operacion_str, _ = evento
 
-            if linea.startswith("tiempo="):
-                partes = linea.split(", ")
-                if len(partes) == 4:
-                    cedula = partes[1].split("=")[1]
-                    autorizado_str = partes[2].split("=")[1]
-                    autorizado = 1 if autorizado_str == "Si" else 0
-                    operacion_str = partes[3].split("=")[1]
+                ok, _ = agregar_evento(cedula, autorizado, operacion_str, "serial", self.puerta, fecha_hora)
 
-                    agregar_evento(cedula, autorizado, operacion_str, "serial")
+                if ok and operacion_str == "Acceso":
+                    evaluar_evento(cedula, autorizado, "serial", operacion_str, self.puerta)
+                    if autorizado == 1:
+                        registrar_acceso(cedula, self.puerta, fecha_hora)
 
-                    logger.info(
-                        f"Evento registrado: cedula={cedula}, autorizado={autorizado}, operacion={operacion_str}"
-                    )
+                logger.info(
+                    f"Evento registrado: cedula={cedula}, autorizado={autorizado}, operacion={operacion_str}"
+                )
 
-                    success = False
-                    if operacion_str == "Alta" and autorizado == 1:
-                        success, _ = agregar_funcionario(cedula, "")
-                    elif operacion_str == "Baja" and autorizado == 1:
-                        success, _ = eliminar_funcionario(cedula)
+                success = False
+                if operacion_str == "Alta" and autorizado == 1:
+                    success, _ = agregar_funcionario(cedula, "")
+                elif operacion_str == "Baja" and autorizado == 1:
+                    success, _ = eliminar_funcionario(cedula)
 
-                    if success:
-                        logger.info(f"Operación PIC procesada correctamente: {linea}")
+                if success:
+                    logger.info(f"Operación PIC procesada correctamente: {linea}")
 
         except Exception as e:
             logger.error(f"Error procesando evento PIC: {e}")
             logger.error(traceback.format_exc())
 
 
-pic_comm = PICCommunicator()
+def parsear_evento_pic(linea):
+    """
+    'tiempo=..., cedula=..., autorizado=Si/No, operacion=...'
+    → (cedula, autorizado, operacion, tiempo). tiempo: segundos del reloj del
+    PIC (None si no se puede leer). Devuelve None si la línea no es un evento.
+    """
+    if not linea.startswith("tiempo="):
+        return None
+    partes = linea.split(", ")
+    if len(partes) != 4:
+        return None
+    try:
+        tiempo = float(partes[0].split("=")[1])
+    except ValueError:
+        tiempo = None
+    cedula = partes[1].split("=")[1]
+    autorizado = 1 if partes[2].split("=")[1] == "Si" else 0
+    operacion = partes[3].split("=")[1]
+    return cedula, autorizado, operacion, tiempo
+
+
+# Un PICCommunicator por puerta; el de la puerta por defecto se crea la
+# primera vez que se necesita (no al importar).
+pic_comms = {}
+_pic_comm_lock = threading.Lock()
+
+
+def registrar_pic_comm(comm):
+    with _pic_comm_lock:
+        pic_comms[comm.puerta] = comm
+
+
+def obtener_pic_comm(puerta=None):
+    puerta = puerta or config.PUERTA_DEFECTO
+    if puerta not in pic_comms:
+        with _pic_comm_lock:
+            if puerta not in pic_comms:
+                pic_comms[puerta] = PICCommunicator(puerta=puerta)
+    return pic_comms[puerta]
+
+
+def enviar_comando_a_todos(comando, cedula):
+    """Envía el comando al PIC de cada puerta. True si todos lo aceptaron."""
+    comms = list(pic_comms.values()) or [obtener_pic_comm()]
+    resultados = [comm.enviar_comando_pic(comando, cedula) for comm in comms]
+    return all(resultados)
 
 
 def dar_de_alta_funcionario_en_pic(identificacion):
-    ok = pic_comm.enviar_comando_pic("A", identificacion)
+    ok = enviar_comando_a_todos("A", identificacion)
     if ok:
         logger.info(f"Alta enviada al PIC para {identificacion}")
     else:
@@ -120,7 +386,7 @@ def agregar_funcionario_con_sinc(identificacion, nombre, es_cedula):
     success, mensaje = agregar_funcionario(identificacion, nombre)
 
     if success and es_cedula:
-        ok = pic_comm.enviar_comando_pic("A", identificacion)
+        ok = enviar_comando_a_todos("A", identificacion)
         if ok:
             mensaje += " - Sincronizado con PIC"
             logger.info(f"Alta sincronizada con PIC para {identificacion}")
@@ -135,7 +401,7 @@ def eliminar_funcionario_con_sinc(identificacion, es_cedula):
     success, mensaje = eliminar_funcionario(identificacion)
 
     if success and es_cedula:
-        ok = pic_comm.enviar_comando_pic("B", identificacion)
+        ok = enviar_comando_a_todos("B", identificacion)
         if ok:
             mensaje += " - Sincronizado con PIC"
             logger.info(f"Baja sincronizada con PIC para {identificacion}")
@@ -148,7 +414,7 @@ def eliminar_funcionario_con_sinc(identificacion, es_cedula):
 
 def iniciar_lector_pic():
     try:
-        thread = threading.Thread(target=pic_comm.leer_eventos_pic, daemon=True)
+        thread = threading.Thread(target=obtener_pic_comm().leer_eventos_pic, daemon=True)
         thread.start()
         logger.info("Hilo lector del PIC iniciado")
     except Exception as e:
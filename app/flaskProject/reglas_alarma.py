@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+import logging
+import traceback
+from collections import deque
+
+import config
+from database import agregar_evento, registrar_transicion_alarma
+from logger_config import setup_logger
+
+logger = setup_logger("alarmas", "alarmas.log", level=logging.INFO)
+
+# ===============================
+# 🚨 MOTOR DE REGLAS DE ALARMA
+# ===============================
+# Las reglas se declaran como diccionarios (o JSON en REGLAS_ALARMA):
+#
+#   {"nombre": "intentos_fallidos", "umbral": 3, "ventana_s": 60,
+#    "alcance": "identificacion", "cooldown_s": 300,
+#    "filtro": {"autorizado": false}}
+#
+# - umbral / ventana_s: cantidad de eventos que cumplen el filtro dentro de la ventana
+# - alcance: "identificacion" (una cuenta por persona/tarjeta) o "global"
+# - cooldown_s: tiempo mínimo entre dos activaciones de la misma regla y clave
+# - filtro: campos del evento que deben coincidir (autorizado, canal, puerta, operacion)
+#
+# Se evalúa en memoria contra el stream de eventos. Solo se persisten las
+# transiciones de estado, nunca cada intento: todas en alarmas_transiciones
+# y la activación además como alarma en eventos (canal 'Alarma',
+# autorizado='No'), que es lo que muestran el histórico y las estadísticas.
+# La normalización no depende de que lleguen eventos: un barrido cada
+# ALARMAS_BARRIDO_S la detecta y libera las claves sin actividad.
+
+REGLAS_POR_DEFECTO = [
+    {
+        "nombre": "intentos_fallidos",
+        "umbral": 3,
+        "ventana_s": 60,
+        "alcance": "identificacion",
+        "cooldown_s": 300,
+        "filtro": {"autorizado": False},
+    },
+]
+
+ALCANCE_GLOBAL = "global"
+ALCANCE_IDENTIFICACION = "identificacion"
+
+
+class ReglaAlarma:
+    def __init__(self, nombre, umbral, ventana_s, alcance=ALCANCE_IDENTIFICACION, cooldown_s=300, filtro=None):
+        if alcance not in (ALCANCE_GLOBAL, ALCANCE_IDENTIFICACION):
+            raise ValueError(f"Alcance inválido en regla {nombre}: {alcance}")
+        self.nombre = nombre
+        self.umbral = int(umbral)
+        self.ventana_s = float(ventana_s)
+        self.alcance = alcance
+        self.cooldown_s = float(cooldown_s)
+        self.filtro = tuple((filtro or {}).items())
+
+    def coincide(self, evento):
+        for campo, valor in self.filtro:
+            if evento.get(campo) != valor:
+                return False
+        return True
+
+    def clave(self, evento):
+        return "*" if self.alcance == ALCANCE_GLOBAL else evento["identificacion"]
+
+
+class _EstadoClave:
+    __slots__ = ("tiempos", "activa", "cooldown_hasta", "puerta")
+
+    def __init__(self, umbral):
+        # Alcanza con los últimos `umbral` tiempos para saber si se superó el umbral
+        self.tiempos = deque(maxlen=umbral)
+        self.activa = False
+        self.cooldown_hasta = 0.0
+        # Puerta del último evento: la de la normalización que detecte el barrido
+        self.puerta = None
+
+
+def persistir_transicion(regla, clave, activa, cantidad, evento):
+    """Transición por defecto: alarmas_transiciones y, si se activa, el histórico de alarmas."""
+    if activa:
+        logger.warning(f"ALARMA '{regla.nombre}' ACTIVADA para {clave}: {cantidad} eventos en {regla.ventana_s:.0f}s")
+        # Regla global: la alarma queda a nombre de quien la disparó
+        identificacion = evento["identificacion"] if clave == "*" else clave
+        agregar_evento(identificacion, "No", regla.nombre, "Alarma", evento.get("puerta"))
+    else:
+        logger.info(f"Alarma '{regla.nombre}' normalizada para {clave}")
+    registrar_transicion_alarma(regla.nombre, clave, activa, cantidad, evento.get("puerta"))
+
+
+class MotorAlarmas:
+    def __init__(self, reglas, persistir=persistir_transicion):
+        self.reglas = reglas
+        self.persistir = persistir
+        self.estados = [dict() for _ in reglas]
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def _normalizar(self, regla, clave, estado, ahora, evento, transiciones):
+        tiempos = estado.tiempos
+        limite = ahora - regla.ventana_s
+        while tiempos and tiempos[0] < limite:
+            tiempos.popleft()
+        if estado.activa and len(tiempos) < regla.umbral and ahora >= estado.cooldown_hasta:
+            estado.activa = False
+            transiciones.append((regla, clave, False, len(tiempos), evento))
+
+    def _persistir(self, transiciones):
+        for transicion in transiciones:
+            try:
+                self.persistir(*transicion)
+            except Exception as e:
+                logger.error(f"Error persistiendo transición de alarma: {e}")
+                logger.error(traceback.format_exc())
+
+    def evaluar(self, evento, ahora=None):
+        """
+        evento: dict con identificacion, autorizado (bool), canal, puerta, operacion.
+        Devuelve la lista de reglas que se activaron con este evento.
+        """
+        ahora = time.time() if ahora is None else ahora
+        transiciones = []
+
+        with self.lock:
+            for regla, estados in zip(self.reglas, self.estados):
+                if not regla.coincide(evento):
+                    continue
+                clave = regla.clave(evento)
+                estado = estados.get(clave)
+                if estado is None:
+                    estado = estados[clave] = _EstadoClave(regla.umbral)
+
+                estado.tiempos.append(ahora)
+                estado.puerta = evento.get("puerta")
+                self._normalizar(regla, clave, estado, ahora, evento, transiciones)
+
+                # Deduplicación: mientras está activa o en cooldown no se repite
+                if not estado.activa and len(estado.tiempos) >= regla.umbral and ahora >= estado.cooldown_hasta:
+                    estado.activa = True
+                    estado.cooldown_hasta = ahora + regla.cooldown_s
+                    transiciones.append((regla, clave, True, len(estado.tiempos), evento))
+
+        self._persistir(transiciones)
+        return [regla.nombre for regla, _, activa, _, _ in transiciones if activa]
+
+    def barrer(self, ahora=None):
+        """Normaliza alarmas vencidas y libera las claves sin actividad reciente."""
+        ahora = time.time() if ahora is None else ahora
+        transiciones = []
+
+        with self.lock:
+            for regla, estados in zip(self.reglas, self.estados):
+                for clave in list(estados):
+                    estado = estados[clave]
+                    evento = {"identificacion": clave, "puerta": estado.puerta}
+                    self._normalizar(regla, clave, estado, ahora, evento, transiciones)
+                    if not estado.tiempos and not estado.activa and ahora >= estado.cooldown_hasta:
+                        del estados[clave]
+
+        self._persistir(transiciones)
+        return transiciones
+
+    def run(self):
+        while self.running:
+            time.sleep(config.ALARMAS_BARRIDO_S)
+            try:
+                self.barrer()
+            except Exception as e:
+                logger.error(f"Error en barrido de alarmas: {e}")
+                logger.error(traceback.format_exc())
+
+    def iniciar(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="Alarmas")
+        self.thread.start()
+
+    def detener(self):
+        self.running = False
+
+    def estado(self):
+        with self.lock:
+            return [
+                {
+                    "regla": regla.nombre,
+                    "claves": len(estados),
+                    "activas": sorted(clave for clave, e in estados.items() if e.activa),
+                }
+                for regla, estados in zip(self.reglas, self.estados)
+            ]
+
+
+def cargar_reglas(texto=None):
+    texto = config.REGLAS_ALARMA if texto is None else texto
+    definiciones = json.loads(texto) if texto else REGLAS_POR_DEFECTO
+    return [ReglaAlarma(**definicion) for definicion in definiciones]
+
+
+motor = None
+_motor_lock = threading.Lock()
+
+
+def obtener_motor_alarmas():
+    global motor
+    if motor is None:
+        with _motor_lock:
+            if motor is None:
+                m = MotorAlarmas(cargar_reglas())
+                m.iniciar()
+                motor = m
+                logger.info(f"Motor de alarmas con {len(motor.reglas)} reglas: {[r.nombre for r in motor.reglas]}")
+    return motor
+
+
+def evaluar_evento(identificacion, autorizado, canal, operacion, puerta=None):
+    try:
+        return obtener_motor_alarmas().evaluar({
+            "identificacion": identificacion,
+            "autorizado": bool(autorizado),
+            "canal": canal,
+            "operacion": operacion,
+            "puerta": puerta or config.PUERTA_DEFECTO,
+        })
+    except Exception as e:
+        logger.error(f"Error evaluando reglas de alarma para {identificacion}: {e}")
+        logger.error(traceback.format_exc())
+        return []
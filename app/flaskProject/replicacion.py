@@ -0,0 +1,128 @@
+import gzip
+import json
+import random
+import threading
+import time
+import logging
+import traceback
+import urllib.request
+
+import config
+from database import (
+    obtener_eventos_desde_id,
+    obtener_watermark_replicacion,
+    guardar_watermark_replicacion,
+)
+from logger_config import setup_logger
+
+logger = setup_logger("replicacion", "replicacion.log", level=logging.INFO)
+
+# ===============================
+# 🔁 AGENTE DE REPLICACIÓN HACIA EL COLECTOR CENTRAL
+# ===============================
+# Envía los eventos nuevos (id > watermark) en lotes comprimidos con gzip.
+# El colector deduplica por (sitio, id, fecha_hora), así que reenviar un lote
+# tras un error es seguro; el watermark solo avanza cuando el colector confirma.
+
+COLUMNAS = ("id", "identificacion", "fecha_hora", "autorizado", "canal", "operacion", "puerta")
+
+
+def codificar_lote(sitio, filas):
+    lote = {"sitio": sitio, "eventos": [dict(zip(COLUMNAS, fila)) for fila in filas]}
+    return gzip.compress(json.dumps(lote, separators=(",", ":")).encode("utf-8"))
+
+
+class AgenteReplicacion:
+    def __init__(self, url=None, sitio=None, lote=None):
+        self.url = (url or config.REPLICACION_URL).rstrip("/")
+        self.sitio = sitio or config.SITIO_ID
+        self.lote = lote or config.REPLICACION_LOTE
+        self.running = False
+        self.thread = None
+        self.enviados = 0
+        self.ultimo_error = None
+
+    def enviar_lote(self, filas):
+        request = urllib.request.Request(
+            f"{self.url}/api/replicacion/lote",
+            data=codificar_lote(self.sitio, filas),
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def replicar_pendientes(self):
+        """Envía lotes hasta ponerse al día. Devuelve la cantidad de eventos enviados."""
+        total = 0
+        watermark = obtener_watermark_replicacion(self.url)
+
+        while True:
+            filas = obtener_eventos_desde_id(watermark, self.lote)
+            if not filas:
+                return total
+
+            respuesta = self.enviar_lote(filas)
+            watermark = filas[-1][0]
+            guardar_watermark_replicacion(self.url, watermark)
+            total += len(filas)
+            self.enviados += len(filas)
+            logger.info(
+                f"Lote replicado: {len(filas)} eventos hasta id={watermark} "
+                f"(aceptados={respuesta.get('aceptados')}, duplicados={respuesta.get('duplicados')})"
+            )
+
+            if len(filas) < self.lote:
+                return total
+
+    def run(self):
+        espera_error = 1.0
+        while self.running:
+            try:
+                self.replicar_pendientes()
+                self.ultimo_error = None
+                espera_error = 1.0
+                espera = config.REPLICACION_INTERVALO
+            except Exception as e:
+                self.ultimo_error = str(e)
+                logger.error(f"Error replicando hacia {self.url}: {e}")
+                logger.error(traceback.format_exc())
+                # Backoff exponencial con jitter
+                espera = espera_error * random.uniform(0.5, 1.5)
+                espera_error = min(espera_error * 2, config.REPLICACION_BACKOFF_MAX)
+
+            fin = time.monotonic() + espera
+            while self.running and time.monotonic() < fin:
+                time.sleep(min(0.5, espera))
+
+    def iniciar(self):
+        if not self.url:
+            logger.info("Replicación deshabilitada (REPLICACION_URL vacío)")
+            return None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="Replicacion")
+        self.thread.start()
+        logger.info(f"Agente de replicación iniciado: sitio={self.sitio} → {self.url}")
+        return self.thread
+
+    def detener(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+
+agente = None
+
+
+def iniciar_replicacion():
+    global agente
+    if agente is None:
+        agente = AgenteReplicacion()
+        agente.iniciar()
+    return agente
+
+
+if __name__ == "__main__":
+    # Replicación manual de una sola pasada: python replicacion.py
+    enviados = AgenteReplicacion().replicar_pendientes()
+    print(f"{enviados} eventos replicados")
@@ -0,0 +1,189 @@
+"""
+Reimporta eventos desde los logs del PIC y del lector RFID (incluidas las
+rotaciones y archivos .gz) a la base, sin duplicar los que ya están.
+
+Los archivos se leen línea por línea y se cargan en lotes de una transacción
+cada uno, así que la memoria no depende del tamaño de los logs. Solo se
+reimportan las filas de eventos: Alta/Baja no se vuelven a ejecutar.
+
+La puerta sale de cada línea del log. Las líneas de versiones anteriores no
+la traen: se les asigna --puerta o, si hay una sola puerta configurada, esa;
+con varias puertas y sin --puerta se saltean (se informan como sin puerta).
+
+Los eventos del PIC fechados con su reloj se guardaron con esa fecha_hora,
+que puede ser minutos anterior a la línea: la línea la trae y se deduplica
+con ella. Sin reloj sincronizado se guardaron con la hora de recepción, que
+es la del log.
+
+Uso:
+    python reproducir_logs.py [archivos...] [--puerta principal] [--lote 5000] [--simular]
+    (sin archivos: logs/pic.log* y logs/rfid_reader.log*)
+"""
+import argparse
+import glob
+import gzip
+import os
+import re
+import time
+import logging
+import traceback
+
+import config
+from database import importar_eventos_historicos
+from dispositivos import parsear_puertas
+from logger_config import LOG_DIR, setup_logger
+from pic_communicator import parsear_evento_pic
+
+logger = setup_logger("reproducir_logs", "reproducir_logs.log", level=logging.INFO)
+
+# "%(asctime)s [%(levelname)s] [%(threadName)s] %(name)s: %(message)s"
+LINEA_LOG = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+ \[\w+\] \[[^\]]*\] [\w.]+: (.*)$")
+
+# "Evento recibido del PIC 'principal' (fecha_hora=2026-01-01 08:00:00): tiempo=..."
+# (sin fecha_hora si no hubo reloj sincronizado; sin la puerta en logs viejos)
+EVENTO_PIC = re.compile(
+    r"^Evento recibido del PIC(?: '([^']*)')?(?: \(fecha_hora=(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\))?: (.*)$"
+)
+# "Verificación RFID 00012345 en 'principal': AUTORIZADO"
+LECTURA_RFID = re.compile(r"^Verificación RFID (\S+?)(?: en '([^']*)')?: (AUTORIZADO|DENEGADO)$")
+
+
+def parsear_lectura_rfid(mensaje):
+    """Línea de verificación RFID → (identificacion, autorizado, puerta o None), o None."""
+    coincidencia = LECTURA_RFID.match(mensaje)
+    if not coincidencia:
+        return None
+    identificacion, puerta, resultado = coincidencia.groups()
+    return identificacion, 1 if resultado == "AUTORIZADO" else 0, puerta
+
+
+def puerta_para_logs_viejos(puerta=None):
+    """--puerta si se dio; si no, la única puerta configurada; con varias, None."""
+    if puerta:
+        return puerta
+    puertas = parsear_puertas(config.PUERTAS)
+    return puertas[0][0] if len(puertas) == 1 else None
+
+
+def archivos_por_defecto():
+    """Rotaciones más viejas primero (pic.log.2, pic.log.1, pic.log)."""
+    archivos = []
+    for base in ("pic.log", "rfid_reader.log"):
+        encontrados = glob.glob(os.path.join(LOG_DIR, base + "*"))
+
+        def antiguedad(ruta):
+            sufijo = ruta[len(os.path.join(LOG_DIR, base)):].lstrip(".").split(".")[0]
+            return -int(sufijo) if sufijo.isdigit() else 0
+
+        archivos.extend(sorted(encontrados, key=antiguedad))
+    return archivos
+
+
+def abrir(ruta):
+    if ruta.endswith(".gz"):
+        return gzip.open(ruta, "rt", encoding="utf-8", errors="replace")
+    return open(ruta, "r", encoding="utf-8", errors="replace")
+
+
+def eventos_de_archivo(ruta, puerta, estadisticas):
+    """
+    Genera filas (identificacion, fecha_hora, autorizado, operacion, canal,
+    puerta). puerta: la de las líneas que no la traen (None: se saltean).
+    """
+    with abrir(ruta) as archivo:
+        for linea in archivo:
+            estadisticas["lineas"] += 1
+            estadisticas["bytes"] += len(linea)
+            coincidencia = LINEA_LOG.match(linea)
+            if not coincidencia:
+                continue
+            fecha_hora, mensaje = coincidencia.groups()
+            mensaje = mensaje.rstrip()
+
+            evento_pic = EVENTO_PIC.match(mensaje)
+            if evento_pic:
+                puerta_linea, fecha_pic, linea_pic = evento_pic.groups()
+                evento = parsear_evento_pic(linea_pic)
+                if evento is None:
+                    continue
+                cedula, autorizado, operacion, _ = evento
+                fila = (cedula, fecha_pic or fecha_hora, autorizado, operacion, "serial")
+            else:
+                lectura = parsear_lectura_rfid(mensaje)
+                if lectura is None:
+                    continue
+                identificacion, autorizado, puerta_linea = lectura
+                fila = (identificacion, fecha_hora, autorizado, "rfid", "rfid")
+
+            puerta_fila = puerta_linea or puerta
+            if puerta_fila is None:
+                estadisticas["sin_puerta"] += 1
+                continue
+            yield (*fila, puerta_fila)
+
+
+def reproducir(archivos, puerta=None, lote=5000, simular=False):
+    puerta = puerta_para_logs_viejos(puerta)
+    estadisticas = {"lineas": 0, "bytes": 0, "eventos": 0, "insertados": 0, "duplicados": 0, "sin_puerta": 0}
+    inicio = time.perf_counter()
+
+    def cargar(filas):
+        estadisticas["eventos"] += len(filas)
+        if simular:
+            return
+        insertados, duplicados = importar_eventos_historicos(filas)
+        estadisticas["insertados"] += insertados
+        estadisticas["duplicados"] += duplicados
+
+    for ruta in archivos:
+        logger.info(f"Reproduciendo {ruta}")
+        pendientes = []
+        try:
+            for fila in eventos_de_archivo(ruta, puerta, estadisticas):
+                pendientes.append(fila)
+                if len(pendientes) >= lote:
+                    cargar(pendientes)
+                    pendientes = []
+            if pendientes:
+                cargar(pendientes)
+        except Exception as e:
+            logger.error(f"Error reproduciendo {ruta}: {e}")
+            logger.error(traceback.format_exc())
+            raise
+
+        duracion = time.perf_counter() - inicio
+        logger.info(
+            f"{ruta}: acumulado {estadisticas['eventos']} eventos, {estadisticas['insertados']} insertados "
+            f"({estadisticas['eventos'] / max(duracion, 1e-9):,.0f} eventos/s)"
+        )
+
+    estadisticas["segundos"] = time.perf_counter() - inicio
+    return estadisticas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archivos", nargs="*")
+    parser.add_argument("--puerta", help="puerta de las líneas de logs viejos, que no la traen")
+    parser.add_argument("--lote", type=int, default=5000)
+    parser.add_argument("--simular", action="store_true", help="solo parsear, sin escribir en la base")
+    args = parser.parse_args()
+
+    archivos = args.archivos or archivos_por_defecto()
+    if not archivos:
+        print("No hay logs para reproducir")
+        return
+
+    e = reproducir(archivos, args.puerta, args.lote, args.simular)
+    segundos = max(e["segundos"], 1e-9)
+    print(f"{len(archivos)} archivos, {e['lineas']:,} líneas ({e['bytes'] / 1e6:.1f} MB) en {e['segundos']:.2f} s")
+    print(f"Eventos: {e['eventos']:,} → {e['insertados']:,} insertados, {e['duplicados']:,} ya existían")
+    if e["sin_puerta"]:
+        print(f"{e['sin_puerta']:,} eventos de logs viejos sin puerta salteados: hay varias puertas "
+              f"configuradas, indicar cuál con --puerta")
+    print(f"{e['lineas'] / segundos:,.0f} líneas/s, {e['eventos'] / segundos:,.0f} eventos/s, "
+          f"{e['bytes'] / 1e6 / segundos:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
-import RPi.GPIO as GPIO
-from mfrc522 import SimpleMFRC522
 from time import sleep
 import threading
 import time
 import traceback
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from database import obtener_funcionario_por_id, agregar_evento, obtener_intentos_fallidos_recientes
+from database import obtener_funcionario_por_id, agregar_evento
 from logger_config import setup_logger
+from hardware import crear_lector_rfid
+import ingesta
+from ocupacion import registrar_acceso
+from reglas_alarma import evaluar_evento
 import logging
 
 # ===============================
@@ -15,19 +17,13 @@ import logging
 # ===============================
 logger = setup_logger("rfid", "rfid_reader.log", level=logging.INFO)
 
-GPIO.setwarnings(False)
 DEBUG = True
 
-def activar_alarma(identificacion, intentos):
-    logger.warning(f"ALARMA DISPARADA para {identificacion}. Intentos={intentos}")
-    agregar_evento(identificacion, autorizado="No", operacion="Acceso", canal="Alarma")
-
-    # todo: Mostrar mensaje en globo en pagina WEB "ALARMA - INTENTO REITERADO DE ACCESO"
-
 class RFIDReader:
-    def __init__(self):
+    def __init__(self, reader=None, puerta=None):
         try:
-            self.reader = SimpleMFRC522()
+            self.reader = reader or crear_lector_rfid()
+            self.puerta = puerta
             self.running = True
             self.ultimo_rfid_leido = None
             self.ultimo_rfid_leido_dt = None
@@ -72,10 +68,12 @@ class RFIDReader:
         try:
 
             logger.info("Entro en leer rfid")
-            id, _ = self.reader.read()
+            id = self.reader.leer()
             logger.info("ya leyo")
             logger.info(id)
 
+            if id is None:
+                return None
             return str(id).zfill(8)
         except Exception as e:
             logger.error(f"Error leyendo RFID: {e}")
@@ -86,7 +84,10 @@ class RFIDReader:
         try:
             funcionario = obtener_funcionario_por_id(identificacion)
             autorizado = funcionario is not None
-            logger.info(f"Verificación RFID {identificacion}: {'AUTORIZADO' if autorizado else 'DENEGADO'}")
+            # reproducir_logs.py lee esta línea (con la puerta)
+            logger.info(
+                f"Verificación RFID {identificacion} en '{self.puerta}': {'AUTORIZADO' if autorizado else 'DENEGADO'}"
+            )
             return autorizado
         except Exception as e:
             logger.error(f"Error verificando autorización RFID: {e}")
@@ -97,17 +98,13 @@ class RFIDReader:
         try:
             logger.info(f"RFID leído: {identificacion}")
             autorizado = self.verificar_autorizacion(identificacion)
-            success, mensaje = agregar_evento(identificacion, autorizado, "rfid", "rfid")
-
-            if success and autorizado == 0:
+            success, mensaje = agregar_evento(identificacion, autorizado, "rfid", "rfid", self.puerta)
 
-                fecha = (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S")
-                logger.info(f"CONSULTANDO FECHA {fecha}")
-                intentos = obtener_intentos_fallidos_recientes(identificacion, fecha)
-                logger.info(f"Intentos fallidos de {identificacion}: {intentos}")
+            if success and autorizado:
+                registrar_acceso(identificacion, self.puerta)
 
-                if intentos >= 3:
-                    activar_alarma(identificacion, intentos)
+            if success:
+                evaluar_evento(identificacion, autorizado, "rfid", "rfid", self.puerta)
 
             if success:
                 logger.info(f"Evento RFID registrado: {identificacion} - {'AUTORIZADO' if autorizado else 'DENEGADO'}")
@@ -121,6 +118,23 @@ class RFIDReader:
             logger.error(traceback.format_exc())
             return False
 
+    def es_lectura_nueva(self, identificacion):
+        """Descarta la misma tarjeta leída de nuevo dentro de los 5 segundos."""
+        now = datetime.now()
+        if identificacion and (identificacion != self.ultimo_rfid_leido or (now - self.ultimo_rfid_leido_dt).total_seconds() > 5):
+            self.ultimo_rfid_leido = identificacion
+            self.ultimo_rfid_leido_dt = now
+            return True
+        return False
+
+    def sondear(self):
+        """Lectura no bloqueante para el gestor de dispositivos multi-puerta."""
+        id = self.reader.leer_no_bloqueante()
+        if id is None:
+            return None
+        identificacion = str(id).zfill(8)
+        return identificacion if self.es_lectura_nueva(identificacion) else None
+
     def run(self):
         logger.info("📡 Lector RFID iniciado. Esperando tarjetas...")
 
@@ -131,19 +145,8 @@ class RFIDReader:
                 logger.info("TEST")
                 logger.info(identificacion)
 
-                now = datetime.now()
-
-                if (identificacion and (identificacion != self.ultimo_rfid_leido or (now - self.ultimo_rfid_leido_dt).total_seconds() > 5)):
-                    self.ultimo_rfid_leido = identificacion
-                    self.ultimo_rfid_leido_dt = now
-
-                    thread = threading.Thread(
-                        target=self.procesar_rfid,
-                        args=(identificacion,),
-                        daemon=True,
-                        name=f"RFID-{identificacion}"
-                    )
-                    thread.start()
+                if self.es_lectura_nueva(identificacion):
+                    ingesta.encolar(self.puerta, self.procesar_rfid, identificacion)
 
                 else:
                     if DEBUG and identificacion:
@@ -164,7 +167,7 @@ class RFIDReader:
 
     def cleanup(self):
         try:
-            GPIO.cleanup()
+            self.reader.cerrar()
             logger.info("GPIO del lector RFID limpiado correctamente")
         except Exception as e:
             logger.error(f"Error en cleanup() del lector RFID: {e}")
@@ -177,19 +180,25 @@ class RFIDReader:
 
 lector_thread = None
 lector_iniciado = False
+lector_rfid = None
 
 
 def iniciar_lector_rfid():
-    global lector_iniciado, lector_thread
+    global lector_iniciado, lector_thread, lector_rfid
 
     if lector_iniciado:
         logger.warning("Lector RFID ya está en ejecución. No se reinicia.")
         return lector_thread
 
     try:
-        lector = RFIDReader()
+        reader = crear_lector_rfid()
+        if reader is None:
+            logger.info("Servicio RFID no iniciado (backend deshabilitado)")
+            return None
+
+        lector_rfid = RFIDReader(reader)
         lector_thread = threading.Thread(
-            target=lector.run, daemon=True, name="RFID-Main"
+            target=lector_rfid.run, daemon=True, name="RFID-Main"
         )
         lector_thread.start()
 
@@ -0,0 +1,404 @@
+"""
+Prueba de resistencia (soak): levanta el servicio completo con hardware
+simulado (dispositivos, supervisor, ocupación, snapshots, análisis y el
+servidor HTTP real), lo somete a tráfico RFID, PIC y HTTP a ritmo acelerado
+y muestrea memoria (tracemalloc y RSS), descriptores abiertos, hilos y el
+tamaño de Database.db-wal. Termina con código 1 si, pasado el calentamiento,
+algo crece más que su presupuesto.
+
+Las tareas periódicas se aceleran con --acelerar (checkpoint de ocupación,
+sincronización del reloj del PIC, análisis y snapshots) y los logs rotan
+cada LOG_MAX_BYTES (1 MB por defecto acá). Todo va a un directorio temporal.
+
+Uso:
+    python soak.py [--duracion 3600] [--rfid 20] [--pic 10] [--http 20]
+                   [--pic-backend simulado|firmware] [--muestreo 10] [--calentamiento 120]
+    python soak.py --duracion 14400 --csv soak.csv      # 4 horas
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duracion", type=float, default=3600, help="segundos de prueba")
+    parser.add_argument("--calentamiento", type=float, default=120,
+                        help="segundos iniciales que no cuentan para el crecimiento")
+    parser.add_argument("--muestreo", type=float, default=10, help="segundos entre muestras")
+    parser.add_argument("--rfid", type=float, default=20, help="lecturas RFID por segundo")
+    parser.add_argument("--pic", type=float, default=10, help="eventos PIC por segundo")
+    parser.add_argument("--http", type=float, default=20, help="pedidos HTTP por segundo")
+    parser.add_argument("--pic-backend", choices=("simulado", "firmware"), default="simulado",
+                        help="simulado: loopback de pyserial; firmware: main.c en el simulador (máx. ~1 lectura/s)")
+    parser.add_argument("--acelerar", type=float, default=60, help="factor para las tareas periódicas")
+    parser.add_argument("--funcionarios", type=int, default=500)
+    parser.add_argument("--directorio", help="dónde dejar base, logs y muestras (por defecto uno temporal)")
+    parser.add_argument("--csv", help="archivo de muestras (por defecto <directorio>/muestras.csv)")
+    # Presupuestos: crecimiento entre el fin del calentamiento y el final
+    # RSS incluye las páginas mapeadas de la base (DB_MMAP_BYTES) y las cachés de
+    # SQLite, que crecen con la base hasta su tope: por eso es más holgado
+    parser.add_argument("--presupuesto-rss-mb", type=float, default=30)
+    parser.add_argument("--presupuesto-tracemalloc-mb", type=float, default=15)
+    parser.add_argument("--presupuesto-fds", type=float, default=8)
+    parser.add_argument("--presupuesto-hilos", type=float, default=4)
+    # El WAL se vacía en cada checkpoint: se controla su tamaño máximo, no el crecimiento
+    parser.add_argument("--presupuesto-wal-mb", type=float, default=32)
+    parser.add_argument("--presupuesto-errores", type=float, default=0.01,
+                        help="fracción máxima de pedidos HTTP con error")
+    return parser.parse_args()
+
+
+def preparar_entorno(args, directorio):
+    """Antes de importar el servicio: config.py y logger_config.py leen el entorno al importarse."""
+    os.environ["LOG_DIR"] = os.path.join(directorio, "logs")
+    os.environ.setdefault("LOG_MAX_BYTES", str(1_000_000))
+    os.environ["DB_PATH"] = os.path.join(directorio, "Database")
+    os.environ["REPORTES_SNAPSHOT_PATH"] = os.path.join(directorio, "Database-snapshot")
+    os.environ["RFID_BACKEND"] = "simulado"
+    os.environ["PIC_BACKEND"] = args.pic_backend
+    os.environ["PUERTAS"] = "principal:rfid=0.0,serial=soak-pic"
+    os.environ["FIRMWARE_EEPROM_DIR"] = os.path.join(directorio, "eeprom")
+    acelerar = max(args.acelerar, 1.0)
+    for nombre, segundos in {
+        "OCUPACION_CHECKPOINT_S": 60,
+        "PIC_SYNC_INTERVALO_S": 60,
+        "ANALISIS_INTERVALO_S": 3600,
+        "REPORTES_SNAPSHOT_S": 300,
+    }.items():
+        os.environ.setdefault(nombre, str(segundos / acelerar))
+
+
+# ===============================
+# 🚦 GENERADORES DE TRÁFICO
+# ===============================
+
+class Generador(threading.Thread):
+    """Llama a funcion() `ritmo` veces por segundo hasta que se pida detener."""
+
+    def __init__(self, nombre, ritmo, funcion, detener):
+        super().__init__(daemon=True, name=f"Soak-{nombre}")
+        self.nombre = nombre
+        self.ritmo = ritmo
+        self.funcion = funcion
+        self.detener = detener
+        self.enviados = 0
+        self.errores = 0
+        self.ultimo_error = None
+
+    def run(self):
+        intervalo = 1.0 / self.ritmo
+        proximo = time.monotonic()
+        while not self.detener.is_set():
+            try:
+                self.funcion()
+                self.enviados += 1
+            except Exception as e:
+                self.errores += 1
+                self.ultimo_error = repr(e)
+            proximo += intervalo
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                self.detener.wait(espera)
+            else:
+                # Atrasado: se sigue desde ahora, sin ráfagas para recuperar
+                proximo = time.monotonic()
+
+
+def identificacion_al_azar(rnd, funcionarios):
+    # ~20% de tarjetas desconocidas
+    return f"{rnd.randrange(int(funcionarios * 1.25)):08d}"
+
+
+def trafico_rfid(gestor, rnd, funcionarios):
+    def enviar():
+        lectores = gestor.lectores
+        if not lectores:
+            raise RuntimeError("sin lector RFID activo")
+        lectores[0].reader.inyectar(int(identificacion_al_azar(rnd, funcionarios)))
+    return enviar
+
+
+def trafico_pic(gestor, rnd, funcionarios, backend):
+    from hardware import inyectar_lectura_firmware
+
+    def enviar():
+        cedula = identificacion_al_azar(rnd, funcionarios)
+        if backend == "firmware":
+            # El firmware decide y consulta a la Pi; el evento llega en el próximo lote
+            if not inyectar_lectura_firmware(cedula, "soak-pic"):
+                raise RuntimeError("simulador de firmware no disponible")
+            return
+        pics = gestor.pics
+        if not pics or pics[0].ser is None:
+            raise RuntimeError("sin enlace PIC activo")
+        # loop://: lo escrito vuelve como si lo hubiera mandado el PIC
+        autorizado = "Si" if int(cedula) < funcionarios else "No"
+        linea = f"tiempo={time.monotonic():.2f}, cedula={cedula}, autorizado={autorizado}, operacion=Acceso\r\n"
+        pics[0].ser.write(linea.encode("utf-8"))
+    return enviar
+
+
+def trafico_http(base, rnd, funcionarios, contador):
+    consultas = [
+        "/api/estadisticas",
+        "/api/ocupacion",
+        "/api/rfid_status",
+        "/api/alarmas/estado",
+        "/api/anomalias",
+        "/api/series?granularidad=hora",
+        "/api/series?tipo=heatmap",
+        "/api/funcionarios?limite=50",
+        "/eventos",
+        "/funcionarios",
+        "/",
+    ]
+
+    def enviar():
+        eleccion = rnd.random()
+        if eleccion < 0.3:
+            metodo, ruta = "POST", "/api/evento"
+            cuerpo = {"identificacion": identificacion_al_azar(rnd, funcionarios), "canal": "api",
+                      "puerta": "principal"}
+        elif eleccion < 0.4:
+            metodo, ruta = "POST", "/api/evento/lote"
+            cuerpo = {"eventos": [
+                {"identificacion": identificacion_al_azar(rnd, funcionarios), "canal": "api",
+                 "puerta": "principal", "clave": f"soak-{next(contador)}"}
+                for _ in range(20)
+            ]}
+        else:
+            metodo, ruta, cuerpo = "GET", rnd.choice(consultas), None
+
+        datos = json.dumps(cuerpo).encode("utf-8") if cuerpo is not None else None
+        pedido = urllib.request.Request(base + ruta, data=datos, method=metodo,
+                                        headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(pedido, timeout=30) as respuesta:
+            respuesta.read()
+    return enviar
+
+
+# ===============================
+# 📈 MUESTREO
+# ===============================
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # Sin /proc: el pico (ru_maxrss, KB en Linux) es lo mejor que hay
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def fds_abiertos():
+    for directorio in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(directorio))
+        except OSError:
+            continue
+    return None
+
+
+def muestrear(inicio, ruta_wal):
+    actual, _ = tracemalloc.get_traced_memory()
+    try:
+        wal = os.path.getsize(ruta_wal) / 1e6
+    except OSError:
+        wal = 0.0
+    return {
+        "t": round(time.monotonic() - inicio, 1),
+        "rss_mb": round(rss_mb(), 2),
+        "tracemalloc_mb": round(actual / 1e6, 2),
+        "fds": fds_abiertos(),
+        "hilos": threading.active_count(),
+        "wal_mb": round(wal, 2),
+    }
+
+
+def pendiente_por_hora(muestras, clave):
+    """Pendiente por mínimos cuadrados, en unidades por hora."""
+    puntos = [(m["t"], m[clave]) for m in muestras if m[clave] is not None]
+    if len(puntos) < 2:
+        return 0.0
+    media_t = statistics.fmean(t for t, _ in puntos)
+    media_v = statistics.fmean(v for _, v in puntos)
+    denominador = sum((t - media_t) ** 2 for t, _ in puntos)
+    if denominador == 0:
+        return 0.0
+    return sum((t - media_t) * (v - media_v) for t, v in puntos) / denominador * 3600
+
+
+def evaluar(muestras, calentamiento, args):
+    """[(métrica, inicio, final, crecimiento, por_hora, presupuesto, ok)]"""
+    estables = [m for m in muestras if m["t"] >= calentamiento] or muestras
+    # Mediana de una ventana en cada punta: una muestra suelta (GC, ráfaga) no decide
+    ventana = max(1, min(5, len(estables) // 4))
+    resultados = []
+    for clave, presupuesto in (
+        ("rss_mb", args.presupuesto_rss_mb),
+        ("tracemalloc_mb", args.presupuesto_tracemalloc_mb),
+        ("fds", args.presupuesto_fds),
+        ("hilos", args.presupuesto_hilos),
+    ):
+        valores = [m[clave] for m in estables if m[clave] is not None]
+        if not valores:
+            continue
+        inicio = statistics.median(valores[:ventana])
+        final = statistics.median(valores[-ventana:])
+        crecimiento = final - inicio
+        resultados.append((clave, inicio, final, crecimiento, pendiente_por_hora(estables, clave),
+                           presupuesto, crecimiento <= presupuesto))
+
+    maximo_wal = max(m["wal_mb"] for m in estables)
+    resultados.append(("wal_mb (máx.)", estables[0]["wal_mb"], estables[-1]["wal_mb"], maximo_wal,
+                       pendiente_por_hora(estables, "wal_mb"), args.presupuesto_wal_mb,
+                       maximo_wal <= args.presupuesto_wal_mb))
+    return resultados
+
+
+def main():
+    args = parsear_argumentos()
+    directorio = args.directorio or tempfile.mkdtemp(prefix="soak_")
+    os.makedirs(directorio, exist_ok=True)
+    preparar_entorno(args, directorio)
+
+    # Desde antes de importar el servicio, así se ve todo lo que retiene
+    tracemalloc.start(10)
+
+    import itertools
+    from werkzeug.serving import make_server
+
+    import config
+    from database import Database, iniciar_snapshots_reportes
+    from dispositivos import iniciar_dispositivos
+    from ocupacion import obtener_ocupacion
+    from analisis import iniciar_analisis_periodico
+    import app as aplicacion
+
+    conn = Database().get_connection()
+    conn.executemany(
+        "INSERT OR IGNORE INTO funcionarios (identificacion, nombre) VALUES (?, ?)",
+        [(f"{i:08d}", f"Funcionario {i}") for i in range(args.funcionarios)],
+    )
+    conn.commit()
+    conn.close()
+
+    iniciar_snapshots_reportes()
+    obtener_ocupacion()
+    gestor = iniciar_dispositivos()
+    iniciar_analisis_periodico()
+
+    # Una línea por pedido en stderr taparía el reporte; los errores siguen saliendo
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    servidor = make_server("127.0.0.1", 0, aplicacion.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="Soak-HTTP").start()
+    base = f"http://127.0.0.1:{servidor.server_port}"
+
+    detener = threading.Event()
+    rnd = random.Random(42)
+    generadores = []
+    if args.rfid > 0:
+        generadores.append(Generador("rfid", args.rfid, trafico_rfid(gestor, random.Random(1), args.funcionarios), detener))
+    if args.pic > 0:
+        generadores.append(Generador("pic", args.pic, trafico_pic(gestor, random.Random(2), args.funcionarios,
+                                                                  args.pic_backend), detener))
+    if args.http > 0:
+        generadores.append(Generador("http", args.http, trafico_http(base, rnd, args.funcionarios,
+                                                                     itertools.count()), detener))
+    for generador in generadores:
+        generador.start()
+
+    ruta_csv = args.csv or os.path.join(directorio, "muestras.csv")
+    ruta_wal = config.DB_PATH + ".db-wal"
+    campos = ["t", "rss_mb", "tracemalloc_mb", "fds", "hilos", "wal_mb"]
+    muestras = []
+    foto_base = None
+    inicio = time.monotonic()
+
+    print(f"Soak de {args.duracion:.0f} s (calentamiento {args.calentamiento:.0f} s) en {directorio}")
+    print(f"Tráfico: RFID {args.rfid}/s, PIC {args.pic}/s ({args.pic_backend}), HTTP {args.http}/s → {base}")
+    try:
+        with open(ruta_csv, "w", newline="") as archivo:
+            escritor = csv.DictWriter(archivo, fieldnames=campos)
+            escritor.writeheader()
+            while time.monotonic() - inicio < args.duracion:
+                time.sleep(min(args.muestreo, max(0.0, args.duracion - (time.monotonic() - inicio))))
+                muestra = muestrear(inicio, ruta_wal)
+                muestras.append(muestra)
+                escritor.writerow(muestra)
+                archivo.flush()
+                if foto_base is None and muestra["t"] >= args.calentamiento:
+                    foto_base = tracemalloc.take_snapshot()
+                enviados = " ".join(f"{g.nombre}={g.enviados}" for g in generadores)
+                print(f"[{muestra['t']:>7.0f}s] RSS {muestra['rss_mb']:.1f} MB, tracemalloc "
+                      f"{muestra['tracemalloc_mb']:.1f} MB, fds {muestra['fds']}, hilos {muestra['hilos']}, "
+                      f"WAL {muestra['wal_mb']:.1f} MB | {enviados}", flush=True)
+    except KeyboardInterrupt:
+        print("Interrumpido: se evalúa lo muestreado hasta acá")
+    finally:
+        detener.set()
+        for generador in generadores:
+            generador.join(timeout=5)
+        foto_final = tracemalloc.take_snapshot()
+        servidor.shutdown()
+        gestor.detener()
+
+    if not muestras:
+        print("Sin muestras")
+        return 1
+
+    print()
+    print(f"{'métrica':<16} {'inicio':>9} {'final':>9} {'crecim.':>9} {'por hora':>9} {'presup.':>9}")
+    fallas = []
+    for clave, valor_inicio, valor_final, crecimiento, por_hora, presupuesto, ok in evaluar(
+            muestras, args.calentamiento, args):
+        print(f"{clave:<16} {valor_inicio:>9.2f} {valor_final:>9.2f} {crecimiento:>9.2f} {por_hora:>9.2f} "
+              f"{presupuesto:>9.2f}  {'OK' if ok else 'EXCEDIDO'}")
+        if not ok:
+            fallas.append(clave)
+
+    print()
+    for generador in generadores:
+        total = generador.enviados + generador.errores
+        tasa = generador.errores / total if total else 0.0
+        detalle = f" (último: {generador.ultimo_error})" if generador.errores else ""
+        print(f"Tráfico {generador.nombre}: {generador.enviados} enviados, {generador.errores} errores{detalle}")
+        if generador.nombre == "http" and tasa > args.presupuesto_errores:
+            fallas.append(f"errores http {tasa:.1%}")
+
+    if foto_base is not None:
+        filtros = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+        diferencias = foto_final.filter_traces(filtros).compare_to(foto_base.filter_traces(filtros), "lineno")
+        print("\nMayor crecimiento de tracemalloc desde el fin del calentamiento:")
+        for diferencia in diferencias[:10]:
+            print(f"  {diferencia}")
+
+    print(f"\nMuestras: {ruta_csv}")
+    if fallas:
+        print(f"FALLA: presupuestos excedidos: {', '.join(fallas)}")
+        return 1
+    print("OK: dentro de los presupuestos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Pruebas sin hardware: correr desde app/flaskProject con
+
+    python -m pytest -q tests
+
+config.py y logger_config.py leen el entorno al importarse, así que acá se
+fija antes de importar cualquier módulo del servicio: logs a un directorio
+temporal y backends simulados.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TEMPORAL = tempfile.mkdtemp(prefix="pruebas-acceso-")
+os.environ["LOG_DIR"] = os.path.join(_TEMPORAL, "logs")
+os.environ["DB_PATH"] = os.path.join(_TEMPORAL, "Database")
+os.environ["REPORTES_SNAPSHOT_PATH"] = os.path.join(_TEMPORAL, "Database-snapshot")
+os.environ["RFID_BACKEND"] = "simulado"
+os.environ["PIC_BACKEND"] = "simulado"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    """Base local y central vacías por prueba (Database y BaseCentral leen config al crearse)."""
+    monkeypatch.setattr(config, "DB_PATH", str(tmp_path / "Database"))
+    monkeypatch.setattr(config, "COLECTOR_DB_PATH", str(tmp_path / "Central"))
+    monkeypatch.setattr(config, "JOURNAL_ACTIVO", False)
+    import database
+    database.Database()
+    return tmp_path
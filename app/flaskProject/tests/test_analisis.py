@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+from database import agregar_evento
+
+analisis = pytest.importorskip("analisis")
+
+
+def _hace(dias):
+    return (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_analisis_lee_solo_la_ventana(base, monkeypatch):
+    monkeypatch.setattr(config, "ANALISIS_VENTANA_DIAS", 30)
+    for i, dias in enumerate((400, 200, 31, 29, 1)):
+        assert agregar_evento(f"{i:08d}", 1, "Acceso", "rfid", "principal", _hace(dias))[0]
+    # Fuera de los canales de acceso: nunca entra
+    assert agregar_evento("00000009", "No", "intentos_fallidos", "Alarma", "principal", _hace(1))[0]
+
+    assert analisis.analizar(guardar=False)["eventos"] == 2
+    assert analisis.analizar(guardar=False, ventana_dias=365)["eventos"] == 4
+    assert analisis.analizar(guardar=False, ventana_dias=0)["eventos"] == 5
+    # Una fecha explícita manda sobre la ventana
+    assert analisis.analizar(_hace(250), guardar=False)["eventos"] == 4
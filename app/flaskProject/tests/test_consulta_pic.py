@@ -0,0 +1,321 @@
+import ctypes
+import os
+import pty
+import select
+import socket
+import threading
+import time
+import tty
+
+import pytest
+import serial
+
+import config
+import hardware
+import pic_communicator
+from database import agregar_funcionario
+from dispositivos import DispositivoSupervisado, GestorDispositivos, SupervisorDispositivos
+from pic_communicator import PICCommunicator, parsear_evento_pic
+
+# consultar_pi (main.c) espera la respuesta CONSULTA_TIMEOUT_MS y después deniega
+CONSULTA_TIMEOUT_S = 0.050
+SEGUNDOS_POR_CARACTER = 10 / 9600
+LIBRERIA = os.path.join(os.path.dirname(config.FIRMWARE_SIMULADOR), "libfirmware.so")
+
+
+@pytest.fixture
+def pic_emulado(base, monkeypatch):
+    """Un PIC emulado en el maestro de un pty; el PICCommunicator abre el esclavo."""
+    monkeypatch.setattr(config, "PIC_SYNC_INTERVALO_S", 0)
+    maestro, esclavo = pty.openpty()
+    tty.setraw(esclavo)
+    ser = serial.serial_for_url(os.ttyname(esclavo), timeout=1)
+    comm = PICCommunicator(ser=ser, puerta="principal")
+    # Reabrir (supervisor) es volver a abrir el mismo esclavo
+    monkeypatch.setattr(comm, "init_serial", lambda: setattr(
+        comm, "ser", serial.serial_for_url(os.ttyname(esclavo), timeout=1)
+    ))
+    yield maestro, comm
+    comm.cerrar()
+    os.close(maestro)
+    os.close(esclavo)
+
+
+def _consultar(maestro, cedula, timeout=CONSULTA_TIMEOUT_S):
+    """Como consultar_pi: envía "Q<cedula>" y espera "S/N<cedula>". None si vence el plazo."""
+    for byte in f"Q{cedula}\r\n".encode("utf-8"):
+        os.write(maestro, bytes([byte]))
+        time.sleep(SEGUNDOS_POR_CARACTER)
+
+    # El plazo del PIC corre desde que terminó de enviar la consulta
+    limite = time.perf_counter() + timeout
+    pendiente = b""
+    while True:
+        restante = limite - time.perf_counter()
+        if restante <= 0:
+            return None
+        listos, _, _ = select.select([maestro], [], [], restante)
+        if not listos:
+            continue
+        pendiente += os.read(maestro, 256)
+        while b"\n" in pendiente:
+            linea, pendiente = pendiente.split(b"\n", 1)
+            linea = linea.strip().decode("utf-8")
+            if linea[:1] in ("S", "N") and linea[1:] == cedula:
+                return linea[0]
+
+
+class LectorColgado:
+    """Un MFRC522 cuyo read no vuelve hasta que se lo suelta."""
+
+    def __init__(self):
+        self.soltar = threading.Event()
+        self.colgado = threading.Event()
+        self.procesar_rfid = None
+
+    def sondear(self):
+        self.colgado.set()
+        self.soltar.wait(timeout=5)
+        return None
+
+    def cleanup(self):
+        pass
+
+
+def test_consulta_responde_si_y_no(pic_emulado):
+    maestro, comm = pic_emulado
+    agregar_funcionario("00000001", "Ana")
+    comm.iniciar_lector()
+
+    assert _consultar(maestro, "00000001") == "S"
+    assert _consultar(maestro, "00000002") == "N"
+
+
+def test_consulta_ida_y_vuelta_menor_a_50_ms(pic_emulado):
+    maestro, comm = pic_emulado
+    agregar_funcionario("00000001", "Ana")
+    comm.iniciar_lector()
+
+    # Desde el primer carácter de la consulta (~11 ms de cable) hasta la respuesta
+    duraciones = []
+    for i in range(40):
+        inicio = time.perf_counter()
+        assert _consultar(maestro, "00000001" if i % 2 else f"{i:08d}") is not None
+        duraciones.append(time.perf_counter() - inicio)
+    duraciones.sort()
+    assert duraciones[int(len(duraciones) * 0.95)] < 0.050
+
+
+def test_consulta_sin_lector_vence_y_sondear_lo_lanza(pic_emulado):
+    maestro, comm = pic_emulado
+    agregar_funcionario("00000001", "Ana")
+
+    # Sin hilo lector nadie contesta a tiempo: el PIC deniega
+    assert _consultar(maestro, "00000001") is None
+
+    # La primera pasada del sondeo lanza el lector; la consulta vencida se
+    # contesta tarde (el PIC la descarta) y las siguientes llegan a tiempo
+    assert comm.sondear() == []
+    assert _consultar(maestro, "00000002") == "N"
+
+
+def test_consulta_no_espera_al_sondeo_colgado(pic_emulado):
+    maestro, comm = pic_emulado
+    agregar_funcionario("00000001", "Ana")
+    lector = LectorColgado()
+
+    gestor = GestorDispositivos(puertas=[])
+    gestor.dispositivos = [
+        DispositivoSupervisado("pic", "principal", "pty", comm),
+        DispositivoSupervisado("rfid", "deposito", "0.1", lector),
+    ]
+    gestor.running = True
+    with gestor.lock:
+        gestor._lanzar_bucle()
+    try:
+        assert lector.colgado.wait(timeout=2)
+        assert _consultar(maestro, "00000001") == "S"
+        assert gestor.sondeando.nombre == "rfid:deposito"
+    finally:
+        gestor.running = False
+        lector.soltar.set()
+        gestor.detener()
+
+
+def test_supervisor_reabre_el_enlace_si_el_lector_se_cuelga(pic_emulado, monkeypatch):
+    maestro, comm = pic_emulado
+    monkeypatch.setattr(config, "DISPOSITIVOS_STALL_S", 0.2)
+    agregar_funcionario("00000001", "Ana")
+
+    # La primera consulta se queda colgada en la base; las demás no
+    soltar, colgado = threading.Event(), threading.Event()
+    buscar = pic_communicator.obtener_funcionario_por_id
+
+    def buscar_colgado(cedula):
+        if not colgado.is_set():
+            colgado.set()
+            soltar.wait(timeout=5)
+        return buscar(cedula)
+
+    monkeypatch.setattr(pic_communicator, "obtener_funcionario_por_id", buscar_colgado)
+    dispositivo = DispositivoSupervisado("pic", "principal", "pty", comm)
+    gestor = GestorDispositivos(puertas=[])
+    gestor.dispositivos = [dispositivo]
+    supervisor = SupervisorDispositivos(gestor)
+    try:
+        comm.sondear()
+        assert _consultar(maestro, "00000001") is None
+        assert colgado.is_set()
+        time.sleep(0.3)
+
+        # Sin latido: el enlace queda inactivo y se reabre en la misma revisión
+        supervisor.revisar()
+        assert dispositivo.activo
+        assert dispositivo.reinicios == 1
+        assert dispositivo.ultimo_error == "hilo lector colgado"
+
+        # El sondeo lanza el lector del puerto nuevo, que contesta a tiempo
+        comm.sondear()
+        assert _consultar(maestro, "00000001") == "S"
+    finally:
+        soltar.set()
+
+
+def test_eventos_pic_llegan_por_sondear(pic_emulado):
+    maestro, comm = pic_emulado
+    comm.iniciar_lector()
+
+    os.write(maestro, b"tiempo=12.50, cedula=00000001, autorizado=Si, operacion=Acceso\r\n")
+    os.write(maestro, b"tiempo=13.")
+    time.sleep(0.2)
+    assert comm.sondear() == ["tiempo=12.50, cedula=00000001, autorizado=Si, operacion=Acceso"]
+
+    # La línea a medias queda en el lector hasta que termine de llegar
+    os.write(maestro, b"00, cedula=00000002, autorizado=No, operacion=Acceso\r\n")
+    time.sleep(0.2)
+    assert comm.sondear() == ["tiempo=13.00, cedula=00000002, autorizado=No, operacion=Acceso"]
+
+
+@pytest.mark.skipif(not os.path.exists(config.FIRMWARE_SIMULADOR), reason="simulador sin compilar (make -C simulador)")
+def test_consulta_contra_el_firmware(base, monkeypatch):
+    monkeypatch.setattr(config, "PIC_SYNC_INTERVALO_S", 0)
+    monkeypatch.setattr(config, "FIRMWARE_EEPROM_DIR", "")
+    puerto = "pruebas-consulta"
+    agregar_funcionario("10000001", "Ana")
+
+    comm = PICCommunicator(ser=hardware.abrir_puerto_serial(backend=hardware.BACKEND_FIRMWARE, puerto=puerto))
+    comm.iniciar_lector()
+    try:
+        # Solo la Pi conoce 10000001; el PIC la guarda en su caché tras la primera 'S'.
+        # Con MAX_EVENTOS (5) lecturas el PIC manda los eventos sin esperar 5 minutos.
+        lecturas = ["10000001", "10000002", "10000001", "10000002", "10000002"]
+        for codigo in lecturas:
+            assert hardware.inyectar_lectura_firmware(codigo, puerto)
+            time.sleep(0.8)     # procesar la lectura y el parpadeo de 500 ms del LED
+
+        eventos = []
+        limite = time.monotonic() + 5
+        while len(eventos) < len(lecturas) and time.monotonic() < limite:
+            eventos += [parsear_evento_pic(linea) for linea in comm.sondear()]
+            time.sleep(0.05)
+    finally:
+        comm.cerrar()
+        hardware._terminar(hardware._simuladores.pop(puerto))
+
+    assert [(cedula, autorizado) for cedula, autorizado, _, _ in eventos if cedula] == [
+        ("10000001", 1), ("10000002", 0), ("10000001", 1), ("10000002", 0), ("10000002", 0),
+    ]
+    # Una consulta por lectura de 10000002; 10000001 solo la primera vez (caché del PIC)
+    assert comm.consultas_respondidas == 4
+
+
+@pytest.mark.skipif(not os.path.exists(config.FIRMWARE_SIMULADOR), reason="simulador sin compilar (make -C simulador)")
+def test_comando_de_la_pi_durante_la_consulta_no_se_pierde(base, monkeypatch):
+    monkeypatch.setattr(config, "PIC_SYNC_INTERVALO_S", 0)
+    monkeypatch.setattr(config, "FIRMWARE_EEPROM_DIR", "")
+    puerto = "pruebas-comando"
+    agregar_funcionario("10000001", "Ana")
+
+    comm = PICCommunicator(ser=hardware.abrir_puerto_serial(backend=hardware.BACKEND_FIRMWARE, puerto=puerto))
+    responder = comm.responder_consulta
+
+    def alta_y_respuesta(cedula):
+        # Un alta desde la web llega justo mientras el PIC espera la respuesta
+        comm.enviar_comando_pic("A", "10000003")
+        return responder(cedula)
+
+    monkeypatch.setattr(comm, "responder_consulta", alta_y_respuesta)
+    comm.iniciar_lector()
+    try:
+        # Tras la primera lectura parpadean dos LEDs (acceso y alta): 2 × 500 ms
+        for codigo, espera in [("10000001", 1.3), ("10000003", 0.8), ("10000003", 0.8), ("10000003", 0.8)]:
+            assert hardware.inyectar_lectura_firmware(codigo, puerto)
+            time.sleep(espera)
+
+        eventos = []
+        limite = time.monotonic() + 5
+        while len(eventos) < 5 and time.monotonic() < limite:
+            eventos += [parsear_evento_pic(linea) for linea in comm.sondear()]
+            time.sleep(0.05)
+    finally:
+        comm.cerrar()
+        hardware._terminar(hardware._simuladores.pop(puerto))
+
+    # El alta se aplicó después de la consulta y 10000003 ya no pregunta
+    assert [(cedula, autorizado, operacion) for cedula, autorizado, operacion, _ in eventos] == [
+        ("10000001", 1, "Acceso"), ("10000003", 1, "Alta"),
+        ("10000003", 1, "Acceso"), ("10000003", 1, "Acceso"), ("10000003", 1, "Acceso"),
+    ]
+    assert comm.consultas_respondidas == 1
+
+
+@pytest.fixture
+def consulta_firmware():
+    """consultar_pi de libfirmware.so con la UART simulada en un socket; devuelve (lib, lado de la Pi)."""
+    if not os.path.exists(LIBRERIA):
+        pytest.skip("libfirmware.so sin compilar (make -C simulador lib)")
+    lib = ctypes.CDLL(LIBRERIA)
+    for nombre in ("consultar_pi", "leer_codigo_barras"):
+        getattr(lib, nombre).restype = ctypes.c_uint8
+    pic, pi = socket.socketpair()
+    lib.sim_iniciar(0)
+    lib.sim_conectar_uart(pic.fileno(), -1)
+    ctypes.c_uint8.in_dll(lib, "descartar_linea").value = 0
+    yield lib, pi
+    # Lo que quedó en camino por la UART simulada no pasa a la prueba siguiente
+    for _ in range(100):
+        lib.leer_codigo_barras()
+        lib.hal_delay_us(1000)
+    lib.sim_conectar_uart(-1, -1)
+    pic.close()
+    pi.close()
+
+
+def _apartado(lib):
+    leidos = b""
+    while True:
+        c = lib.leer_codigo_barras()
+        if not c:
+            return leidos
+        leidos += bytes([c])
+
+
+def test_firmware_aparta_lineas_completas_durante_la_consulta(consulta_firmware):
+    lib, pi = consulta_firmware
+    # Respuesta vieja de otra consulta, un comando, una línea que no entra en el apartado y el reloj
+    # (41 caracteres: ~43 ms de cable, dentro de CONSULTA_TIMEOUT_MS)
+    pi.sendall(b"N9\r\nA10000003\r\nX999999999\r\nT\r\nS10000001\r\n")
+
+    assert lib.consultar_pi(b"10000001") == 1
+    assert _apartado(lib) == b"A10000003\rT\r"
+    assert ctypes.c_uint8.in_dll(lib, "descartar_linea").value == 0
+
+
+def test_firmware_descarta_la_respuesta_que_llega_tarde(consulta_firmware):
+    lib, pi = consulta_firmware
+    # Vence el plazo a mitad de la respuesta: el resto no es una lectura
+    pi.sendall(b"S1000")
+
+    assert lib.consultar_pi(b"10000001") == 2
+    assert _apartado(lib) == b""
+    assert ctypes.c_uint8.in_dll(lib, "descartar_linea").value == 1
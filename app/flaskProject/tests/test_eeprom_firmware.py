@@ -0,0 +1,166 @@
+"""
+Tabla de cédulas de main.c (EEPROM) contra libfirmware.so: el firmware
+compilado con el HAL simulado ("make -C simulador lib").
+"""
+import ctypes
+import math
+import os
+
+import pytest
+
+import config
+
+LIBRERIA = os.path.join(os.path.dirname(config.FIRMWARE_SIMULADOR), "libfirmware.so")
+
+pytestmark = pytest.mark.skipif(not os.path.exists(LIBRERIA), reason="libfirmware.so sin compilar (make -C simulador lib)")
+
+# Constantes de main.c
+NUM_SLOTS = 28
+SLOT_BYTES = 9
+SLOT_NINGUNO = 255
+EE_FIRMA_DIR = 255
+EE_FIRMA = 0x5A
+ESTADO_VACIO = 0xFF
+ESTADO_VALIDA = 0xA4
+ESTADO_BORRADA = 0x24
+ESTADO_FASE = 0x01
+
+
+class Contadores(ctypes.Structure):
+    _fields_ = [
+        ("ciclos", ctypes.c_uint64),
+        ("llamadas", ctypes.c_ulong),
+        ("ee_lecturas", ctypes.c_ulong),
+        ("ee_escrituras", ctypes.c_ulong),
+        ("tx_bytes", ctypes.c_ulong),
+        ("rx_bytes", ctypes.c_ulong),
+        ("rx_desbordes", ctypes.c_ulong),
+        ("ticks", ctypes.c_ulong),
+    ]
+
+
+class Firmware:
+    def __init__(self, lib):
+        self.lib = lib
+        self.eeprom = (ctypes.c_uint8 * 256).in_dll(lib, "sim_eeprom")
+        self.desgaste = (ctypes.c_ulong * 256).in_dll(lib, "sim_desgaste")
+        self.sim = Contadores.in_dll(lib, "sim")
+
+    def global_u8(self, nombre):
+        return ctypes.c_uint8.in_dll(self.lib, nombre).value
+
+    def arrancar(self):
+        """Reinicio del PIC: la EEPROM se conserva, la RAM se reconstruye."""
+        self.lib.inicializar_cedulas()
+        self.lib.eeprom_vaciar_cola()
+
+    def cargar(self, cedula):
+        ok = self.lib.cargar_cedula(cedula.encode())
+        self.lib.eeprom_vaciar_cola()
+        return ok
+
+    def borrar(self, cedula):
+        slot = self.lib.buscar_slot(cedula.encode())
+        assert slot != SLOT_NINGUNO
+        self.lib.borrar_slot(slot)
+        self.lib.eeprom_vaciar_cola()
+        return slot
+
+    def esta(self, cedula):
+        return bool(self.lib.comparar_con_cedulas(cedula.encode()))
+
+    def estado(self, slot):
+        return self.eeprom[slot * SLOT_BYTES]
+
+
+@pytest.fixture(scope="module")
+def libreria():
+    lib = ctypes.CDLL(LIBRERIA)
+    # Devuelven uint8_t: sin restype ctypes lee el registro entero, con basura arriba
+    for nombre in ("comparar_con_cedulas", "buscar_slot", "cargar_cedula"):
+        getattr(lib, nombre).restype = ctypes.c_uint8
+    return lib
+
+
+@pytest.fixture
+def firmware(libreria):
+    """EEPROM virgen (0xFF) y contadores en cero; los globales del firmware los rehace arrancar()."""
+    libreria.sim_iniciar(0)
+    return Firmware(libreria)
+
+
+def test_migracion_del_formato_anterior(firmware):
+    # Formato anterior: 5 × 8 bytes desde la dirección 0, 0xFF = libre, sin firma
+    anteriores = {0: "10000001", 1: "10000002", 3: "10000004"}
+    for posicion, cedula in anteriores.items():
+        for j, digito in enumerate(cedula.encode()):
+            firmware.eeprom[posicion * 8 + j] = digito
+
+    firmware.arrancar()
+
+    assert firmware.eeprom[EE_FIRMA_DIR] == EE_FIRMA
+    assert firmware.global_u8("cedulas_registradas") == 3
+    assert all(firmware.esta(cedula) for cedula in anteriores.values())
+    assert not firmware.esta("10000003")
+    # Compactadas en los slots 0..2; el resto de los que pisaban el formato viejo, vacíos
+    assert [firmware.estado(slot) for slot in range(5)] == [ESTADO_VALIDA] * 3 + [ESTADO_VACIO] * 2
+    assert firmware.global_u8("slot_siguiente") == 3
+
+    # Un segundo arranque no vuelve a migrar ni escribe nada
+    escrituras = firmware.sim.ee_escrituras
+    firmware.arrancar()
+    assert firmware.sim.ee_escrituras == escrituras
+    assert firmware.global_u8("cedulas_registradas") == 3
+    assert all(firmware.esta(cedula) for cedula in anteriores.values())
+
+
+def test_baja_es_una_lapida_de_un_byte(firmware):
+    firmware.arrancar()
+    for cedula in ("10000001", "10000002", "10000003"):
+        assert firmware.cargar(cedula)
+    antes = bytes(firmware.eeprom)
+    escrituras = firmware.sim.ee_escrituras
+
+    slot = firmware.borrar("10000002")
+
+    # Solo cambia el byte de estado del slot, y conserva la fase
+    assert firmware.sim.ee_escrituras - escrituras == 1
+    dir_estado = slot * SLOT_BYTES
+    assert firmware.eeprom[dir_estado] == ESTADO_BORRADA | (antes[dir_estado] & ESTADO_FASE)
+    assert [i for i in range(256) if firmware.eeprom[i] != antes[i]] == [dir_estado]
+    assert not firmware.esta("10000002")
+    assert firmware.esta("10000001") and firmware.esta("10000003")
+
+    # La lápida sobrevive al reinicio y el alta siguiente no reusa el slot todavía
+    firmware.arrancar()
+    assert firmware.global_u8("cedulas_registradas") == 2
+    assert not firmware.esta("10000002")
+    assert firmware.cargar("10000004")
+    assert firmware.lib.buscar_slot(b"10000004") == 3
+
+
+def test_altas_y_bajas_reparten_el_desgaste_en_el_anillo(firmware):
+    firmware.arrancar()
+    for i in range(256):
+        firmware.desgaste[i] = 0
+
+    rondas, por_ronda = 200, 5
+    for ronda in range(rondas):
+        cedulas = [f"{30000000 + i:08d}" for i in range(por_ronda)]
+        for cedula in cedulas:
+            assert firmware.cargar(cedula)
+        if ronda == rondas // 2:
+            # Un reinicio a mitad de camino retoma el puntero donde quedó
+            siguiente, fase = firmware.global_u8("slot_siguiente"), firmware.global_u8("fase_actual")
+            firmware.arrancar()
+            assert (firmware.global_u8("slot_siguiente"), firmware.global_u8("fase_actual")) == (siguiente, fase)
+        for cedula in cedulas:
+            firmware.borrar(cedula)
+
+    # Sin anillo los estados de los slots 0..4 se llevarían 2 × rondas escrituras;
+    # con anillo cada slot recibe su parte de las altas (alta + lápida por vuelta)
+    altas = rondas * por_ronda
+    assert max(firmware.desgaste) <= 2 * math.ceil(altas / NUM_SLOTS)
+    assert all(firmware.desgaste[slot * SLOT_BYTES] > 0 for slot in range(NUM_SLOTS))
+    # Los bytes fuera de la tabla (firma) no se tocan
+    assert firmware.desgaste[EE_FIRMA_DIR] == 0
@@ -0,0 +1,74 @@
+import database
+from database import (
+    agregar_funcionario,
+    buscar_funcionarios,
+    eliminar_funcionario,
+    modificar_funcionario,
+)
+
+
+def _ids(filas):
+    return [identificacion for identificacion, _ in filas]
+
+
+def _fts_integro():
+    conn = database.Database().get_connection()
+    try:
+        # Falla si el índice externo no coincide con la tabla
+        conn.execute("INSERT INTO funcionarios_fts (funcionarios_fts, rank) VALUES ('integrity-check', 1)")
+        return True
+    finally:
+        conn.close()
+
+
+def test_fts_sigue_a_altas_cambios_y_bajas(base):
+    agregar_funcionario("10000001", "Ana Pérez")
+    agregar_funcionario("10000002", "Andrés Gómez")
+    agregar_funcionario("10000003", "Beatriz Soto")
+
+    assert _ids(buscar_funcionarios("an")[0]) == ["10000001", "10000002"]
+
+    modificar_funcionario("10000002", "Carlos Gómez")
+    assert _ids(buscar_funcionarios("an")[0]) == ["10000001"]
+    assert _ids(buscar_funcionarios("carl")[0]) == ["10000002"]
+
+    eliminar_funcionario("10000001")
+    assert _ids(buscar_funcionarios("an")[0]) == []
+    assert _ids(buscar_funcionarios("1000000")[0]) == ["10000003", "10000002"]
+
+    # Un alta con la rowid liberada por la baja no arrastra el texto viejo
+    agregar_funcionario("10000004", "Diego Ruiz")
+    assert _ids(buscar_funcionarios("ana")[0]) == []
+    assert _ids(buscar_funcionarios("die")[0]) == ["10000004"]
+    assert _fts_integro()
+
+
+def test_paginado_keyset_sin_duplicados_ni_huecos(base):
+    # Nombres repetidos: el desempate por identificación tiene que mantener el orden
+    esperados = []
+    for i in range(23):
+        identificacion = f"2{i:07d}"
+        agregar_funcionario(identificacion, f"Funcionario {i % 5}")
+        esperados.append((f"Funcionario {i % 5}", identificacion))
+    esperados.sort()
+
+    for texto in ("", "func"):
+        vistos, despues, paginas = [], None, 0
+        while True:
+            filas, despues = buscar_funcionarios(texto, despues=despues, limite=5)
+            vistos.extend(filas)
+            paginas += 1
+            if despues is None:
+                break
+        assert [(nombre, identificacion) for identificacion, nombre in vistos] == esperados
+        assert paginas == 5
+
+
+def test_limite_negativo_o_cero_devuelve_al_menos_una_fila(base):
+    agregar_funcionario("30000001", "Ana")
+    agregar_funcionario("30000002", "Berta")
+
+    for limite in (0, -5):
+        filas, siguiente = buscar_funcionarios("", limite=limite)
+        assert _ids(filas) == ["30000001"]
+        assert siguiente == ("Ana", "30000001")
@@ -0,0 +1,48 @@
+import database
+from database import agregar_evento, importar_eventos_historicos
+
+
+def _fila(identificacion, fecha_hora, canal="rfid"):
+    return (identificacion, fecha_hora, 1, "Acceso", canal, "principal")
+
+
+def _guardados():
+    conn = database.Database().get_connection()
+    try:
+        return conn.execute(
+            "SELECT identificacion, fecha_hora, historico FROM eventos ORDER BY fecha_hora, id"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def test_dos_lineas_iguales_con_un_solo_evento_guardado(base):
+    # El INSERT original quedó un segundo después de la hora del log
+    assert agregar_evento("00000001", 1, "Acceso", "rfid", "principal", "2026-01-01 08:00:01")[0]
+
+    # Dos pasadas reales de la misma tarjeta en el mismo segundo
+    filas = [_fila("00000001", "2026-01-01 08:00:00")] * 2
+    assert importar_eventos_historicos(filas) == (1, 1)
+    assert _guardados() == [
+        ("00000001", "2026-01-01 08:00:00", 1),
+        ("00000001", "2026-01-01 08:00:01", 0),
+    ]
+
+    # Reimportar el mismo log ya no agrega nada: los dos eventos cubren las dos líneas
+    assert importar_eventos_historicos(filas) == (0, 2)
+
+
+def test_cada_evento_guardado_cubre_una_sola_linea(base):
+    for fecha_hora in ("2026-01-01 08:00:00", "2026-01-01 08:00:00"):
+        assert agregar_evento("00000001", 1, "Acceso", "rfid", "principal", fecha_hora)[0]
+
+    filas = [
+        _fila("00000001", "2026-01-01 07:59:59"),
+        _fila("00000001", "2026-01-01 08:00:00"),
+        _fila("00000001", "2026-01-01 08:00:01"),
+        # Otro canal u otra persona en el mismo segundo no son duplicados
+        _fila("00000001", "2026-01-01 08:00:00", canal="pic"),
+        _fila("00000002", "2026-01-01 08:00:00"),
+    ]
+    assert importar_eventos_historicos(filas) == (3, 2)
+    assert len(_guardados()) == 5
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import database
+from database import agregar_eventos_lote, agregar_funcionario
+
+
+def _eventos_guardados():
+    conn = database.Database().get_connection()
+    try:
+        return conn.execute("SELECT id, identificacion, autorizado, historico FROM eventos ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def _reciente(segundos=0):
+    return (datetime.now() - timedelta(seconds=segundos)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_reenvio_con_la_misma_clave_es_idempotente(base):
+    agregar_funcionario("00000001", "Ana")
+    lote = [
+        {"identificacion": "00000001", "canal": "rfid", "puerta": "principal", "fecha_hora": _reciente(), "clave": "a-1"},
+        {"identificacion": "00000002", "canal": "rfid", "puerta": "principal", "fecha_hora": _reciente(), "clave": "a-2"},
+    ]
+
+    ok, primero = agregar_eventos_lote(lote)
+    assert ok
+    assert [(r["status"], r["autorizado"]) for r in primero] == [("success", True), ("success", False)]
+
+    # El cliente no vio la respuesta y reenvía el lote entero, más uno nuevo
+    ok, segundo = agregar_eventos_lote(lote + [{"identificacion": "00000001", "canal": "rfid", "clave": "a-3"}])
+    assert ok
+    assert [r["status"] for r in segundo] == ["duplicado", "duplicado", "success"]
+    assert [r["id"] for r in segundo[:2]] == [r["id"] for r in primero]
+    assert [r["autorizado"] for r in segundo[:2]] == [True, False]
+    assert segundo[0]["nombre_funcionario"] == "Ana"
+    assert len(_eventos_guardados()) == 3
+
+    # La misma clave repetida dentro de un lote se registra una vez
+    ok, repetidos = agregar_eventos_lote([{"identificacion": "00000001", "clave": "b-1"}] * 2)
+    assert [r["status"] for r in repetidos] == ["success", "duplicado"]
+    assert repetidos[0]["id"] == repetidos[1]["id"]
+    assert len(_eventos_guardados()) == 4
+
+
+def test_lote_parcialmente_invalido_guarda_los_validos(base):
+    agregar_funcionario("00000001", "Ana")
+    lote = [
+        {"identificacion": "00000001", "canal": "rfid", "fecha_hora": _reciente()},
+        {"canal": "rfid", "fecha_hora": _reciente()},
+        {"identificacion": "00000001", "fecha_hora": "2026-13-01 08:00:00", "clave": "mala"},
+        {"identificacion": "00000001", "fecha_hora": 12345},
+        {"identificacion": "00000003", "canal": "pic", "fecha_hora": _reciente(3600)},
+    ]
+
+    ok, resultados = agregar_eventos_lote(lote)
+    assert ok
+    assert [r["status"] for r in resultados] == ["success", "error", "error", "error", "success"]
+    assert resultados[1]["message"] == "Identificación requerida"
+    assert "fecha_hora inválida" in resultados[2]["message"]
+    assert resultados[4]["historico"] is True
+
+    guardados = _eventos_guardados()
+    assert [(identificacion, autorizado, historico) for _, identificacion, autorizado, historico in guardados] == [
+        ("00000001", 1, 0), ("00000003", 0, 1),
+    ]
+    assert [r["id"] for r in resultados if r["status"] == "success"] == [fila[0] for fila in guardados]
+
+    # La clave de un evento rechazado no quedó tomada: corregido, se registra
+    ok, reintento = agregar_eventos_lote([{"identificacion": "00000001", "fecha_hora": _reciente(), "clave": "mala"}])
+    assert [r["status"] for r in reintento] == ["success"]
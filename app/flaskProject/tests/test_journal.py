@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+
+import pytest
+
+import config
+import database
+import journal
+from journal import ARCHIVO_RECHAZADOS, Journal, codificar_registro
+
+
+def _evento(identificacion, segundo=0):
+    return {
+        "identificacion": identificacion, "fecha_hora": f"2026-01-01 08:00:{segundo:02d}",
+        "autorizado": 1, "operacion": "Acceso", "canal": "api", "puerta": "principal",
+    }
+
+
+def _escribir_segmento(directorio, registros, cola=b""):
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, "segmento-00000001.log")
+    with open(ruta, "wb") as f:
+        for seq, evento in registros:
+            f.write(codificar_registro(seq, evento))
+        f.write(cola)
+    return ruta
+
+
+def _abrir(directorio, aplicar=None):
+    j = Journal(directorio=str(directorio), aplicar=aplicar or database.aplicar_eventos_journal)
+    j.abrir(database.obtener_ultimo_seq_journal())
+    j.iniciar()
+    return j
+
+
+def _identificaciones():
+    conn = database.Database().get_connection()
+    try:
+        return [fila[0] for fila in conn.execute("SELECT identificacion FROM eventos ORDER BY id")]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def directorio(base):
+    return base / "journal"
+
+
+@pytest.fixture
+def sin_espera(monkeypatch):
+    """Sin el backoff entre reintentos (time.sleep del módulo journal)."""
+    monkeypatch.setattr(journal.time, "sleep", lambda segundos: None)
+
+
+def test_cola_cortada_o_con_crc_invalido_se_descarta(directorio):
+    # Un registro completo con crc roto y otro cortado a la mitad
+    roto = bytearray(codificar_registro(3, _evento("00000003")))
+    roto[-1] ^= 0xFF
+    cortado = codificar_registro(4, _evento("00000004"))[:10]
+    ruta = _escribir_segmento(directorio, [(1, _evento("00000001")), (2, _evento("00000002"))], bytes(roto) + cortado)
+    largo_valido = len(codificar_registro(1, _evento("00000001"))) + len(codificar_registro(2, _evento("00000002")))
+
+    j = _abrir(directorio)
+    assert j.esperar_aplicado(timeout=5)
+    j.detener()
+
+    assert _identificaciones() == ["00000001", "00000002"]
+    assert database.obtener_ultimo_seq_journal() == 2
+    # El segmento se trunca al último registro válido, o se borra ya aplicado
+    assert not os.path.exists(ruta) or os.path.getsize(ruta) == largo_valido
+
+
+def test_replay_dos_veces_no_duplica(directorio):
+    _escribir_segmento(directorio, [(seq, _evento(f"{seq:08d}")) for seq in (1, 2, 3)])
+
+    j = _abrir(directorio)
+    assert j.esperar_aplicado(timeout=5)
+    j.detener()
+    assert database.obtener_ultimo_seq_journal() == 3
+
+    # Segundo arranque sobre el mismo directorio: journal_estado.ultimo_seq ya cubre todo
+    j = _abrir(directorio)
+    assert j.para_aplicar.empty()
+    assert j.esperar_aplicado(timeout=5)
+    ok, _ = j.registrar(_evento("00000004"))
+    assert ok
+    assert j.esperar_aplicado(timeout=5)
+    j.detener()
+
+    assert _identificaciones() == ["00000001", "00000002", "00000003", "00000004"]
+    assert database.obtener_ultimo_seq_journal() == 4
+
+
+def test_evento_que_siempre_falla_va_a_rechazados(directorio, monkeypatch, sin_espera):
+    monkeypatch.setattr(config, "JOURNAL_REINTENTOS", 3)
+    intentos = []
+
+    def aplicar(lote, ultimo_seq=None):
+        if any(evento["identificacion"] == "malo" for _, evento in lote):
+            intentos.append(len(lote))
+            raise ValueError("registro inválido")
+        database.aplicar_eventos_journal(lote, ultimo_seq)
+
+    _escribir_segmento(directorio, [(1, _evento("00000001")), (2, _evento("malo")), (3, _evento("00000003"))])
+    j = _abrir(directorio, aplicar)
+    assert j.esperar_aplicado(timeout=5)
+    j.detener()
+
+    # JOURNAL_REINTENTOS con el lote entero y una vez más solo
+    assert intentos == [3, 3, 3, 1]
+    assert _identificaciones() == ["00000001", "00000003"]
+    assert database.obtener_ultimo_seq_journal() == 3
+    with open(directorio / ARCHIVO_RECHAZADOS, encoding="utf-8") as f:
+        rechazados = [json.loads(linea) for linea in f]
+    assert [(r["seq"], r["evento"]["identificacion"]) for r in rechazados] == [(2, "malo")]
+    assert j.rechazados == 1
+
+
+def test_registrar_no_confirma_antes_del_fsync(directorio, monkeypatch):
+    monkeypatch.setattr(config, "JOURNAL_GRUPO_MS", 0)
+    j = _abrir(directorio)
+
+    fsync_real = os.fsync
+    en_fsync = threading.Event()
+    soltar = threading.Event()
+
+    def fsync_lento(fd):
+        if fd == j.segmento.fileno():
+            en_fsync.set()
+            soltar.wait(timeout=5)
+        fsync_real(fd)
+
+    monkeypatch.setattr(os, "fsync", fsync_lento)
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(j.registrar(_evento("00000001"), timeout=0.05)))
+    hilo.start()
+    try:
+        assert en_fsync.wait(timeout=2)
+        # Pasó el timeout con el fsync en curso: todavía no hay respuesta
+        hilo.join(timeout=0.3)
+        assert resultado == []
+    finally:
+        soltar.set()
+    hilo.join(timeout=2)
+    j.detener()
+
+    assert resultado == [(True, "Evento registrado correctamente")]
+
+
+def test_registrar_falla_si_el_fsync_falla(directorio, monkeypatch):
+    j = _abrir(directorio)
+
+    def fsync_roto(fd):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(os, "fsync", fsync_roto)
+    ok, mensaje = j.registrar(_evento("00000001"))
+    monkeypatch.undo()
+    j.detener()
+
+    assert not ok
+    assert "journal" in mensaje
+    assert _identificaciones() == []
@@ -0,0 +1,52 @@
+import database
+import ocupacion
+from database import agregar_evento, importar_eventos_historicos
+from ocupacion import MotorOcupacion
+
+
+def _acceso(identificacion, segundo, puerta="principal", autorizado=1):
+    ok, _ = agregar_evento(identificacion, autorizado, "Acceso", "rfid", puerta, f"2026-01-01 08:00:{segundo:02d}")
+    assert ok
+
+
+def test_ocupacion_se_reconstruye_desde_el_checkpoint(base, monkeypatch):
+    _acceso("00000001", 1)
+    _acceso("00000002", 2, puerta="deposito")
+    _acceso("00000001", 3)
+    _acceso("00000003", 4, autorizado=0)
+
+    antes = MotorOcupacion()
+    antes.reconstruir()
+    assert antes.resumen() == {"total": 1, "por_puerta": {"deposito": 1}}
+    # El checkpoint llega hasta el último acceso autorizado (id 3; el 4 fue denegado)
+    assert database.cargar_checkpoint_ocupacion()[1] == 3
+
+    # Accesos posteriores al checkpoint, vistos en vivo por el motor que "se cae"
+    for identificacion, segundo in (("00000003", 5), ("00000002", 6), ("00000004", 7)):
+        _acceso(identificacion, segundo)
+        antes.registrar_acceso(identificacion, "principal", f"2026-01-01 08:00:{segundo:02d}")
+    # Un histórico no alterna la ocupación, ni en vivo ni al reconstruir
+    assert importar_eventos_historicos([("00000005", "2026-01-01 07:00:00", 1, "Acceso", "rfid", "principal")]) == (1, 0)
+
+    consultados = []
+    accesos_desde_id = ocupacion.obtener_accesos_desde_id
+
+    def espiar(ultimo_id, *args):
+        consultados.append(ultimo_id)
+        return accesos_desde_id(ultimo_id, *args)
+
+    monkeypatch.setattr(ocupacion, "obtener_accesos_desde_id", espiar)
+
+    despues = MotorOcupacion()
+    despues.reconstruir()
+
+    # Parte del checkpoint, no relee la historia desde cero
+    assert consultados[0] == 3
+    assert despues.checkpoint_id == 7
+    assert despues.resumen() == antes.resumen() == {"total": 2, "por_puerta": {"principal": 2}}
+    assert sorted(p["identificacion"] for p in despues.presentes()) == ["00000003", "00000004"]
+    assert despues.consultar("00000002")["dentro"] is False
+    assert despues.consultar("00000004") == {
+        "identificacion": "00000004", "dentro": True, "desde": "2026-01-01 08:00:07", "puerta": "principal",
+    }
+    assert despues.consultar("00000005")["dentro"] is False
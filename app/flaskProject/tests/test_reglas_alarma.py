@@ -0,0 +1,90 @@
+import threading
+
+import config
+import database
+from reglas_alarma import MotorAlarmas, ReglaAlarma
+
+
+def _fallido(identificacion="00000001", puerta="principal"):
+    return {"identificacion": identificacion, "autorizado": False, "canal": "rfid", "operacion": "Acceso", "puerta": puerta}
+
+
+def _regla(ventana_s=60, cooldown_s=300):
+    return ReglaAlarma("intentos_fallidos", 3, ventana_s, "identificacion", cooldown_s, {"autorizado": False})
+
+
+class Registro:
+    """persistir que guarda las transiciones como (clave, activa, cantidad, puerta)."""
+
+    def __init__(self):
+        self.transiciones = []
+        self.hubo = threading.Event()
+
+    def __call__(self, regla, clave, activa, cantidad, evento):
+        self.transiciones.append((clave, activa, cantidad, evento.get("puerta")))
+        self.hubo.set()
+
+
+def test_cooldown_no_repite_ni_normaliza_antes_de_tiempo(base):
+    registro = Registro()
+    motor = MotorAlarmas([_regla()], persistir=registro)
+
+    assert [motor.evaluar(_fallido(), t) for t in (0, 1, 2)] == [[], [], ["intentos_fallidos"]]
+    # Activa y en cooldown: más intentos no vuelven a disparar
+    assert all(motor.evaluar(_fallido(), t) == [] for t in range(3, 20))
+
+    # Ventana vacía pero cooldown vigente (hasta t=302): sigue activa
+    assert motor.barrer(100) == []
+    assert motor.estado()[0]["activas"] == ["00000001"]
+
+    motor.barrer(303)
+    assert registro.transiciones == [("00000001", True, 3, "principal"), ("00000001", False, 0, "principal")]
+
+    # Pasado el cooldown se puede volver a activar
+    assert [motor.evaluar(_fallido(), t) for t in (400, 401, 402)] == [[], [], ["intentos_fallidos"]]
+
+
+def test_barrido_periodico_normaliza_sin_eventos_nuevos(base, monkeypatch):
+    monkeypatch.setattr(config, "ALARMAS_BARRIDO_S", 0.02)
+    registro = Registro()
+    motor = MotorAlarmas([_regla(ventana_s=0.1, cooldown_s=0.1)], persistir=registro)
+
+    for _ in range(3):
+        motor.evaluar(_fallido(puerta="deposito"))
+    assert registro.transiciones == [("00000001", True, 3, "deposito")]
+    registro.hubo.clear()
+
+    motor.iniciar()
+    try:
+        # Nadie más pasa la tarjeta: la normalización la encuentra el barrido
+        assert registro.hubo.wait(timeout=2)
+    finally:
+        motor.detener()
+
+    assert registro.transiciones[1:] == [("00000001", False, 0, "deposito")]
+    # Y la clave sin actividad se libera de la memoria
+    assert motor.estado()[0]["claves"] == 0
+
+
+def test_solo_se_persisten_las_transiciones(base):
+    motor = MotorAlarmas([_regla()])
+
+    for t in range(10):
+        motor.evaluar(_fallido(), t)
+    motor.barrer(400)
+
+    conn = database.Database().get_connection()
+    try:
+        transiciones = conn.execute(
+            "SELECT regla, clave, activa, cantidad, puerta FROM alarmas_transiciones ORDER BY id"
+        ).fetchall()
+        eventos = conn.execute("SELECT identificacion, canal, operacion, autorizado FROM eventos").fetchall()
+    finally:
+        conn.close()
+
+    assert transiciones == [
+        ("intentos_fallidos", "00000001", 1, 3, "principal"),
+        ("intentos_fallidos", "00000001", 0, 0, "principal"),
+    ]
+    # Ni los 10 intentos ni la normalización: solo la activación, como alarma
+    assert eventos == [("00000001", "Alarma", "intentos_fallidos", "No")]
@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import colector
+import config
+from database import agregar_evento, guardar_watermark_replicacion
+from replicacion import AgenteReplicacion
+
+
+@pytest.fixture
+def colector_http(base):
+    """El colector real (Flask) en un puerto libre; devuelve su URL."""
+    servidor = make_server("127.0.0.1", 0, colector.app, threaded=True)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{servidor.server_port}"
+    servidor.shutdown()
+    hilo.join(timeout=2)
+
+
+def _cargar_eventos(cantidad):
+    for i in range(cantidad):
+        ok, _ = agregar_evento(f"{i:08d}", 1, "Acceso", "api", "principal", f"2026-01-01 08:00:{i:02d}")
+        assert ok
+
+
+def _filas_centrales():
+    conn = colector.BaseCentral().get_connection()
+    try:
+        return conn.execute("SELECT sitio, id_origen, identificacion FROM eventos ORDER BY sitio, id_origen").fetchall()
+    finally:
+        conn.close()
+
+
+def test_replica_en_lotes_hasta_ponerse_al_dia(colector_http):
+    _cargar_eventos(5)
+    agente = AgenteReplicacion(url=colector_http, sitio="sitio-a", lote=2)
+
+    assert agente.replicar_pendientes() == 5
+    assert agente.replicar_pendientes() == 0
+
+    filas = _filas_centrales()
+    assert [(s, i) for s, i, _ in filas] == [("sitio-a", i) for i in range(1, 6)]
+
+
+def test_reenvio_tras_perder_el_watermark_no_duplica(colector_http):
+    _cargar_eventos(4)
+    agente = AgenteReplicacion(url=colector_http, sitio="sitio-a", lote=10)
+    agente.replicar_pendientes()
+
+    # El colector confirmó pero el watermark no llegó a guardarse: se reenvía todo
+    guardar_watermark_replicacion(colector_http, 0)
+    assert agente.replicar_pendientes() == 4
+    assert len(_filas_centrales()) == 4
+
+    filas = [(i, f"{i - 1:08d}", f"2026-01-01 08:00:{i - 1:02d}", 1, "api", "Acceso", "principal") for i in range(1, 5)]
+    respuesta = agente.enviar_lote(filas)
+    assert respuesta["aceptados"] == 0
+    assert respuesta["duplicados"] == 4
+
+
+def test_mismo_id_de_sitios_distintos_no_es_duplicado(colector_http, base, monkeypatch):
+    _cargar_eventos(3)
+    AgenteReplicacion(url=colector_http, sitio="sitio-a").replicar_pendientes()
+
+    # Otro sitio: su propia base local, con los mismos ids
+    monkeypatch.setattr(config, "DB_PATH", str(base / "Sitio-b"))
+    _cargar_eventos(3)
+    AgenteReplicacion(url=colector_http, sitio="sitio-b").replicar_pendientes()
+
+    filas = _filas_centrales()
+    assert len(filas) == 6
+    assert {s for s, _, _ in filas} == {"sitio-a", "sitio-b"}
+
+
+def test_insertar_lote_deduplica_dentro_del_mismo_lote(base):
+    evento = {"id": 7, "identificacion": "12345678", "fecha_hora": "2026-01-01 08:00:00",
+              "autorizado": 1, "canal": "serial", "operacion": "Acceso", "puerta": "principal"}
+
+    assert colector.insertar_lote("sitio-a", [evento, dict(evento)]) == (1, 1)
+    assert colector.insertar_lote("sitio-a", [evento]) == (0, 1)
+
+
+def test_sitio_restaurado_que_reusa_ids_no_pierde_eventos(base):
+    viejo = {"id": 7, "identificacion": "12345678", "fecha_hora": "2026-01-01 08:00:00",
+             "autorizado": 1, "canal": "serial", "operacion": "Acceso", "puerta": "principal"}
+    # Tras restaurar una copia vieja, el sitio vuelve a usar el id 7 para otro evento
+    nuevo = dict(viejo, identificacion="87654321", fecha_hora="2026-02-01 09:30:00")
+
+    assert colector.insertar_lote("sitio-a", [viejo]) == (1, 0)
+    assert colector.insertar_lote("sitio-a", [nuevo, viejo]) == (1, 1)
+    assert len(_filas_centrales()) == 2
+
+
+def test_base_central_vieja_se_migra_a_la_clave_con_fecha(base):
+    ruta = str(base / "Vieja.db")
+    conn = sqlite3.connect(ruta)
+    conn.execute(
+        "CREATE TABLE eventos (sitio TEXT NOT NULL, id_origen INTEGER NOT NULL, identificacion TEXT NOT NULL, "
+        "fecha_hora TEXT NOT NULL, autorizado INTEGER NOT NULL, canal TEXT NOT NULL, operacion TEXT NOT NULL, "
+        "puerta TEXT NOT NULL, PRIMARY KEY (sitio, id_origen))"
+    )
+    conn.execute("INSERT INTO eventos VALUES ('sitio-a', 7, '12345678', '2026-01-01 08:00:00', 1, 'serial', 'Acceso', 'principal')")
+    conn.commit()
+    conn.close()
+
+    db = colector.BaseCentral(ruta)
+    evento = {"id": 7, "identificacion": "87654321", "fecha_hora": "2026-02-01 09:30:00",
+              "autorizado": 1, "canal": "serial", "operacion": "Acceso", "puerta": "principal"}
+    assert colector.insertar_lote("sitio-a", [evento], db=db) == (1, 0)
+    conn = db.get_connection()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM eventos").fetchone()[0] == 2
+    finally:
+        conn.close()
@@ -0,0 +1,79 @@
+import database
+from database import (
+    ROLLUP_AUTORIZADO,
+    ROLLUP_PERIODOS,
+    agregar_evento,
+    agregar_funcionario,
+    backfill_rollups,
+    eliminar_funcionario,
+    importar_eventos_historicos,
+    obtener_serie,
+)
+
+
+def _rollups():
+    """Rollups sin las celdas que quedaron en cero tras un DELETE."""
+    conn = database.Database().get_connection()
+    try:
+        return sorted(conn.execute(
+            'SELECT granularidad, periodo, canal, autorizado, operacion, cantidad '
+            'FROM eventos_rollup WHERE cantidad != 0'
+        ))
+    finally:
+        conn.close()
+
+
+def _contados():
+    """Lo mismo calculado con COUNT(*) sobre eventos."""
+    conn = database.Database().get_connection()
+    try:
+        filas = []
+        for granularidad, periodo in ROLLUP_PERIODOS.items():
+            filas += conn.execute(f'''
+                SELECT '{granularidad}', {periodo.format(f='fecha_hora')}, canal,
+                       {ROLLUP_AUTORIZADO.format(a='autorizado')} AS aut, operacion, COUNT(*)
+                FROM eventos
+                GROUP BY 2, canal, aut, operacion
+            ''').fetchall()
+        return sorted(filas)
+    finally:
+        conn.close()
+
+
+def test_triggers_de_rollup_coinciden_con_count(base):
+    agregar_funcionario("00000001", "Ana")
+    agregar_funcionario("00000002", "Berta")
+    # autorizado llega como 1/0 y como 'Si'/'No' según el canal
+    for identificacion, autorizado, canal, fecha_hora in (
+        ("00000001", 1, "rfid", "2026-01-05 08:10:00"),
+        ("00000001", "Si", "pic", "2026-01-05 08:59:59"),
+        ("00000002", 0, "rfid", "2026-01-05 09:00:00"),
+        ("00000002", "No", "pic", "2026-01-05 23:59:59"),
+        ("00000003", 1, "api", "2026-01-06 00:00:00"),
+        ("00000002", 1, "rfid", "2026-01-06 07:30:00"),
+    ):
+        assert agregar_evento(identificacion, autorizado, "Acceso", canal, fecha_hora=fecha_hora)[0]
+    importar_eventos_historicos([("00000001", "2026-01-06 07:31:00", 1, "Acceso", "rfid", "principal")])
+
+    assert _rollups() == _contados()
+    assert obtener_serie("dia", "2026-01-05", "2026-01-06") == [("2026-01-05", 4), ("2026-01-06", 3)]
+
+    # Las bajas de funcionarios borran sus eventos: el trigger de DELETE descuenta
+    eliminar_funcionario("00000002")
+    assert _rollups() == _contados()
+    assert obtener_serie("dia", "2026-01-05", "2026-01-06") == [("2026-01-05", 2), ("2026-01-06", 2)]
+    # Las celdas descontadas quedan en cero, no negativas
+    assert [cantidad for _, cantidad in obtener_serie("hora", "2026-01-05", "2026-01-05", autorizado=0)] == [0, 0]
+
+    conn = database.Database().get_connection()
+    try:
+        conn.execute("DELETE FROM eventos WHERE canal = 'api'")
+        conn.commit()
+    finally:
+        conn.close()
+    assert _rollups() == _contados()
+
+    # El backfill completo llega a lo mismo que los triggers
+    incrementales = _rollups()
+    backfill_rollups()
+    assert _rollups() == incrementales
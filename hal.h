@@ -0,0 +1,41 @@
+#ifndef HAL_H
+#define HAL_H
+
+// ===============================
+// CAPA DE HARDWARE (HAL)
+// ===============================
+// main.c no toca registros: usa estas primitivas. En el PIC son macros sobre
+// los registros (hal_pic.h, mismo código que antes); con -DSIMULADOR se
+// compila con gcc contra EEPROM, UART y Timer1 simulados (simulador/).
+//
+// Reloj e interrupción
+//   HAL_ISR()                  encabezado de la rutina de interrupción
+//   hal_tick_pendiente()       ¿pasó un cuarto de segundo? (CCP1IF)
+//   hal_tick_limpiar()
+//   hal_reloj_bloquear()       enmascara solo la interrupción del reloj
+//   hal_reloj_liberar()
+//   hal_timer_iniciar()        Timer1 + CCP1: 4 interrupciones por segundo
+// UART (9600 8N1)
+//   hal_uart_iniciar()
+//   hal_uart_tx_libre()        TXREG vacío (TXIF)
+//   hal_uart_tx(c)
+//   hal_uart_rx_listo()        hay un carácter recibido (RCIF)
+//   hal_uart_rx()
+//   hal_uart_rx_desborde()     se perdió un carácter (OERR): la RX queda frenada
+//   hal_uart_rx_reiniciar()    limpia OERR (CREN = 0 / 1)
+// EEPROM de datos (256 bytes)
+//   hal_ee_leer(dir)
+//   hal_ee_escribir(dir, dato) lanza la escritura y vuelve sin esperarla
+//   hal_ee_ocupada()           escritura en curso (WR)
+//   hal_ee_fin_escritura()     deshabilita escrituras (WREN = 0)
+// LEDs y demoras
+//   hal_leds_iniciar(), hal_led_verde(v), hal_led_rojo(v)
+//   hal_delay_ms(x), hal_delay_us(x)  (x constante, como __delay_ms)
+
+#ifdef SIMULADOR
+#include "simulador/hal_sim.h"
+#else
+#include "hal_pic.h"
+#endif
+
+#endif
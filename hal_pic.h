@@ -0,0 +1,102 @@
+#ifndef HAL_PIC_H
+#define HAL_PIC_H
+
+// HAL del PIC16F876A (XC8). Lo frecuente son macros: no agrega llamadas en
+// los bucles de espera de la UART ni de la EEPROM.
+
+#include <xc.h>
+#include <stdint.h>
+
+#pragma config FOSC = HS, WDTE = OFF, PWRTE = OFF, BOREN = OFF
+#pragma config LVP = OFF, CPD = OFF, WRT = OFF, CP = OFF
+
+#define _XTAL_FREQ 8000000
+
+// Definición de pines para LEDs
+#define LED_VERDE_PORT RB0
+#define LED_ROJO_PORT  RB1
+#define LED_VERDE_TRIS TRISB0
+#define LED_ROJO_TRIS  TRISB1
+
+#define HAL_ISR()               void __interrupt() isr(void)
+#define hal_tick_pendiente()    (CCP1IF)
+#define hal_tick_limpiar()      (CCP1IF = 0)
+#define hal_reloj_bloquear()    (CCP1IE = 0)
+#define hal_reloj_liberar()     (CCP1IE = 1)
+
+#define hal_uart_tx_libre()     (TXIF)
+#define hal_uart_tx(c)          (TXREG = (c))
+#define hal_uart_rx_listo()     (RCIF)
+#define hal_uart_rx()           (RCREG)
+#define hal_uart_rx_desborde()  (OERR)
+#define hal_uart_rx_reiniciar() do { CREN = 0; CREN = 1; } while(0)
+
+#define hal_ee_ocupada()        (WR)
+#define hal_ee_fin_escritura()  (WREN = 0)
+
+#define hal_led_verde(v)        (LED_VERDE_PORT = (v))
+#define hal_led_rojo(v)         (LED_ROJO_PORT = (v))
+
+#define hal_delay_ms(x)         __delay_ms(x)
+#define hal_delay_us(x)         __delay_us(x)
+
+static void hal_timer_iniciar(void) {
+    // Fosc/4 = 2 MHz, prescaler 1:8 → 250 kHz. CCP1 en modo compare con
+    // "special event trigger" pone TMR1 a cero al llegar a CCPR1: una
+    // interrupción cada 62500 cuentas (250 ms) sin recargar por software.
+    // Antes: Timer0 con 244 interrupciones por segundo.
+    T1CKPS1 = 1;    // Prescaler 1:8
+    T1CKPS0 = 1;
+    TMR1CS = 0;     // Reloj interno (Fosc/4)
+    TMR1H = 0;
+    TMR1L = 0;
+    CCPR1H = 62500 >> 8;
+    CCPR1L = 62500 & 0xFF;
+    CCP1CON = 0x0B; // Compare, special event trigger
+    CCP1IF = 0;
+    CCP1IE = 1;     // Habilita interrupción de CCP1
+    PEIE = 1;       // Habilita interrupciones de periféricos
+    GIE = 1;        // Habilita interrupciones globales
+    TMR1ON = 1;
+}
+
+static void hal_uart_iniciar(void) {
+    TRISC7 = 1;   // RX (pin RC7) como entrada
+    TRISC6 = 0;   // TX (pin RC6) como salida
+    SPBRG = 51;   // Baud rate 9600 - 8MHz
+    SYNC = 0;     // Modo asíncrono
+    BRGH = 1;     // High baud rate
+    SPEN = 1;     // Habilitar puerto serial
+    CREN = 1;     // Habilitar recepción continua
+    TXEN = 1;     // Habilitar transmisión
+}
+
+static void hal_leds_iniciar(void) {
+    // Pines de LEDs como salidas, ambos apagados
+    LED_VERDE_TRIS = 0;
+    LED_ROJO_TRIS = 0;
+    LED_VERDE_PORT = 0;
+    LED_ROJO_PORT = 0;
+}
+
+static uint8_t hal_ee_leer(uint8_t addr) {
+    EEADR = addr;
+    EEPGD = 0;
+    RD = 1;
+    return EEDATA;
+}
+
+static void hal_ee_escribir(uint8_t addr, uint8_t data) {
+    uint8_t gie = GIE;
+    EEADR = addr;
+    EEDATA = data;
+    EEPGD = 0;
+    WREN = 1;
+    GIE = 0;
+    EECON2 = 0x55;
+    EECON2 = 0xAA;
+    WR = 1;
+    GIE = gie;      // No se espera a WR: el ciclo de escritura sigue solo
+}
+
+#endif
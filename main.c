@@ -1,396 +1,747 @@
-#include <xc.h>
-
-#pragma config FOSC = HS, WDTE = OFF, PWRTE = OFF, BOREN = OFF
-#pragma config LVP = OFF, CPD = OFF, WRT = OFF, CP = OFF
-
-#define _XTAL_FREQ 8000000
-
-// Definición de pines para LEDs
-#define LED_VERDE_PORT RB0
-#define LED_ROJO_PORT  RB1
-#define LED_VERDE_TRIS TRISB0
-#define LED_ROJO_TRIS  TRISB1
-
-#define MAX_EVENTOS 5
-
-typedef struct {
-    unsigned int tiempo;
-    char cedula[9];
-    unsigned char autorizado;
-    unsigned char tipoOperacion;
-} Evento;
-
-volatile unsigned int t0_overflows = 0;
-volatile unsigned int segundos = 0;
-volatile unsigned int ultimo_envio = 0;
-
-Evento eventos[MAX_EVENTOS];
-unsigned char num_eventos = 0;
-unsigned char evento_index = 0;
-
-void __interrupt() isr(void) {
-    if (T0IF) {
-        T0IF = 0;               // Limpia bandera
-        t0_overflows++;         // Cuenta overflows
-
-        if (t0_overflows >= 244) {  // 244 × 4.096 ms ? 1 segundo
-            t0_overflows = 0;
-            segundos++;
-        }
-    }
-}
-
-void timer0_init(void) {
-    T0CS = 0;    // Usa reloj interno (Fosc/4)
-    PSA = 0;     // Prescaler asignado a Timer0
-    PS2 = 1;     // Prescaler 1:32 - bit 2
-    PS1 = 0;     // Prescaler 1:32 - bit 1  
-    PS0 = 0;     // Prescaler 1:32 - bit 0
-
-    TMR0 = 0;
-    T0IF = 0;
-    T0IE = 1;    // Habilita interrupción de Timer0
-    GIE = 1;     // Habilita interrupciones globales
-}
-
-void uart_init(void) {
-    TRISC7 = 1;   // RX (pin RC7) como entrada
-    TRISC6 = 0;   // TX (pin RC6) como salida
-    SPBRG = 51;   // Baud rate 9600 - 8MHz
-    SYNC = 0;     // Modo asíncrono
-    BRGH = 1;     // High baud rate
-    SPEN = 1;     // Habilitar puerto serial
-    CREN = 1;     // Habilitar recepción continua
-    TXEN = 1;     // Habilitar transmisión
-}
-
-void uart_write(char data) {
-    while(!TXIF);  // Esperar a que el buffer de transmisión esté vacío
-    TXREG = data;
-}
-
-void uart_write_string(const char *str) {
-    while(*str) {
-        uart_write(*str);
-        str++;        
-    }
-}
-
-void uint_a_string(unsigned int num, char *str, unsigned char digits) {
-    char temp[10];
-    unsigned char i = 0;
-    unsigned char j;
-    
-    // Convertir número a string (invertido)
-    if(num == 0) {
-        temp[i++] = '0';
-    } else {
-        while(num > 0) {
-            temp[i++] = (num % 10) + '0';
-            num /= 10;
-        }
-    }
-    
-    // Rellenar con ceros a la izquierda
-    while(i < digits) {
-        temp[i++] = '0';
-    }
-    
-    // Invertir el string al destino
-    for(j = 0; j < i; j++) {
-        str[j] = temp[i - 1 - j];
-    }
-    str[j] = '\0';
-}
-
-void agregar_evento(const char *cedula, unsigned char autorizado, unsigned char tipoOperacion) {
-    if(num_eventos < MAX_EVENTOS) {
-        eventos[evento_index].tiempo = segundos;
-        eventos[evento_index].autorizado = autorizado;
-        eventos[evento_index].tipoOperacion = tipoOperacion;
-        
-        // Copiar cédula
-        unsigned char i;
-        for(i = 0; i < 8 && cedula[i] != '\0'; i++) {
-            eventos[evento_index].cedula[i] = cedula[i];
-        }
-        eventos[evento_index].cedula[i] = '\0';
-        
-        evento_index = (evento_index + 1) % MAX_EVENTOS;
-        num_eventos++;
-    }
-}
-
-void enviar_eventos_pendientes(void) {
-    unsigned char i;
-    char tiempo_str[5]; 
-        
-    for(i = 0; i < num_eventos; i++) {
-        // Convertir tiempo a string con ceros a la izquierda
-        uint_a_string(eventos[i].tiempo, tiempo_str, 4);
-        
-        // Construir y enviar el mensaje
-        uart_write_string("tiempo=");
-        uart_write_string(tiempo_str);
-        uart_write_string(", cedula=");
-        uart_write_string(eventos[i].cedula);
-        uart_write_string(", autorizado=");
-        uart_write_string(eventos[i].autorizado ? "Si" : "No");
-        uart_write_string(", operacion=");
-        uart_write_string(eventos[i].tipoOperacion == 0 ? "Acceso" : eventos[i].tipoOperacion == 1 ? "Alta" : "Baja");
-        uart_write_string("\r\n");
-    }
-    
-    // Reiniciar contador de eventos
-    num_eventos = 0;
-    evento_index = 0;
-    
-    // Reiniciar el contador de tiempo
-    segundos = 0;
-    ultimo_envio = segundos;
-}
-
-void verificar_envio_eventos(void) {
-    // Verificar si pasaron 5 minutos (300 segundos)
-    if((segundos - ultimo_envio) >= 300) {
-        if(num_eventos > 0) {
-            enviar_eventos_pendientes();
-        } else {
-            uart_write_string("No ocurrieron eventos en 5 minutos.\r\n");
-            ultimo_envio = segundos;  // Actualizar el tiempo
-        }
-    }
-    
-    // Verificar si el buffer está lleno
-    if(num_eventos >= MAX_EVENTOS) {
-        enviar_eventos_pendientes();
-    }
-}
-
-char leer_codigo_barras(void) {
-    if(RCIF) {              // Si hay dato disponible
-        return RCREG;       // Leer y retornar el carácter
-    }
-    return 0;               // No hay dato disponible
-}
-
-void eeprom_write(uint8_t addr, uint8_t data) {
-    EEADR = addr;
-    EEDATA = data;
-    EEPGD = 0;
-    WREN = 1;
-    GIE = 0;
-    EECON2 = 0x55;
-    EECON2 = 0xAA;
-    WR = 1;
-    GIE = 1;
-    while(WR);
-    WREN = 0;
-}
-
-uint8_t eeprom_read(uint8_t addr) {
-    EEADR = addr;
-    EEPGD = 0;
-    RD = 1;
-    return EEDATA;
-}
-
-void cargar_cedula(uint8_t numero_cedula, const char *cedula) {
-    uint8_t direccion_base = (numero_cedula - 1) * 8;
-    for(uint8_t i = 0; i < 8; i++) {
-        eeprom_write(direccion_base + i, cedula[i]);
-    }
-}
-
-uint8_t comparar_con_cedulas(const char *codigo_leido) {
-    char cedula_actual[9];  // 8 dígitos + null terminator
-   
-    // Comparar con las 5 cédulas almacenadas
-    for(uint8_t i = 0; i < 5; i++) {
-        uint8_t direccion_base = i * 8;
-       
-        // Leer cédula de la EEPROM
-        for(uint8_t j = 0; j < 8; j++) {
-            cedula_actual[j] = eeprom_read(direccion_base + j);
-        }
-        cedula_actual[8] = '\0';  // Null terminator
-       
-        // Comparar strings
-        uint8_t iguales = 1;
-        for(uint8_t k = 0; k < 8; k++) {
-            if(codigo_leido[k] != cedula_actual[k]) {
-                iguales = 0;
-                break;
-            }
-        }
-        if(iguales) {
-            return 1;  // Encontrada
-        }
-    }
-    return 0;  // No encontrada
-}
-
-uint8_t comparar_con_cedulas_con_indice(const char *codigo_leido) {
-    char cedula_actual[9];  // 8 dígitos + null terminator
-   
-    for(uint8_t i = 0; i < 5; i++) {
-        uint8_t direccion_base = i * 8;
-       
-        // Leer cédula de la EEPROM
-        for(uint8_t j = 0; j < 8; j++) {
-            cedula_actual[j] = eeprom_read(direccion_base + j);
-        }
-        cedula_actual[8] = '\0';  // Null terminator
-       
-        // Comparar strings
-        uint8_t iguales = 1;
-        for(uint8_t k = 0; k < 8; k++) {
-            if(codigo_leido[k] != cedula_actual[k]) {
-                iguales = 0;
-                break;
-            }
-        }
-        if(iguales) {
-            return direccion_base;  // Encontrada
-        }
-    }
-    return 255;  // No encontrada
-}
-
-void controlar_leds(uint8_t autorizado) {
-    if(autorizado) {
-        LED_VERDE_PORT = 1;  // Encender LED verde
-        __delay_ms(500);
-        LED_VERDE_PORT = 0;   // Apagar LED verde
-    } else {
-        LED_ROJO_PORT = 1;  // Encender LED rojo
-        __delay_ms(500);
-        LED_ROJO_PORT = 0;   // Apagar LED rojo
-    }
-}
-
-
-void main(void) {
-    char codigo_leido[20];  // Buffer para almacenar el código leído
-    uint8_t index = 0;      // Índice del buffer
-    char caracter = 0;      // Carácter leído
-    uint8_t numeroCedula = 1;
-    unsigned char tipoOperacion = 0;
-    uint8_t autorizado = 0;
-    
-    for(uint8_t i = 0; i < 5; i++) {
-        if(eeprom_read(i*8) != 0xFF) {
-            numeroCedula = i + 1;
-        }
-    }
-    int flag_alta = 0;
-    int flag_baja = 0;
-    
-    // Configurar pines de LEDs como salidas
-    LED_VERDE_TRIS = 0;
-    LED_ROJO_TRIS = 0;
-   
-    // Apagar ambos LEDs inicialmente
-    LED_VERDE_PORT = 0;
-    LED_ROJO_PORT = 0;
-   
-    uart_init();            // Inicializar UART
-    timer0_init();          // Inicializar Timer0
-   
-    /*if(eeprom_read(0x00) == 0xFF){  
-        cargar_cedula(1, "49432642");
-        cargar_cedula(2, "55787807");
-        cargar_cedula(3, "50329945");
-        cargar_cedula(4, "49852969");
-        cargar_cedula(5, "49374418");
-    }*/
-   
-    while(1) {
-        // Verificar condiciones para enviar eventos
-        verificar_envio_eventos();
-        caracter = leer_codigo_barras();
-       
-        if(caracter != 0) {
-            if(caracter == 'A'){
-                flag_alta = 1;
-                continue;
-            }
-            else if(caracter == 'B'){
-                flag_baja = 1;
-                continue;
-            }
-            
-            if (flag_alta == 1 && index == 8 && numeroCedula <= 5){
-                uint8_t darAlta = comparar_con_cedulas(codigo_leido);
-                tipoOperacion = 1;
-                flag_alta = 0;
-                if(!darAlta){
-                    // Si darAlta es 0, entonces damos de alta la cedula
-                    autorizado = 1;
-                    cargar_cedula(numeroCedula, codigo_leido);
-                    numeroCedula = numeroCedula + 1;
-                }
-                else{
-                    autorizado = 0;
-                }
-            }
-            
-            if (flag_baja == 1 && index == 8 && numeroCedula > 0){
-                uint8_t direccionBase = comparar_con_cedulas_con_indice(codigo_leido);
-                tipoOperacion = 2;
-                flag_baja = 0;
-                if(direccionBase != 255 && numeroCedula > 0){
-                    char ultima_cedula[9];
-                
-                    for(uint8_t j = 0; j < 8; j++) {
-                        ultima_cedula[j] = eeprom_read((numeroCedula-1)*8 + j);
-                    }
-                    ultima_cedula[8] = '\0';  // Null terminator
-
-                    cargar_cedula((direccionBase/8)+1, ultima_cedula);
-
-                    eeprom_write((numeroCedula-1)*8, 0xFF);
-                    numeroCedula = numeroCedula - 1;
-                    autorizado = 1;
-                } else {
-                    // Si entra aca, esta cedula no se puede dar de baja
-                    autorizado = 0;
-                }
-            }
-            
-            if((caracter == '\r' || caracter == '\n') && (flag_alta == 0 && flag_baja == 0)){            
-                codigo_leido[index] = '\0';
-
-                // Verificar si es exactamente 8 caracteres
-                if(index == 8) {
-                    if (tipoOperacion != 1 && tipoOperacion != 2){
-                        tipoOperacion = 0;
-                        autorizado = comparar_con_cedulas(codigo_leido);
-                    }
-                    
-                    // Agregar evento al buffer
-                    agregar_evento(codigo_leido, autorizado, tipoOperacion);
-                    
-                    // Reset de tipo de operacion
-                    tipoOperacion = 0;
-                    controlar_leds(autorizado);  // Controlar LEDs según resultado
-                    
-                } else {
-                    codigo_leido[7]='@';
-                    // Agregar evento al buffer (incluso si falla)
-                    agregar_evento(codigo_leido, 0, tipoOperacion);
-                    
-                    // Reset de tipo de operacion
-                    tipoOperacion = 0;
-                    controlar_leds(0);  // Longitud incorrecta = No autorizado
-                }
-                index = 0;                  
-                caracter = 0;
-               
-            } else if(index <= 8) {
-                codigo_leido[index] = caracter;  // Almacenar carácter en buffer
-                index++;
-            }
-        }
-    }
-}
+#include "hal.h"     // Registros del PIC, o el simulador con -DSIMULADOR
+
+#define MAX_EVENTOS 5
+
+typedef struct {
+    unsigned long tiempo;       // Segundos desde el arranque del PIC
+    unsigned char cuarto;       // Fracción: 0..3 cuartos de segundo
+    char cedula[9];
+    unsigned char autorizado;
+    unsigned char tipoOperacion;
+} Evento;
+
+// Reloj monótono desde el arranque (no se reinicia al enviar eventos). La Pi
+// lo consulta con el comando 'T' y convierte los tiempos de los eventos a
+// fecha/hora real con el offset medido.
+volatile unsigned char cuartos = 0;
+volatile unsigned long segundos = 0;
+unsigned long ultimo_envio = 0;
+
+Evento eventos[MAX_EVENTOS];
+unsigned char num_eventos = 0;
+unsigned char evento_index = 0;
+
+HAL_ISR() {
+    if (hal_tick_pendiente()) {
+        hal_tick_limpiar();     // Limpia bandera (4 interrupciones por segundo)
+        if (++cuartos >= 4) {
+            cuartos = 0;
+            segundos++;
+        }
+    }
+}
+
+void leer_reloj(unsigned long *seg, unsigned char *cuarto) {
+    // Lectura atómica de los 4 bytes: solo se enmascara la interrupción del reloj
+    hal_reloj_bloquear();
+    *seg = segundos;
+    *cuarto = cuartos;
+    hal_reloj_liberar();
+}
+
+void uart_write(char data) {
+    while(!hal_uart_tx_libre());  // Esperar a que el buffer de transmisión esté vacío
+    hal_uart_tx(data);
+}
+
+void uart_write_string(const char *str) {
+    while(*str) {
+        uart_write(*str);
+        str++;        
+    }
+}
+
+void uint_a_string(unsigned long num, char *str, unsigned char digits) {
+    char temp[11];
+    unsigned char i = 0;
+    unsigned char j;
+    
+    // Convertir número a string (invertido)
+    if(num == 0) {
+        temp[i++] = '0';
+    } else {
+        while(num > 0) {
+            temp[i++] = (num % 10) + '0';
+            num /= 10;
+        }
+    }
+    
+    // Rellenar con ceros a la izquierda
+    while(i < digits) {
+        temp[i++] = '0';
+    }
+    
+    // Invertir el string al destino
+    for(j = 0; j < i; j++) {
+        str[j] = temp[i - 1 - j];
+    }
+    str[j] = '\0';
+}
+
+void agregar_evento(const char *cedula, unsigned char autorizado, unsigned char tipoOperacion) {
+    if(num_eventos < MAX_EVENTOS) {
+        leer_reloj(&eventos[evento_index].tiempo, &eventos[evento_index].cuarto);
+        eventos[evento_index].autorizado = autorizado;
+        eventos[evento_index].tipoOperacion = tipoOperacion;
+        
+        // Copiar cédula
+        unsigned char i;
+        for(i = 0; i < 8 && cedula[i] != '\0'; i++) {
+            eventos[evento_index].cedula[i] = cedula[i];
+        }
+        eventos[evento_index].cedula[i] = '\0';
+        
+        evento_index = (evento_index + 1) % MAX_EVENTOS;
+        num_eventos++;
+    }
+}
+
+void enviar_tiempo(unsigned long seg, unsigned char cuarto) {
+    char tiempo_str[11];
+
+    // "segundos.centésimas" (resolución de un cuarto de segundo)
+    uint_a_string(seg, tiempo_str, 1);
+    uart_write_string(tiempo_str);
+    uart_write('.');
+    uint_a_string(cuarto * 25, tiempo_str, 2);
+    uart_write_string(tiempo_str);
+}
+
+void enviar_reloj(void) {
+    unsigned long seg;
+    unsigned char cuarto;
+
+    leer_reloj(&seg, &cuarto);
+    uart_write_string("reloj=");
+    enviar_tiempo(seg, cuarto);
+    uart_write_string("\r\n");
+}
+
+void enviar_eventos_pendientes(void) {
+    unsigned char i;
+        
+    for(i = 0; i < num_eventos; i++) {
+        // Construir y enviar el mensaje
+        uart_write_string("tiempo=");
+        enviar_tiempo(eventos[i].tiempo, eventos[i].cuarto);
+        uart_write_string(", cedula=");
+        uart_write_string(eventos[i].cedula);
+        uart_write_string(", autorizado=");
+        uart_write_string(eventos[i].autorizado ? "Si" : "No");
+        uart_write_string(", operacion=");
+        uart_write_string(eventos[i].tipoOperacion == 0 ? "Acceso" : eventos[i].tipoOperacion == 1 ? "Alta" : "Baja");
+        uart_write_string("\r\n");
+    }
+    
+    // Reiniciar contador de eventos
+    num_eventos = 0;
+    evento_index = 0;
+    
+    // El reloj sigue corriendo: solo se marca el momento del envío
+    unsigned char cuarto;
+    leer_reloj(&ultimo_envio, &cuarto);
+}
+
+void verificar_envio_eventos(void) {
+    unsigned long ahora;
+    unsigned char cuarto;
+    leer_reloj(&ahora, &cuarto);
+
+    // Verificar si pasaron 5 minutos (300 segundos)
+    if((ahora - ultimo_envio) >= 300) {
+        if(num_eventos > 0) {
+            enviar_eventos_pendientes();
+        } else {
+            uart_write_string("No ocurrieron eventos en 5 minutos.\r\n");
+            ultimo_envio = ahora;  // Actualizar el tiempo
+        }
+    }
+    
+    // Verificar si el buffer está lleno
+    if(num_eventos >= MAX_EVENTOS) {
+        enviar_eventos_pendientes();
+    }
+}
+
+// Líneas que llegaron durante consultar_pi y no eran su respuesta (comandos
+// de la Pi A/B/T, lecturas del código de barras): se apartan completas y el
+// bucle principal las lee antes que la UART. Una línea que no entra se
+// descarta entera, nunca a medias.
+#define RX_APARTE 16
+
+char rx_aparte[RX_APARTE];
+uint8_t rx_aparte_cantidad = 0;
+uint8_t rx_aparte_leidos = 0;
+// El resto de una línea que ya no sirve (respuesta de la Pi fuera de
+// tiempo, línea apartada que no entró) se descarta hasta el fin de línea
+uint8_t descartar_linea = 0;
+
+char leer_codigo_barras(void) {
+    // Primero lo que consultar_pi apartó mientras esperaba su respuesta
+    if(rx_aparte_leidos < rx_aparte_cantidad) {
+        return rx_aparte[rx_aparte_leidos++];
+    }
+    rx_aparte_cantidad = 0;
+    rx_aparte_leidos = 0;
+    if(hal_uart_rx_desborde()) {
+        // Llegaron caracteres durante el parpadeo de los LEDs (500 ms):
+        // sin limpiar OERR la UART no vuelve a recibir nada
+        hal_uart_rx_reiniciar();
+    }
+    if(hal_uart_rx_listo()) {   // Si hay dato disponible
+        return hal_uart_rx();   // Leer y retornar el carácter
+    }
+    return 0;               // No hay dato disponible
+}
+
+// ===============================
+// EEPROM: COLA DE ESCRITURA NO BLOQUEANTE
+// ===============================
+// Cada escritura tarda ~4 ms en WR. En vez de esperarla, se encola y el bucle
+// principal la lanza cuando la anterior terminó (eeprom_tarea), así la UART se
+// sigue atendiendo. GIE se apaga solo durante la secuencia 0x55/0xAA/WR.
+// Las lecturas ven primero lo que todavía está en la cola.
+
+#define EE_COLA 16   // potencia de 2
+
+uint8_t ee_cola_dir[EE_COLA];
+uint8_t ee_cola_dato[EE_COLA];
+uint8_t ee_cola_inicio = 0;
+uint8_t ee_cola_cantidad = 0;
+
+void eeprom_tarea(void) {
+    // Escribir solo si cambia: cada ciclo gasta la celda y ocupa WR ~4 ms.
+    // Se compara acá, con WR ya libre, y no al encolar: leer la EEPROM
+    // mientras hay una escritura en curso obliga a esperarla.
+    while(ee_cola_cantidad > 0 && !hal_ee_ocupada()) {
+        uint8_t addr = ee_cola_dir[ee_cola_inicio];
+        uint8_t data = ee_cola_dato[ee_cola_inicio];
+        ee_cola_inicio = (ee_cola_inicio + 1) & (EE_COLA - 1);
+        ee_cola_cantidad--;
+        hal_ee_fin_escritura();
+        if(hal_ee_leer(addr) != data) {
+            hal_ee_escribir(addr, data);
+        }
+    }
+}
+
+void eeprom_vaciar_cola(void) {
+    while(ee_cola_cantidad > 0) {
+        eeprom_tarea();
+    }
+    while(hal_ee_ocupada());
+    hal_ee_fin_escritura();
+}
+
+uint8_t eeprom_read(uint8_t addr) {
+    // Lo más nuevo de la cola gana
+    for(uint8_t i = ee_cola_cantidad; i > 0; i--) {
+        uint8_t pos = (ee_cola_inicio + i - 1) & (EE_COLA - 1);
+        if(ee_cola_dir[pos] == addr) {
+            return ee_cola_dato[pos];
+        }
+    }
+    while(hal_ee_ocupada());    // EEADR no se puede tocar durante una escritura (máx. una en curso)
+    return hal_ee_leer(addr);
+}
+
+void eeprom_write(uint8_t addr, uint8_t data) {
+    // Encolar nunca espera a WR (salvo con la cola llena): si el dato no
+    // cambia, eeprom_tarea lo descarta al llegarle el turno
+    while(ee_cola_cantidad == EE_COLA) {
+        eeprom_tarea();
+    }
+    uint8_t pos = (ee_cola_inicio + ee_cola_cantidad) & (EE_COLA - 1);
+    ee_cola_dir[pos] = addr;
+    ee_cola_dato[pos] = data;
+    ee_cola_cantidad++;
+    eeprom_tarea();
+}
+
+// ===============================
+// EEPROM: TABLA DE CÉDULAS CON WEAR LEVELING
+// ===============================
+// NUM_SLOTS slots de 9 bytes en anillo: [estado][8 dígitos]. Las altas van al
+// siguiente slot libre del anillo (no siempre a los primeros) y las bajas solo
+// marcan el estado como borrado: 1 byte, sin mover ni compactar otros slots.
+// El estado se escribe último: si se corta la energía a mitad de un alta, el
+// slot sigue libre.
+//
+// Estado: 0xFF nunca usado, 0xA4 válida, 0x24 borrada. El bit 0 es la fase
+// de la vuelta del anillo: los slots ya recorridos en esta vuelta tienen la
+// fase actual y los que faltan la anterior, así al arrancar se encuentra
+// dónde quedó el puntero sin guardar un contador (que gastaría un solo byte).
+
+#define MAX_CEDULAS     5
+#define SLOT_BYTES      9
+#define NUM_SLOTS       28      // 28 x 9 = 252 bytes
+#define SLOT_NINGUNO    255
+#define EE_FIRMA_DIR    255
+#define EE_FIRMA        0x5A
+
+#define ESTADO_VACIO    0xFF
+#define ESTADO_VALIDA   0xA4
+#define ESTADO_BORRADA  0x24
+#define ESTADO_FASE     0x01
+
+uint8_t cedulas_registradas = 0;
+uint8_t slot_siguiente = 0;
+uint8_t fase_actual = 0;
+
+uint8_t estado_slot(uint8_t slot) {
+    return eeprom_read(slot * SLOT_BYTES);
+}
+
+uint8_t slot_valido(uint8_t estado) {
+    return (estado & ~ESTADO_FASE) == ESTADO_VALIDA;
+}
+
+void migrar_formato_anterior(void) {
+    // Formato anterior: 5 cédulas de 8 bytes desde la dirección 0, 0xFF = libre
+    char anteriores[MAX_CEDULAS][8];
+    uint8_t cantidad = 0;
+
+    for(uint8_t i = 0; i < MAX_CEDULAS; i++) {
+        if(eeprom_read(i * 8) != 0xFF) {
+            for(uint8_t j = 0; j < 8; j++) {
+                anteriores[cantidad][j] = eeprom_read(i * 8 + j);
+            }
+            cantidad++;
+        }
+    }
+
+    // Los slots nuevos 0..4 pisan esas direcciones (0..44)
+    for(uint8_t slot = 0; slot < MAX_CEDULAS; slot++) {
+        uint8_t dir = slot * SLOT_BYTES;
+        if(slot < cantidad) {
+            for(uint8_t j = 0; j < 8; j++) {
+                eeprom_write(dir + 1 + j, anteriores[slot][j]);
+            }
+            eeprom_write(dir, ESTADO_VALIDA);
+        } else {
+            eeprom_write(dir, ESTADO_VACIO);
+        }
+    }
+    eeprom_write(EE_FIRMA_DIR, EE_FIRMA);
+    eeprom_vaciar_cola();
+}
+
+void inicializar_cedulas(void) {
+    if(eeprom_read(EE_FIRMA_DIR) != EE_FIRMA) {
+        migrar_formato_anterior();
+    }
+
+    cedulas_registradas = 0;
+    for(uint8_t slot = 0; slot < NUM_SLOTS; slot++) {
+        if(slot_valido(estado_slot(slot))) {
+            cedulas_registradas++;
+        }
+    }
+
+    // Puntero: primer slot vacío o con fase distinta a la del slot 0
+    uint8_t estado = estado_slot(0);
+    slot_siguiente = 0;
+    fase_actual = 0;
+    if(estado != ESTADO_VACIO) {
+        fase_actual = estado & ESTADO_FASE;
+        for(uint8_t slot = 1; slot < NUM_SLOTS; slot++) {
+            estado = estado_slot(slot);
+            if(estado == ESTADO_VACIO || (estado & ESTADO_FASE) != fase_actual) {
+                slot_siguiente = slot;
+                break;
+            }
+        }
+        if(slot_siguiente == 0) {
+            // Vuelta completa: la próxima empieza con la otra fase
+            fase_actual ^= ESTADO_FASE;
+        }
+    }
+}
+
+uint8_t buscar_slot(const char *codigo_leido) {
+    for(uint8_t slot = 0; slot < NUM_SLOTS; slot++) {
+        uint8_t dir = slot * SLOT_BYTES;
+        if(!slot_valido(eeprom_read(dir))) {
+            continue;
+        }
+
+        uint8_t iguales = 1;
+        for(uint8_t k = 0; k < 8; k++) {
+            if(codigo_leido[k] != eeprom_read(dir + 1 + k)) {
+                iguales = 0;
+                break;
+            }
+        }
+        if(iguales) {
+            return slot;
+        }
+    }
+    return SLOT_NINGUNO;
+}
+
+uint8_t comparar_con_cedulas(const char *codigo_leido) {
+    return buscar_slot(codigo_leido) != SLOT_NINGUNO;
+}
+
+uint8_t cargar_cedula(const char *cedula) {
+    if(cedulas_registradas >= MAX_CEDULAS) {
+        return 0;
+    }
+
+    for(uint8_t n = 0; n < NUM_SLOTS; n++) {
+        uint8_t slot = slot_siguiente;
+        uint8_t fase = fase_actual;
+        uint8_t dir = slot * SLOT_BYTES;
+
+        slot_siguiente++;
+        if(slot_siguiente == NUM_SLOTS) {
+            slot_siguiente = 0;
+            fase_actual ^= ESTADO_FASE;
+        }
+
+        if(slot_valido(eeprom_read(dir))) {
+            // Ocupado: se saltea, pero queda con la fase de esta vuelta
+            eeprom_write(dir, ESTADO_VALIDA | fase);
+            continue;
+        }
+
+        // Solo se escriben los dígitos que difieren de lo que había en el slot
+        for(uint8_t i = 0; i < 8; i++) {
+            eeprom_write(dir + 1 + i, cedula[i]);
+        }
+        eeprom_write(dir, ESTADO_VALIDA | fase);
+        cedulas_registradas++;
+        return 1;
+    }
+    return 0;
+}
+
+void borrar_slot(uint8_t slot) {
+    // Lápida: un solo byte, conserva la fase del slot
+    uint8_t dir = slot * SLOT_BYTES;
+    eeprom_write(dir, ESTADO_BORRADA | (eeprom_read(dir) & ESTADO_FASE));
+    cedulas_registradas--;
+}
+
+// ===============================
+// AUTORIZACIÓN ASISTIDA POR LA PI
+// ===============================
+// Si la cédula no está en la EEPROM, el PIC consulta a la Pi por la UART
+// ("Q<cedula>\r\n") y espera "S<cedula>\n" o "N<cedula>\n" hasta
+// CONSULTA_TIMEOUT_MS; sin respuesta vale la decisión local (denegado).
+// Las cédulas autorizadas por la Pi quedan en un LRU en RAM (no en EEPROM:
+// serían escrituras y desgaste por cada lectura) con vencimiento, y una
+// baja ('B') las saca del LRU aunque no estén en la tabla.
+
+#define CACHE_CEDULAS           4
+#define CACHE_VIGENCIA_S        600
+#define CONSULTA_TIMEOUT_MS     50
+
+#define CONSULTA_NO             0
+#define CONSULTA_SI             1
+#define CONSULTA_SIN_RESPUESTA  2
+
+char cache_cedula[CACHE_CEDULAS][8];
+unsigned long cache_alta[CACHE_CEDULAS];    // Cuándo la autorizó la Pi
+unsigned int cache_uso[CACHE_CEDULAS];      // Turno del último uso (LRU)
+unsigned int cache_turno = 0;               // Avanza con cada uso
+uint8_t cache_validas = 0;                  // Bit i = entrada i ocupada
+
+uint8_t cache_indice(const char *cedula) {
+    for(uint8_t i = 0; i < CACHE_CEDULAS; i++) {
+        if(!(cache_validas & (1 << i))) {
+            continue;
+        }
+        uint8_t iguales = 1;
+        for(uint8_t k = 0; k < 8; k++) {
+            if(cache_cedula[i][k] != cedula[k]) {
+                iguales = 0;
+                break;
+            }
+        }
+        if(iguales) {
+            return i;
+        }
+    }
+    return SLOT_NINGUNO;
+}
+
+uint8_t cache_buscar(const char *cedula) {
+    unsigned long ahora;
+    unsigned char cuarto;
+    uint8_t i = cache_indice(cedula);
+
+    if(i == SLOT_NINGUNO) {
+        return 0;
+    }
+    leer_reloj(&ahora, &cuarto);
+    if(ahora - cache_alta[i] >= CACHE_VIGENCIA_S) {
+        // Vencida: se vuelve a preguntar a la Pi
+        cache_validas &= ~(1 << i);
+        return 0;
+    }
+    cache_uso[i] = ++cache_turno;
+    return 1;
+}
+
+void cache_agregar(const char *cedula) {
+    unsigned long ahora;
+    unsigned char cuarto;
+    uint8_t destino = 0;
+
+    leer_reloj(&ahora, &cuarto);
+    // Entrada libre, o la usada hace más tiempo
+    for(uint8_t i = 0; i < CACHE_CEDULAS; i++) {
+        if(!(cache_validas & (1 << i))) {
+            destino = i;
+            break;
+        }
+        // Distancia al turno actual: sigue bien cuando el contador da la vuelta
+        if((unsigned int)(cache_turno - cache_uso[i]) > (unsigned int)(cache_turno - cache_uso[destino])) {
+            destino = i;
+        }
+    }
+    for(uint8_t k = 0; k < 8; k++) {
+        cache_cedula[destino][k] = cedula[k];
+    }
+    cache_alta[destino] = ahora;
+    cache_uso[destino] = ++cache_turno;
+    cache_validas |= (1 << destino);
+}
+
+void cache_quitar(const char *cedula) {
+    uint8_t i = cache_indice(cedula);
+    if(i != SLOT_NINGUNO) {
+        cache_validas &= ~(1 << i);
+    }
+}
+
+#define LINEA_INICIO        0
+#define LINEA_RESPUESTA     1   // "S/N..." que puede ser la respuesta
+#define LINEA_APARTADA      2   // Otra línea: se guarda para el bucle principal
+#define LINEA_DESCARTADA    3
+
+uint8_t consultar_pi(const char *cedula) {
+    char respuesta = 0;
+    uint8_t coinciden = 0;
+    uint8_t linea = LINEA_INICIO;
+    uint8_t inicio_apartada = 0;
+
+    // Lo ya leído de lo apartado no se vuelve a leer: se corre al principio
+    uint8_t quedan = rx_aparte_cantidad - rx_aparte_leidos;
+    for(uint8_t i = 0; i < quedan; i++) {
+        rx_aparte[i] = rx_aparte[rx_aparte_leidos + i];
+    }
+    rx_aparte_cantidad = quedan;
+    rx_aparte_leidos = 0;
+
+    uart_write('Q');
+    for(uint8_t k = 0; k < 8; k++) {
+        uart_write(cedula[k]);
+    }
+    uart_write_string("\r\n");
+
+    // Cada vuelta sin dato espera 100 us; con dato, el próximo tarda ~1 ms
+    // en llegar a 9600 baudios: la espera total queda acotada
+    for(unsigned int vuelta = 0; vuelta < CONSULTA_TIMEOUT_MS * 10; vuelta++) {
+        if(!hal_uart_rx_listo()) {
+            hal_delay_us(100);
+            continue;
+        }
+        char c = hal_uart_rx();
+        uint8_t fin = (c == '\r' || c == '\n');
+
+        if(linea == LINEA_INICIO) {
+            if(fin) {
+                continue;
+            }
+            if(c == 'S' || c == 'N') {
+                respuesta = c;
+                coinciden = 0;
+                linea = LINEA_RESPUESTA;
+                continue;
+            }
+            linea = LINEA_APARTADA;
+            inicio_apartada = rx_aparte_cantidad;
+        }
+
+        if(linea == LINEA_RESPUESTA) {
+            if(coinciden < 8 && c == cedula[coinciden]) {
+                coinciden++;
+            } else if(coinciden == 8 && fin) {
+                return respuesta == 'S' ? CONSULTA_SI : CONSULTA_NO;
+            } else {
+                // Respuesta de otra consulta: ya se decidió, se descarta
+                linea = fin ? LINEA_INICIO : LINEA_DESCARTADA;
+            }
+        } else if(linea == LINEA_APARTADA) {
+            if(rx_aparte_cantidad < RX_APARTE) {
+                rx_aparte[rx_aparte_cantidad++] = c;
+                if(fin) {
+                    linea = LINEA_INICIO;
+                }
+            } else {
+                rx_aparte_cantidad = inicio_apartada;
+                linea = fin ? LINEA_INICIO : LINEA_DESCARTADA;
+            }
+        } else if(fin) {
+            linea = LINEA_INICIO;
+        }
+    }
+
+    // Venció el plazo a mitad de una línea: una respuesta tardía o una línea
+    // que no entró se descartan; una apartada sigue llegando por la UART
+    if(linea == LINEA_RESPUESTA || linea == LINEA_DESCARTADA) {
+        descartar_linea = 1;
+    }
+    return CONSULTA_SIN_RESPUESTA;
+}
+
+uint8_t autorizar(const char *cedula) {
+    if(comparar_con_cedulas(cedula) || cache_buscar(cedula)) {
+        return 1;
+    }
+    if(consultar_pi(cedula) == CONSULTA_SI) {
+        cache_agregar(cedula);
+        return 1;
+    }
+    return 0;   // 'N' o sin respuesta: decisión local
+}
+
+void controlar_leds(uint8_t autorizado) {
+    if(autorizado) {
+        hal_led_verde(1);   // Encender LED verde
+        hal_delay_ms(500);
+        hal_led_verde(0);   // Apagar LED verde
+    } else {
+        hal_led_rojo(1);    // Encender LED rojo
+        hal_delay_ms(500);
+        hal_led_rojo(0);    // Apagar LED rojo
+    }
+}
+
+
+void main(void) {
+    char codigo_leido[20];  // Buffer para almacenar el código leído
+    uint8_t index = 0;      // Índice del buffer
+    char caracter = 0;      // Carácter leído
+    unsigned char tipoOperacion = 0;
+    uint8_t autorizado = 0;
+    
+    inicializar_cedulas();
+    int flag_alta = 0;
+    int flag_baja = 0;
+    
+    hal_leds_iniciar();     // LEDs como salidas, apagados
+    hal_uart_iniciar();     // Inicializar UART
+    hal_timer_iniciar();    // Inicializar Timer1 (base de tiempo)
+   
+    /*if(cedulas_registradas == 0){  
+        cargar_cedula("49432642");
+        cargar_cedula("55787807");
+        cargar_cedula("50329945");
+        cargar_cedula("49852969");
+        cargar_cedula("49374418");
+    }*/
+   
+    while(1) {
+        // Lanzar la siguiente escritura pendiente de EEPROM, si la hay
+        eeprom_tarea();
+
+        // Verificar condiciones para enviar eventos
+        verificar_envio_eventos();
+        caracter = leer_codigo_barras();
+       
+        if(caracter != 0) {
+            if(descartar_linea){
+                if(caracter == '\r' || caracter == '\n'){
+                    descartar_linea = 0;
+                }
+                continue;
+            }
+            else if((caracter == 'S' || caracter == 'N') && index == 0){
+                // "S/N<cedula>" tras vencer CONSULTA_TIMEOUT_MS: ya se decidió
+                descartar_linea = 1;
+                continue;
+            }
+            else if(caracter == 'A'){
+                flag_alta = 1;
+                continue;
+            }
+            else if(caracter == 'B'){
+                flag_baja = 1;
+                continue;
+            }
+            else if(caracter == 'T'){
+                // Sincronización: la Pi pide el reloj y mide el offset
+                enviar_reloj();
+                continue;
+            }
+            else if((caracter == '\r' || caracter == '\n') && index == 0){
+                // Línea vacía ("\r\n" o el fin de "T\n"): no es una lectura
+                continue;
+            }
+            
+            if (flag_alta == 1 && index == 8){
+                uint8_t darAlta = comparar_con_cedulas(codigo_leido);
+                tipoOperacion = 1;
+                flag_alta = 0;
+                // Si no está registrada y hay lugar, damos de alta la cedula
+                if(!darAlta && cargar_cedula(codigo_leido)){
+                    autorizado = 1;
+                }
+                else{
+                    autorizado = 0;
+                }
+            }
+            
+            if (flag_baja == 1 && index == 8){
+                uint8_t slot = buscar_slot(codigo_leido);
+                tipoOperacion = 2;
+                flag_baja = 0;
+                cache_quitar(codigo_leido);
+                if(slot != SLOT_NINGUNO){
+                    borrar_slot(slot);
+                    autorizado = 1;
+                } else {
+                    // Si entra aca, esta cedula no se puede dar de baja
+                    autorizado = 0;
+                }
+            }
+            
+            if((caracter == '\r' || caracter == '\n') && (flag_alta == 0 && flag_baja == 0)){            
+                codigo_leido[index] = '\0';
+
+                // Verificar si es exactamente 8 caracteres
+                if(index == 8) {
+                    if (tipoOperacion != 1 && tipoOperacion != 2){
+                        tipoOperacion = 0;
+                        autorizado = autorizar(codigo_leido);
+                    }
+                    
+                    // Agregar evento al buffer
+                    agregar_evento(codigo_leido, autorizado, tipoOperacion);
+                    
+                    // Reset de tipo de operacion
+                    tipoOperacion = 0;
+                    controlar_leds(autorizado);  // Controlar LEDs según resultado
+                    
+                } else {
+                    codigo_leido[7]='@';
+                    // Agregar evento al buffer (incluso si falla)
+                    agregar_evento(codigo_leido, 0, tipoOperacion);
+                    
+                    // Reset de tipo de operacion
+                    tipoOperacion = 0;
+                    controlar_leds(0);  // Longitud incorrecta = No autorizado
+                }
+                index = 0;                  
+                caracter = 0;
+               
+            } else if(index <= 8) {
+                codigo_leido[index] = caracter;  // Almacenar carácter en buffer
+                index++;
+            }
+        }
+    }
+}
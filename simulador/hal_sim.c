@@ -0,0 +1,362 @@
+// HAL simulado del PIC16F876A: EEPROM, UART y Timer1/CCP1 sobre un reloj de
+// ciclos de instrucción. Los costos por acceso son estimaciones de lo que
+// genera XC8 (cambios de banco incluidos), no una emulación del núcleo.
+
+#define _POSIX_C_SOURCE 200809L
+#include <errno.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+
+#include "hal_sim.h"
+
+// Costo en ciclos de cada primitiva
+#define COSTO_SONDEO        3       // btfss + goto
+#define COSTO_REGISTRO      4
+#define COSTO_EE_LEER       8       // EEADR, EEPGD, RD, EEDATA
+#define COSTO_EE_ESCRIBIR   14      // secuencia 0x55/0xAA/WR con GIE apagado
+#define COSTO_ISR           30      // contexto + handler
+#define COSTO_LLAMADA       8       // call/return + paso de parámetros
+
+#define RX_PENDIENTES       4096    // Lo que llegó por el fd y todavía "viaja" por el cable
+#define RX_FIFO             2       // FIFO de hardware del USART
+
+SimContadores sim;
+uint8_t sim_eeprom[256];
+unsigned long sim_desgaste[256];
+
+static int tiempo_real = 0;
+static struct timespec inicio_real;
+static int en_isr = 0;
+
+static int timer_activo = 0;
+static int tick_habilitado = 0;
+static uint8_t tick_bandera = 0;
+static uint64_t proximo_tick;
+
+static int ee_ocupada = 0;
+static uint64_t ee_fin;
+static uint8_t ee_dir, ee_dato;
+static int ee_fd = -1;
+
+static int fd_uart = -1;
+static int fd_inyeccion = -1;
+static uint64_t tx_fin = 0;
+static uint8_t rx_pendientes[RX_PENDIENTES];
+static unsigned int rx_inicio = 0, rx_cantidad = 0;
+static uint64_t rx_proximo = 0;
+static uint64_t rx_ultima_lectura_fd = 0;
+static char rx_fifo[RX_FIFO];
+static uint8_t rx_fifo_cantidad = 0;
+static uint8_t rx_oerr = 0;
+
+static void avanzar(uint64_t ciclos);
+
+// ---------- reloj real ----------
+
+static double segundos_reales(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return (t.tv_sec - inicio_real.tv_sec) + (t.tv_nsec - inicio_real.tv_nsec) / 1e9;
+}
+
+static void sincronizar_real(void) {
+    double virtual_s = (double)sim.ciclos / SIM_CICLOS_POR_SEGUNDO;
+    double real_s = segundos_reales();
+
+    if (virtual_s > real_s + 0.001) {
+        // El firmware va adelantado: dormir hasta que la máquina lo alcance
+        double espera = virtual_s - real_s;
+        struct timespec t = { (time_t)espera, (long)((espera - (time_t)espera) * 1e9) };
+        nanosleep(&t, NULL);
+    } else if (real_s > virtual_s + 0.05) {
+        // El host se atrasó (p. ej. sin CPU): se salta el tiempo perdido
+        avanzar((uint64_t)((real_s - virtual_s) * SIM_CICLOS_POR_SEGUNDO));
+    }
+}
+
+// ---------- UART: entrada desde los fd ----------
+
+static void leer_fd(int *fd) {
+    uint8_t buffer[256];
+    if (*fd < 0 || rx_cantidad == RX_PENDIENTES) {
+        return;
+    }
+    ssize_t n = read(*fd, buffer, sizeof(buffer) < RX_PENDIENTES - rx_cantidad ? sizeof(buffer) : RX_PENDIENTES - rx_cantidad);
+    if (n == 0 && *fd != fd_uart) {
+        *fd = -1;      // EOF de la inyección (el pty no da EOF: el simulador tiene el esclavo abierto)
+        return;
+    }
+    for (ssize_t i = 0; i < n; i++) {
+        if (rx_cantidad == 0) {
+            rx_proximo = sim.ciclos + SIM_CICLOS_CARACTER;
+        }
+        rx_pendientes[(rx_inicio + rx_cantidad) % RX_PENDIENTES] = buffer[i];
+        rx_cantidad++;
+    }
+}
+
+static void atender_rx(void) {
+    // Un carácter termina de llegar cada SIM_CICLOS_CARACTER; si la FIFO de
+    // hardware está llena se pierde y queda OERR, como en el USART real
+    while (rx_cantidad > 0 && sim.ciclos >= rx_proximo) {
+        uint8_t c = rx_pendientes[rx_inicio];
+        rx_inicio = (rx_inicio + 1) % RX_PENDIENTES;
+        rx_cantidad--;
+        rx_proximo += SIM_CICLOS_CARACTER;
+
+        if (rx_oerr || rx_fifo_cantidad == RX_FIFO) {
+            if (!rx_oerr) {
+                fprintf(stderr, "simulador: desborde de RX (OERR) en %.3f s\n",
+                        (double)sim.ciclos / SIM_CICLOS_POR_SEGUNDO);
+            }
+            rx_oerr = 1;
+            sim.rx_desbordes++;
+            continue;
+        }
+        rx_fifo[rx_fifo_cantidad++] = (char)c;
+        sim.rx_bytes++;
+    }
+}
+
+static void sondear_entradas(void) {
+    // Antes de un carácter de tiempo no puede haber llegado nada nuevo
+    if (sim.ciclos - rx_ultima_lectura_fd < SIM_CICLOS_CARACTER && rx_ultima_lectura_fd != 0) {
+        return;
+    }
+    rx_ultima_lectura_fd = sim.ciclos ? sim.ciclos : 1;
+    leer_fd(&fd_uart);
+    leer_fd(&fd_inyeccion);
+    atender_rx();
+}
+
+// ---------- avance del tiempo ----------
+
+static void avanzar(uint64_t ciclos) {
+    sim.ciclos += ciclos;
+
+    if (ee_ocupada && sim.ciclos >= ee_fin) {
+        ee_ocupada = 0;
+        sim_eeprom[ee_dir] = ee_dato;
+        sim_desgaste[ee_dir]++;
+        if (ee_fd >= 0 && pwrite(ee_fd, &ee_dato, 1, ee_dir) != 1) {
+            perror("simulador: guardando EEPROM");
+        }
+    }
+
+    while (timer_activo && sim.ciclos >= proximo_tick) {
+        proximo_tick += SIM_CICLOS_TICK;
+        tick_bandera = 1;
+        sim.ticks++;
+        if (tick_habilitado && !en_isr) {
+            en_isr = 1;
+            sim.ciclos += COSTO_ISR;
+            isr();
+            en_isr = 0;
+        }
+    }
+
+    if (rx_cantidad > 0) {
+        atender_rx();
+    }
+    if (tiempo_real && !en_isr) {
+        sincronizar_real();
+    }
+}
+
+// Llamadas a funciones del firmware (main.c se compila con -finstrument-functions)
+void __cyg_profile_func_enter(void *funcion, void *llamador) __attribute__((no_instrument_function));
+void __cyg_profile_func_exit(void *funcion, void *llamador) __attribute__((no_instrument_function));
+
+void __cyg_profile_func_enter(void *funcion, void *llamador) {
+    (void)funcion;
+    (void)llamador;
+    sim.llamadas++;
+    sim.ciclos += COSTO_LLAMADA;
+}
+
+void __cyg_profile_func_exit(void *funcion, void *llamador) {
+    (void)funcion;
+    (void)llamador;
+}
+
+// ---------- API de control ----------
+
+void sim_iniciar(int modo_tiempo_real) {
+    memset(&sim, 0, sizeof(sim));
+    memset(sim_eeprom, 0xFF, sizeof(sim_eeprom));
+    memset(sim_desgaste, 0, sizeof(sim_desgaste));
+    tiempo_real = modo_tiempo_real;
+    clock_gettime(CLOCK_MONOTONIC, &inicio_real);
+}
+
+void sim_conectar_uart(int fd, int fd_entrada) {
+    fd_uart = fd;
+    fd_inyeccion = fd_entrada;
+    if (fd_uart >= 0) {
+        fcntl(fd_uart, F_SETFL, fcntl(fd_uart, F_GETFL) | O_NONBLOCK);
+    }
+    if (fd_inyeccion >= 0) {
+        fcntl(fd_inyeccion, F_SETFL, fcntl(fd_inyeccion, F_GETFL) | O_NONBLOCK);
+    }
+}
+
+int sim_eeprom_archivo(const char *ruta) {
+    ee_fd = open(ruta, O_RDWR | O_CREAT, 0644);
+    if (ee_fd < 0) {
+        return -1;
+    }
+    ssize_t n = pread(ee_fd, sim_eeprom, sizeof(sim_eeprom), 0);
+    if (n < (ssize_t)sizeof(sim_eeprom)) {
+        // Archivo nuevo o corto: el resto queda borrado (0xFF) y se completa
+        memset(sim_eeprom + (n > 0 ? n : 0), 0xFF, sizeof(sim_eeprom) - (n > 0 ? n : 0));
+        if (pwrite(ee_fd, sim_eeprom, sizeof(sim_eeprom), 0) != (ssize_t)sizeof(sim_eeprom)) {
+            return -1;
+        }
+    }
+    return 0;
+}
+
+// ---------- Timer1 / CCP1 ----------
+
+uint8_t hal_tick_pendiente(void) {
+    return tick_bandera;
+}
+
+void hal_tick_limpiar(void) {
+    tick_bandera = 0;
+}
+
+void hal_reloj_bloquear(void) {
+    tick_habilitado = 0;
+    avanzar(COSTO_REGISTRO);
+}
+
+void hal_reloj_liberar(void) {
+    tick_habilitado = 1;
+    if (tick_bandera && !en_isr) {
+        // Interrupción que quedó pendiente mientras estaba enmascarada
+        en_isr = 1;
+        sim.ciclos += COSTO_ISR;
+        isr();
+        en_isr = 0;
+    }
+    avanzar(COSTO_REGISTRO);
+}
+
+void hal_timer_iniciar(void) {
+    timer_activo = 1;
+    tick_habilitado = 1;
+    tick_bandera = 0;
+    proximo_tick = sim.ciclos + SIM_CICLOS_TICK;
+    avanzar(13 * COSTO_REGISTRO);
+}
+
+// ---------- UART ----------
+
+void hal_uart_iniciar(void) {
+    avanzar(8 * COSTO_REGISTRO);
+}
+
+uint8_t hal_uart_tx_libre(void) {
+    avanzar(COSTO_SONDEO);
+    // TXREG está libre si en el registro de desplazamiento queda a lo sumo un carácter
+    return tx_fin <= sim.ciclos + SIM_CICLOS_CARACTER;
+}
+
+void hal_uart_tx(char c) {
+    tx_fin = (tx_fin > sim.ciclos ? tx_fin : sim.ciclos) + SIM_CICLOS_CARACTER;
+    sim.tx_bytes++;
+    if (fd_uart >= 0) {
+        // Sin lector del otro lado el pty se llena: el carácter se pierde, como en el cable
+        ssize_t n = write(fd_uart, &c, 1);
+        (void)n;
+    }
+    avanzar(COSTO_REGISTRO);
+}
+
+uint8_t hal_uart_rx_listo(void) {
+    sondear_entradas();
+    avanzar(COSTO_SONDEO);
+    return rx_fifo_cantidad > 0;
+}
+
+char hal_uart_rx(void) {
+    char c = 0;
+    if (rx_fifo_cantidad > 0) {
+        c = rx_fifo[0];
+        rx_fifo[0] = rx_fifo[1];
+        rx_fifo_cantidad--;
+    }
+    avanzar(COSTO_REGISTRO);
+    return c;
+}
+
+uint8_t hal_uart_rx_desborde(void) {
+    avanzar(COSTO_SONDEO);
+    return rx_oerr;
+}
+
+void hal_uart_rx_reiniciar(void) {
+    rx_oerr = 0;
+    avanzar(2 * COSTO_REGISTRO);
+}
+
+// ---------- EEPROM ----------
+
+uint8_t hal_ee_leer(uint8_t addr) {
+    sim.ee_lecturas++;
+    avanzar(COSTO_EE_LEER);
+    return sim_eeprom[addr];
+}
+
+void hal_ee_escribir(uint8_t addr, uint8_t data) {
+    if (ee_ocupada) {
+        fprintf(stderr, "simulador: escritura EEPROM con WR en curso (dir %u)\n", addr);
+    }
+    ee_ocupada = 1;
+    ee_dir = addr;
+    ee_dato = data;
+    sim.ee_escrituras++;
+    ee_fin = sim.ciclos + COSTO_EE_ESCRIBIR + SIM_CICLOS_EE_ESCRITURA;
+    avanzar(COSTO_EE_ESCRIBIR);
+}
+
+uint8_t hal_ee_ocupada(void) {
+    avanzar(COSTO_SONDEO);
+    return ee_ocupada;
+}
+
+void hal_ee_fin_escritura(void) {
+    avanzar(COSTO_REGISTRO);
+}
+
+// ---------- LEDs y demoras ----------
+
+void hal_leds_iniciar(void) {
+    avanzar(4 * COSTO_REGISTRO);
+}
+
+void hal_led_verde(uint8_t v) {
+    (void)v;
+    avanzar(COSTO_REGISTRO);
+}
+
+void hal_led_rojo(uint8_t v) {
+    (void)v;
+    avanzar(COSTO_REGISTRO);
+}
+
+void hal_delay_ms(unsigned int ms) {
+    // De a 1 ms, así la RX sigue llegando (y desbordando) durante la espera
+    for (unsigned int i = 0; i < ms; i++) {
+        sondear_entradas();
+        avanzar(SIM_CICLOS_POR_SEGUNDO / 1000);
+    }
+}
+
+void hal_delay_us(unsigned int us) {
+    avanzar((uint64_t)us * SIM_CICLOS_POR_SEGUNDO / 1000000);
+}
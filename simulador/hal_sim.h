@@ -0,0 +1,41 @@
+#ifndef HAL_SIM_H
+#define HAL_SIM_H
+
+// HAL del simulador: las mismas primitivas que hal_pic.h, como funciones
+// (hal_sim.c) que cobran ciclos sobre el reloj simulado.
+
+#include <stdint.h>
+#include "sim.h"
+
+// El firmware corre como una función más; main() es del simulador
+#define main firmware_main
+
+#define HAL_ISR()   void isr(void)
+
+uint8_t hal_tick_pendiente(void);
+void hal_tick_limpiar(void);
+void hal_reloj_bloquear(void);
+void hal_reloj_liberar(void);
+void hal_timer_iniciar(void);
+
+void hal_uart_iniciar(void);
+uint8_t hal_uart_tx_libre(void);
+void hal_uart_tx(char c);
+uint8_t hal_uart_rx_listo(void);
+char hal_uart_rx(void);
+uint8_t hal_uart_rx_desborde(void);
+void hal_uart_rx_reiniciar(void);
+
+uint8_t hal_ee_leer(uint8_t addr);
+void hal_ee_escribir(uint8_t addr, uint8_t data);
+uint8_t hal_ee_ocupada(void);
+void hal_ee_fin_escritura(void);
+
+void hal_leds_iniciar(void);
+void hal_led_verde(uint8_t v);
+void hal_led_rojo(uint8_t v);
+
+void hal_delay_ms(unsigned int ms);
+void hal_delay_us(unsigned int us);
+
+#endif
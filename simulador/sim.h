@@ -0,0 +1,56 @@
+#ifndef SIM_H
+#define SIM_H
+
+// ===============================
+// SIMULADOR DEL FIRMWARE: API DE CONTROL
+// ===============================
+// El tiempo es un contador de ciclos de instrucción (Fosc/4 = 2 MHz). Cada
+// primitiva del HAL cobra su costo estimado y los periféricos (fin de
+// escritura EEPROM, caracteres de la UART, interrupción del Timer1) ocurren
+// cuando el contador llega a su momento.
+
+#include <stdint.h>
+
+#define SIM_CICLOS_POR_SEGUNDO  2000000UL   // 8 MHz / 4
+#define SIM_CICLOS_CARACTER     2083        // 10 bits a 9600 baudios
+#define SIM_CICLOS_TICK         500000      // CCP1 cada 250 ms
+#define SIM_CICLOS_EE_ESCRITURA 8000        // ~4 ms (típico de la hoja de datos)
+
+typedef struct {
+    uint64_t ciclos;
+    unsigned long llamadas;         // Funciones del firmware (-finstrument-functions)
+    unsigned long ee_lecturas;
+    unsigned long ee_escrituras;
+    unsigned long tx_bytes;
+    unsigned long rx_bytes;
+    unsigned long rx_desbordes;     // Caracteres perdidos por OERR
+    unsigned long ticks;
+} SimContadores;
+
+extern SimContadores sim;
+extern uint8_t sim_eeprom[256];
+extern unsigned long sim_desgaste[256];     // Escrituras por celda
+
+// tiempo_real: el contador de ciclos se frena para ir a la par del reloj de
+// la máquina (modo pty). Sin él corre lo más rápido posible (perfil).
+void sim_iniciar(int tiempo_real);
+// UART: fd bidireccional (maestro del pty) y, opcional, otro fd solo de
+// entrada que se suma a la misma RX (lecturas del código de barras)
+void sim_conectar_uart(int fd, int fd_inyeccion);
+// Carga la EEPROM del archivo (si existe) y guarda ahí cada escritura
+int sim_eeprom_archivo(const char *ruta);
+
+// Funciones del firmware que usa el simulador
+void firmware_main(void);
+void isr(void);
+void inicializar_cedulas(void);
+uint8_t comparar_con_cedulas(const char *codigo_leido);
+uint8_t buscar_slot(const char *codigo_leido);
+uint8_t cargar_cedula(const char *cedula);
+void borrar_slot(uint8_t slot);
+void eeprom_vaciar_cola(void);
+void agregar_evento(const char *cedula, unsigned char autorizado, unsigned char tipoOperacion);
+void enviar_eventos_pendientes(void);
+uint8_t autorizar(const char *cedula);
+
+#endif
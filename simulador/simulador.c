@@ -0,0 +1,202 @@
+// Simulador del firmware (main.c compilado con gcc contra hal_sim.c).
+//
+//   simulador --pty [--eeprom archivo]
+//       Corre firmware_main() en tiempo real detrás de un pty e imprime
+//       "pty=<ruta>" en la primera línea: pic_communicator.py lo abre como si
+//       fuera el puerto del PIC (PIC_BACKEND=firmware lo hace solo). Lo que
+//       entra por stdin se suma a la RX como lecturas del código de barras.
+//
+//   simulador --perfil
+//       Ciclos de instrucción estimados por operación: búsqueda, alta, baja
+//       y vaciado (eventos a la UART y cola de la EEPROM).
+
+#define _XOPEN_SOURCE 600
+#define _DEFAULT_SOURCE
+#include <fcntl.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <termios.h>
+#include <unistd.h>
+
+#include "sim.h"
+
+// ===============================
+// MODO PTY
+// ===============================
+
+static int correr_pty(const char *eeprom) {
+    int maestro = posix_openpt(O_RDWR | O_NOCTTY);
+    if (maestro < 0 || grantpt(maestro) < 0 || unlockpt(maestro) < 0) {
+        perror("simulador: pty");
+        return 1;
+    }
+    const char *ruta = ptsname(maestro);
+
+    // El esclavo queda abierto: si la Pi cierra y reabre el puerto, el
+    // maestro no da EIO y lo que el PIC transmite sin nadie escuchando se pierde
+    int esclavo = open(ruta, O_RDWR | O_NOCTTY);
+    struct termios modo;
+    if (esclavo < 0 || tcgetattr(esclavo, &modo) < 0) {
+        perror("simulador: pty");
+        return 1;
+    }
+    cfmakeraw(&modo);
+    cfsetispeed(&modo, B9600);
+    cfsetospeed(&modo, B9600);
+    tcsetattr(esclavo, TCSANOW, &modo);
+
+    sim_iniciar(1);
+    if (eeprom && sim_eeprom_archivo(eeprom) < 0) {
+        perror("simulador: EEPROM");
+        return 1;
+    }
+    sim_conectar_uart(maestro, STDIN_FILENO);
+
+    printf("pty=%s\n", ruta);
+    fflush(stdout);
+
+    firmware_main();    // No vuelve
+    return 0;
+}
+
+// ===============================
+// MODO PERFIL
+// ===============================
+
+static SimContadores antes;
+
+static void medir(const char *operacion) {
+    uint64_t ciclos = sim.ciclos - antes.ciclos;
+    printf("%-38s %10llu %10.1f %6lu %6lu %6lu %6lu\n", operacion,
+           (unsigned long long)ciclos, ciclos * 1e6 / SIM_CICLOS_POR_SEGUNDO,
+           sim.llamadas - antes.llamadas, sim.ee_lecturas - antes.ee_lecturas,
+           sim.ee_escrituras - antes.ee_escrituras, sim.tx_bytes - antes.tx_bytes);
+    antes = sim;
+}
+
+static void cedula(char *destino, unsigned int numero) {
+    snprintf(destino, 9, "%08u", numero);
+}
+
+static int correr_perfil(void) {
+    char ced[9];
+
+    sim_iniciar(0);
+    sim_conectar_uart(-1, -1);
+
+    printf("Ciclos de instrucción estimados (Fosc/4 = 2 MHz): E/S simulada + costo fijo por\n"
+           "acceso a registro y por llamada; el cómputo entre accesos no se cuenta.\n\n");
+    printf("%-38s %10s %10s %6s %6s %6s %6s\n", "operación", "ciclos", "µs", "llam.", "lectEE",
+           "escEE", "TX");
+
+    antes = sim;
+    inicializar_cedulas();
+    medir("arranque (EEPROM virgen)");
+
+    for (unsigned int i = 1; i <= 5; i++) {
+        cedula(ced, 10000000 + i);
+        cargar_cedula(ced);
+        if (i == 1) {
+            medir("alta (encolada)");
+        }
+    }
+    antes = sim;
+    eeprom_vaciar_cola();
+    medir("vaciado de la cola EEPROM tras 5 altas");
+
+    cedula(ced, 10000001);
+    comparar_con_cedulas(ced);
+    medir("búsqueda: acierto (primera)");
+    cedula(ced, 10000005);
+    comparar_con_cedulas(ced);
+    medir("búsqueda: acierto (última)");
+    cedula(ced, 99999999);
+    comparar_con_cedulas(ced);
+    medir("búsqueda: fallo (tabla llena)");
+
+    cedula(ced, 10000003);
+    borrar_slot(buscar_slot(ced));
+    medir("baja (búsqueda + tombstone)");
+    eeprom_vaciar_cola();
+    medir("vaciado de la cola EEPROM tras la baja");
+
+    cedula(ced, 20000000);
+    cargar_cedula(ced);
+    eeprom_vaciar_cola();
+    medir("alta sobre el anillo + vaciado");
+
+    cedula(ced, 99999999);
+    autorizar(ced);
+    medir("autorizar: consulta a la Pi sin respuesta");
+
+    for (unsigned int i = 0; i < 5; i++) {
+        cedula(ced, 10000001 + i);
+        agregar_evento(ced, 1, 0);
+    }
+    medir("5 eventos al buffer");
+    enviar_eventos_pendientes();
+    medir("vaciado de eventos a la UART (5)");
+
+    // Ciclo de vida de la tabla: se vacía y se dan de alta y baja 5 cédulas
+    static const unsigned int registradas[] = { 10000001, 10000002, 10000004, 10000005, 20000000 };
+    for (unsigned int i = 0; i < 5; i++) {
+        cedula(ced, registradas[i]);
+        borrar_slot(buscar_slot(ced));
+    }
+    eeprom_vaciar_cola();
+    unsigned long escrituras_antes = sim.ee_escrituras;
+    unsigned long max_desgaste = 0;
+    memset(sim_desgaste, 0, sizeof(sim_desgaste));
+    for (unsigned int ronda = 0; ronda < 200; ronda++) {
+        for (unsigned int i = 0; i < 5; i++) {
+            cedula(ced, 30000000 + i);
+            cargar_cedula(ced);
+        }
+        for (unsigned int i = 0; i < 5; i++) {
+            cedula(ced, 30000000 + i);
+            uint8_t slot = buscar_slot(ced);
+            if (slot != 255) {
+                borrar_slot(slot);
+            }
+        }
+    }
+    eeprom_vaciar_cola();
+    for (unsigned int i = 0; i < 256; i++) {
+        if (sim_desgaste[i] > max_desgaste) {
+            max_desgaste = sim_desgaste[i];
+        }
+    }
+    printf("\n1000 altas + 1000 bajas: %lu escrituras EEPROM, celda más gastada %lu\n",
+           sim.ee_escrituras - escrituras_antes, max_desgaste);
+    return 0;
+}
+
+int main(int argc, char **argv) {
+    const char *eeprom = NULL;
+    int pty = 0, perfil = 0;
+
+    for (int i = 1; i < argc; i++) {
+        if (strcmp(argv[i], "--pty") == 0) {
+            pty = 1;
+        } else if (strcmp(argv[i], "--perfil") == 0) {
+            perfil = 1;
+        } else if (strcmp(argv[i], "--eeprom") == 0 && i + 1 < argc) {
+            eeprom = argv[++i];
+        } else {
+            fprintf(stderr, "uso: %s --pty [--eeprom archivo] | --perfil\n", argv[0]);
+            return 2;
+        }
+    }
+    signal(SIGPIPE, SIG_IGN);
+
+    if (perfil) {
+        return correr_perfil();
+    }
+    if (pty) {
+        return correr_pty(eeprom);
+    }
+    fprintf(stderr, "uso: %s --pty [--eeprom archivo] | --perfil\n", argv[0]);
+    return 2;
+}